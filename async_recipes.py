@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Async versions of the stable_wifi_mqtt.py and aws_with_certs.py flows.
+
+Every port given on the command line is driven from the same event loop, so a
+hub of boards is brought up concurrently by one process.
+
+Usage:
+    python3 async_recipes.py wifi-mqtt --port /dev/ttyUSB0 --port /dev/ttyUSB1
+    python3 async_recipes.py aws --port /dev/ttyUSB0
+
+Requirements:
+    pip install pyserial
+"""
+
+import argparse
+import asyncio
+import time
+
+from at_async import AsyncATClient
+from at_transport import ATError, DEFAULT_BAUD, DEFAULT_PORT
+from bringup import AWS_CLIENT_ID, AWS_ENDPOINT, AWS_TOPIC, WIFI_PASSWORD, WIFI_SSID
+
+PUBLIC_BROKER = 'test.mosquitto.org'
+
+
+async def reset(at, timeout=10):
+    """AT+RST and wait for the boot 'ready' line."""
+    await at.cmd('AT+RST', timeout=timeout, until='ready', check=True)
+    await at.cmd('AT', check=True)
+
+
+async def join_wifi(at, ssid=WIFI_SSID, password=WIFI_PASSWORD):
+    await at.cmd('AT+CWMODE=1', check=True)
+    await at.cmd(f'AT+CWJAP="{ssid}","{password}"', timeout=15, check=True)
+    return await at.cmd('AT+CIPSTA?', check=True)
+
+
+async def stable_wifi_mqtt(at, client_id='esp32c5_fov', topic='fov/test',
+                           message='hello_from_c5'):
+    """Recipe for stable_wifi_mqtt.py: reset, join, plain MQTT pub/sub."""
+    await reset(at)
+    await join_wifi(at)
+    await at.cmd(f'AT+CIPDOMAIN="{PUBLIC_BROKER}"', timeout=5, check=True)
+    await at.cmd(f'AT+MQTTUSERCFG=0,1,"{client_id}","","",0,0,""', check=True)
+    await at.cmd(f'AT+MQTTCONN=0,"{PUBLIC_BROKER}",1883,0', timeout=10, check=True)
+    await at.cmd(f'AT+MQTTSUB=0,"{topic}",0', timeout=3, check=True)
+    await at.cmd(f'AT+MQTTPUB=0,"{topic}","{message}",0,0', timeout=3, check=True)
+    received = await at.wait_for('+MQTTSUBRECV', timeout=5)
+    await at.cmd('AT+MQTTCLEAN=0')
+    return received
+
+
+async def aws_iot(at, client_id=AWS_CLIENT_ID, endpoint=AWS_ENDPOINT,
+                  topic=AWS_TOPIC, message='test_from_c5'):
+    """Recipe for aws_with_certs.py: reset, join, SNTP, mutual-TLS MQTT."""
+    await reset(at)
+    await join_wifi(at)
+    # AWS IoT needs valid time for certificate validation
+    await at.cmd('AT+CIPSNTPCFG=1,0,"pool.ntp.org","time.google.com"', timeout=3, check=True)
+    await at.wait_for('+TIME_UPDATED', timeout=10)
+    await at.cmd('AT+CIPSNTPTIME?')
+    # Scheme 5 = MQTT over TLS with client certificate
+    await at.cmd(f'AT+MQTTUSERCFG=0,5,"{client_id}","","",0,0,""', timeout=3, check=True)
+    await at.cmd(f'AT+MQTTSNI=0,"{endpoint}"', check=True)
+    await at.cmd(f'AT+MQTTCONN=0,"{endpoint}",8883,1', timeout=15, check=True)
+    await at.cmd(f'AT+MQTTSUB=0,"{topic}",0', timeout=3, check=True)
+    await at.cmd(f'AT+MQTTPUB=0,"{topic}","{message}",0,0', timeout=3, check=True)
+    return await at.wait_for('+MQTTSUBRECV', timeout=5)
+
+
+RECIPES = {
+    'wifi-mqtt': stable_wifi_mqtt,
+    'aws': aws_iot,
+}
+
+
+async def run_on_port(recipe, port, baud):
+    start = time.monotonic()
+    try:
+        async with await AsyncATClient.open(port, baud) as at:
+            received = await recipe(at)
+        status = f"OK ({received or 'no echo received'})"
+    except ATError as e:
+        status = f"FAILED at {e}"
+    except Exception as e:
+        status = f"FAILED: {e}"
+    print(f"[{port}] {status} in {time.monotonic() - start:.1f}s")
+
+
+async def run_all(recipe, ports, baud):
+    await asyncio.gather(*(run_on_port(recipe, port, baud) for port in ports))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run async AT recipes on one or more boards')
+    parser.add_argument('recipe', choices=sorted(RECIPES))
+    parser.add_argument('--port', '-p', action='append',
+                        help=f'Serial port, repeatable (default: {DEFAULT_PORT})')
+    parser.add_argument('--baud', '-b', type=int, default=DEFAULT_BAUD)
+    args = parser.parse_args()
+    asyncio.run(run_all(RECIPES[args.recipe], args.port or [DEFAULT_PORT], args.baud))
+
+
+if __name__ == "__main__":
+    main()
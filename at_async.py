@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+asyncio AT client for driving many ESP32-C5 boards from one event loop.
+
+The serial port is opened non-blocking and registered with the event loop
+(loop.add_reader), so reads never block and one process can talk to every
+/dev/ttyUSB* on a hub concurrently. Line framing and result-code handling
+match at_transport.ATTransport.
+
+Usage:
+    import asyncio
+    from at_async import AsyncATClient
+
+    async def main():
+        at = await AsyncATClient.open('/dev/ttyUSB0')
+        print((await at.cmd('AT+GMR')).text)
+        async for urc in at.urcs('+MQTTSUBRECV'):
+            print(urc)
+
+    asyncio.run(main())
+
+Requirements:
+    pip install pyserial  (POSIX only: uses the port's file descriptor)
+"""
+
+import asyncio
+import collections
+import time
+
+import serial
+
+from at_transport import (
+    ATError, ATResponse, DEFAULT_BAUD, DEFAULT_PORT, DEFAULT_TIMEOUT,
+    is_error_result, is_final_result, is_urc, read_lines,
+)
+from ring_buffer import LineFramer
+
+
+class AsyncATClient:
+    """AT command client bound to one serial port and one event loop."""
+
+    def __init__(self, ser, name=None):
+        self.ser = ser
+        self.name = name or ser.port
+        self._loop = asyncio.get_running_loop()
+        self._framer = LineFramer()
+        self._current = None
+        self._current_until = None
+        self._current_done = None
+        self._lock = asyncio.Lock()
+        self._subscribers = []
+        self.unsolicited = collections.deque(maxlen=256)
+        self._loop.add_reader(self.ser.fileno(), self._on_readable)
+
+    @classmethod
+    async def open(cls, port=DEFAULT_PORT, baud=DEFAULT_BAUD):
+        """Open port non-blocking. Must be awaited inside a running loop."""
+        return cls(serial.Serial(port, baud, timeout=0))
+
+    def _on_readable(self):
+        try:
+            data = self.ser.read(self.ser.in_waiting or 1)
+        except (serial.SerialException, OSError):
+            self._loop.remove_reader(self.ser.fileno())
+            return
+        if not data:
+            return
+        response = self._current
+        if response is not None and response.first_byte_at is None:
+            response.first_byte_at = time.monotonic()
+        self._framer.feed(data)
+        for line in read_lines(self._framer):
+            self._dispatch(line)
+
+    def _dispatch(self, line):
+        response = self._current
+        urc = is_urc(line)
+        if response is not None and not self._current_done.done():
+            response.lines.append(line)
+            if urc:
+                response.urcs.append(line)
+            until = self._current_until
+            if until:
+                final = any(marker in line for marker in until) or is_error_result(line)
+            else:
+                final = is_final_result(line)
+            if final:
+                response.result = line
+                response.finished_at = time.monotonic()
+                self._current_done.set_result(None)
+        elif not urc:
+            urc = True  # nobody asked for it
+        if urc:
+            self.unsolicited.append(line)
+            for prefix, q in self._subscribers:
+                if prefix is None or line.startswith(prefix):
+                    q.put_nowait(line)
+
+    async def cmd(self, command, timeout=DEFAULT_TIMEOUT, until=None, check=False):
+        """
+        Send AT command and await its final result code.
+
+        Args:
+            command: AT command string (without \\r\\n)
+            timeout: Ceiling in seconds; returns earlier on a final result
+            until: Optional marker (or tuple) to wait for instead, e.g. 'ready'
+            check: Raise ATError on ERROR or timeout
+
+        Returns:
+            ATResponse
+        """
+        if isinstance(until, str):
+            until = (until,)
+        response = ATResponse(command)
+        async with self._lock:
+            self._current_done = self._loop.create_future()
+            self._current_until = until
+            self._current = response
+            response.sent_at = time.monotonic()
+            self.ser.write(f"{command}\r\n".encode())
+            try:
+                await asyncio.wait_for(asyncio.shield(self._current_done), timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._current = None
+                if not self._current_done.done():
+                    self._current_done.cancel()
+            if response.finished_at is None:
+                response.finished_at = time.monotonic()
+        if check and not response.ok:
+            raise ATError(response)
+        return response
+
+    async def wait_for(self, marker, timeout=DEFAULT_TIMEOUT):
+        """Await a URC containing marker. Returns the line or None on timeout."""
+        for line in self.unsolicited:
+            if marker in line:
+                self.unsolicited.remove(line)
+                return line
+        entry = self._subscribe(None)
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                try:
+                    line = await asyncio.wait_for(entry[1].get(), remaining)
+                except asyncio.TimeoutError:
+                    return None
+                if marker in line:
+                    if line in self.unsolicited:
+                        self.unsolicited.remove(line)
+                    return line
+        finally:
+            self._subscribers.remove(entry)
+
+    def _subscribe(self, prefix):
+        entry = (prefix, asyncio.Queue())
+        self._subscribers.append(entry)
+        return entry
+
+    def urcs(self, prefix=None):
+        """Async iterator over URCs (optionally only those starting with prefix)."""
+        return self._iter_urcs(self._subscribe(prefix))
+
+    async def _iter_urcs(self, entry):
+        try:
+            while True:
+                yield await entry[1].get()
+        finally:
+            self._subscribers.remove(entry)
+
+    def close(self):
+        self._loop.remove_reader(self.ser.fileno())
+        self.ser.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
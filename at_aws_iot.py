@@ -4,33 +4,49 @@ Test ESP32-C5 MQTT AT Commands
 This script verifies that MQTT support is enabled in the C5 firmware
 """
 
-import serial
-import time
+from at_engine import ATEngine
+from at_parsers import parse_response
+from boot_ready import wait_until_ready
+from capabilities import discover
 
-def send_at_command(ser, command, wait_time=2):
-    """Send AT command and return response"""
+# MQTT commands whose =? test form must succeed for MQTT to be usable
+MQTT_TESTS = {
+    "AT+MQTTUSERCFG": "MQTT User Configuration",
+    "AT+MQTTCONNCFG": "MQTT Connection Configuration",
+    "AT+MQTTCONN": "MQTT Connection",
+    "AT+MQTTSUB": "MQTT Subscribe",
+    "AT+MQTTPUB": "MQTT Publish",
+    "AT+MQTTCLEAN": "MQTT Clean Session",
+}
+
+def send_at_command(at, command, timeout=2):
+    """Send AT command and return response (timeout is a ceiling)"""
     print(f"\n{'='*60}")
     print(f"Sending: {command}")
     print('='*60)
     
-    ser.write((command + '\r\n').encode())
-    time.sleep(wait_time)
-    
-    response = ser.read_all().decode('utf-8', errors='ignore')
-    print(f"Response:\n{response}")
+    response = at.send(command, timeout=timeout)
+    return check_response(command, response)
+
+def check_response(command, response):
+    """Print response and classify it from its result code and parsed records"""
+    print(f"Response:\n{response.text}")
+    for record in parse_response(response):
+        print(f"   {record}")
     
     # Check for ERROR
-    if "ERROR" in response and command.endswith("?"):
-        print("❌ FAILED - Command not supported!")
-        return False
-    elif "OK" in response or "+" in response:
+    if response.ok:
         print("✅ SUCCESS")
         return True
-    else:
-        print("⚠️ UNKNOWN RESPONSE")
+    elif response.timed_out:
+        print("⚠️ NO RESPONSE")
         return None
-    
-    return response
+    elif command.endswith("?"):
+        print("❌ FAILED - Command not supported!")
+        return False
+    else:
+        print(f"❌ FAILED - {response.result}")
+        return False
 
 def main():
     # Connect to C5
@@ -39,41 +55,44 @@ def main():
     print("="*60)
     
     try:
-        ser = serial.Serial('/dev/ttyUSB0', 115200, timeout=1)
+        engine = ATEngine.open('/dev/ttyUSB0', 115200)
+        at = engine.transport
         print(f"✅ Connected to /dev/ttyUSB0 at 115200 baud")
     except Exception as e:
         print(f"❌ Failed to connect: {e}")
         return
     
-    time.sleep(2)
+    if not wait_until_ready(at, method='none').ok:
+        print("⚠️ No AT response yet")
     
     # Test basic communication
     print("\n\n" + "="*60)
     print("SECTION 1: Basic Communication")
     print("="*60)
     
-    send_at_command(ser, "AT")
-    send_at_command(ser, "AT+GMR")
+    send_at_command(at, "AT")
     
     # Test MQTT commands - THE CRITICAL TEST
     print("\n\n" + "="*60)
     print("SECTION 2: MQTT Command Support (CRITICAL)")
     print("="*60)
     
-    mqtt_tests = {
-        "AT+MQTTUSERCFG": "MQTT User Configuration",
-        "AT+MQTTCONNCFG": "MQTT Connection Configuration",
-        "AT+MQTTCONN": "MQTT Connection",
-        "AT+MQTTSUB": "MQTT Subscribe",
-        "AT+MQTTPUB": "MQTT Publish",
-        "AT+MQTTCLEAN": "MQTT Clean Session",
-    }
+    # The command table is cached per firmware build; only AT+GMR is sent on a hit
+    try:
+        caps = discover(at)
+    except RuntimeError as e:
+        print(f"❌ Capability probe failed: {e}")
+        engine.close()
+        return
+    source = "cache" if caps.cached else "AT+CMD?"
+    print(f"\nFirmware: {caps.firmware} (command table from {source})")
     
     mqtt_working = True
-    for cmd, description in mqtt_tests.items():
-        print(f"\nTesting: {description}")
-        result = send_at_command(ser, f"{cmd}=?", wait_time=2)
-        if result == False:
+    for cmd, description in MQTT_TESTS.items():
+        if caps.supports(cmd, 'test'):
+            print(f"✅ {description}: {cmd}")
+        else:
+            print(f"❌ {description}: {cmd} not supported!")
             mqtt_working = False
     
     # Test SSL/TLS commands
@@ -81,15 +100,15 @@ def main():
     print("SECTION 3: SSL/TLS Support")
     print("="*60)
     
-    send_at_command(ser, "AT+CIPSSLCCONF=?", wait_time=2)
+    print("✅ AT+CIPSSLCCONF supported" if caps.has('ssl') else "❌ AT+CIPSSLCCONF not supported")
     
     # Test WiFi commands
     print("\n\n" + "="*60)
     print("SECTION 4: WiFi Commands")
     print("="*60)
     
-    send_at_command(ser, "AT+CWMODE?")
-    send_at_command(ser, "AT+CWJAP?")
+    send_at_command(at, "AT+CWMODE?")
+    send_at_command(at, "AT+CWJAP?")
     
     # Summary
     print("\n\n" + "="*60)
@@ -111,7 +130,7 @@ def main():
         print("2. Enable AT MQTT command support")
         print("3. Rebuild and reflash")
     
-    ser.close()
+    engine.close()
     print("\n" + "="*60)
     print("Test Complete")
     print("="*60 + "\n")
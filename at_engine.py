@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Pipelined AT command engine.
+
+Commands are queued and handed to a single worker thread that sends the next
+one the moment the previous final result code is seen, so there is no idle
+time between commands. Each submit() returns a concurrent.futures.Future that
+resolves to the ATResponse of that command, including any URCs that arrived
+while it was in flight. URCs are also routed to subscribers by prefix.
+
+ESP-AT only processes one command at a time (it answers "busy p..." to a
+second one), so the pipeline keeps exactly one command on the wire and the
+rest queued on the host.
+
+Usage:
+    from at_engine import ATEngine
+
+    with ATEngine.open('/dev/ttyUSB0') as engine:
+        engine.on_urc('+MQTTSUBRECV', print)
+        futures = [engine.submit(cmd) for cmd in ('AT', 'AT+GMR')]
+        for f in futures:
+            print(f.result().text)
+
+Requirements:
+    pip install pyserial
+"""
+
+import queue
+import threading
+from concurrent.futures import Future
+
+from at_transport import ATError, ATTransport, DEFAULT_BAUD, DEFAULT_PORT, DEFAULT_TIMEOUT
+
+_STOP = object()
+
+
+class ATEngine:
+    """Queue of AT commands executed back to back over one ATTransport."""
+
+    def __init__(self, transport):
+        self.transport = transport
+        self._queue = queue.Queue()
+        self._urc_handlers = []
+        self.transport.add_urc_listener(self._route_urc)
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    @classmethod
+    def open(cls, port=DEFAULT_PORT, baud=DEFAULT_BAUD, timeouts=None):
+        return cls(ATTransport.open(port, baud, timeouts=timeouts))
+
+    def submit(self, cmd, timeout=DEFAULT_TIMEOUT, until=None, check=False):
+        """
+        Queue an AT command.
+
+        Args:
+            cmd: AT command string (without \\r\\n)
+            timeout: Ceiling in seconds once the command is on the wire
+            until: Optional marker to wait for instead of the final result
+            check: If True, the future raises ATError on ERROR or timeout
+                instead of returning the failed ATResponse
+
+        Returns:
+            Future resolving to the ATResponse
+        """
+        return self._enqueue(cmd, None, timeout, until, check)
+
+    def submit_data(self, cmd, data, timeout=DEFAULT_TIMEOUT, until=None, check=False):
+        """
+        Queue a command that takes a raw payload after the '>' prompt.
+
+        Same as submit(), but runs ATTransport.send_data(cmd, data) for
+        AT+MQTTPUBRAW, AT+CIPSEND and friends.
+        """
+        return self._enqueue(cmd, data, timeout, until, check)
+
+    def _enqueue(self, cmd, data, timeout, until, check):
+        future = Future()
+        self._queue.put((cmd, data, timeout, until, check, future))
+        return future
+
+    def run(self, commands, timeout=DEFAULT_TIMEOUT, check=False):
+        """Submit a sequence of commands and return their responses in order."""
+        futures = [self.submit(cmd, timeout=timeout, check=check) for cmd in commands]
+        return [f.result() for f in futures]
+
+    def on_urc(self, prefix, callback):
+        """Call callback(line) for every URC starting with prefix."""
+        self._urc_handlers.append((prefix, callback))
+
+    def _route_urc(self, line):
+        for prefix, callback in self._urc_handlers:
+            if line.startswith(prefix):
+                callback(line)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            cmd, data, timeout, until, check, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if data is None:
+                    response = self.transport.send(cmd, timeout=timeout, until=until)
+                else:
+                    response = self.transport.send_data(cmd, data, timeout=timeout, until=until)
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            if check and not response.ok:
+                future.set_exception(ATError(response))
+            else:
+                future.set_result(response)
+
+    def stop(self):
+        """Finish queued commands and stop the worker, leaving the transport open."""
+        self._queue.put(_STOP)
+        self._worker.join()
+        self.transport.remove_urc_listener(self._route_urc)
+
+    def close(self):
+        """Finish queued commands, then close the transport."""
+        self.stop()
+        self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
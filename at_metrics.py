@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""
+Instrumentation hooks for the AT transport, with pluggable sinks.
+
+ATTransport calls an Instruments object (when one is attached) at five
+points on the hot path, plus around host-side URC waits:
+
+    write       command written to the port
+    first_byte  first byte received after a write
+    line        a complete line was framed
+    final       command finished (final result code or timeout)
+    urc         an unsolicited line was dispatched
+    wait        wait_for() returned (marker, start time, matched line or None)
+
+With no Instruments attached, each of those points costs one attribute
+check. Sinks receive only the events they define methods for:
+
+    Histogram      in-memory latency histograms per command verb (and
+                   firmware), URC and line counters; percentiles and
+                   Prometheus text format
+    MetricsServer  serves a Histogram as Prometheus text on a local HTTP port
+    JSONLTrace     one JSON object per event, for offline analysis
+    chrome_trace.ChromeTrace   spans for Perfetto / chrome://tracing
+
+Every script that opens an ATTransport can be instrumented without code
+changes through environment variables:
+
+    FOV_AT_METRICS=1             print a latency summary when the port is closed
+    FOV_AT_METRICS_PORT=9108     serve http://127.0.0.1:9108/metrics while running
+    FOV_AT_TRACE=/tmp/at.jsonl   append a JSONL event trace
+    FOV_AT_CHROME_TRACE=t.json   write a Chrome trace-event file at exit
+
+Usage:
+    FOV_AT_METRICS=1 python3 test_meminfo.py
+    python3 at_metrics.py --simulate --flow aws --runs 5          # summary
+    python3 at_metrics.py --simulate --serve 9108 --runs 1000     # live endpoint
+    python3 at_metrics.py --simulate --overhead                   # hook cost
+
+From Python:
+    histogram = Histogram()
+    at = ATTransport.open(port, hooks=Instruments([histogram, JSONLTrace('at.jsonl')]))
+
+Requirements:
+    pip install pyserial
+"""
+
+import argparse
+import bisect
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import serial
+
+from at_transport import ATTransport, DEFAULT_BAUD, DEFAULT_PORT, URC_PREFIXES
+from latency_model import command_key
+
+# Histogram bucket upper bounds in seconds (Prometheus 'le')
+BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 30, 60)
+EVENTS = ('write', 'first_byte', 'line', 'final', 'urc', 'wait')
+DEFAULT_METRICS_PORT = 9108
+
+
+class Instruments:
+    """
+    Fans transport events out to sinks.
+
+    Each sink may define any of write(response), first_byte(response),
+    line(line, at), final(response), urc(line, at), wait(marker, started,
+    line) and close(). The call
+    lists are built once, so an event no sink cares about costs one empty loop.
+    """
+
+    def __init__(self, sinks=()):
+        self.sinks = list(sinks)
+        for event in EVENTS:
+            setattr(self, f'_{event}', [getattr(s, event) for s in self.sinks if hasattr(s, event)])
+
+    def write(self, response):
+        for callback in self._write:
+            callback(response)
+
+    def first_byte(self, response):
+        for callback in self._first_byte:
+            callback(response)
+
+    def line(self, line, at):
+        for callback in self._line:
+            callback(line, at)
+
+    def final(self, response):
+        for callback in self._final:
+            callback(response)
+
+    def urc(self, line, at):
+        for callback in self._urc:
+            callback(line, at)
+
+    def wait(self, marker, started, line):
+        for callback in self._wait:
+            callback(marker, started, line)
+
+    def close(self):
+        for sink in self.sinks:
+            if hasattr(sink, 'close'):
+                sink.close()
+
+
+class _Series:
+    """Cumulative histogram of one metric."""
+
+    __slots__ = ('counts', 'total', 'count', 'min', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # last one is +Inf
+        self.total = 0.0
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+        if self.count == 1:
+            self.min = self.max = value
+        elif value < self.min:
+            self.min = value
+        elif value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """
+        Estimate from the buckets, interpolating linearly inside one.
+
+        The estimate is clamped to the smallest and largest value seen, so a
+        series with one sample returns that sample.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                low = BUCKETS[i - 1] if i else 0.0
+                high = BUCKETS[i] if i < len(BUCKETS) else self.max
+                estimate = low + (high - low) * (rank - seen) / n
+                return min(max(estimate, self.min), self.max)
+            seen += n
+        return self.max
+
+
+class Histogram:
+    """
+    Latency histograms per command key (see latency_model.command_key).
+
+    Args:
+        firmware: Label added to every series, so builds can be compared
+    """
+
+    def __init__(self, firmware=''):
+        self.firmware = firmware
+        self.latency = {}     # (firmware, key, result) -> _Series, write to final
+        self.first_byte_latency = {}  # (firmware, key) -> _Series
+        self.urcs = {}        # prefix -> count
+        self.lines = 0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def first_byte(self, response):
+        key = (self.firmware, command_key(response.command))
+        with self._lock:
+            series = self.first_byte_latency.get(key)
+            if series is None:
+                series = self.first_byte_latency[key] = _Series()
+            series.add(response.first_byte_at - response.sent_at)
+
+    def line(self, line, at):
+        self.lines += 1
+
+    def final(self, response):
+        elapsed = response.elapsed
+        if elapsed is None:
+            return
+        result = 'timeout' if response.result is None else 'ok' if response.ok else 'error'
+        key = (self.firmware, command_key(response.command), result)
+        with self._lock:
+            if result == 'timeout':
+                self.timeouts += 1
+            series = self.latency.get(key)
+            if series is None:
+                series = self.latency[key] = _Series()
+            series.add(elapsed)
+
+    def urc(self, line, at):
+        if line.startswith(URC_PREFIXES):
+            prefix = line.split(':', 1)[0]
+        elif line.endswith(',CLOSED'):
+            prefix = 'CLOSED'
+        else:
+            prefix = 'other'  # boot log and lines nobody was waiting for
+        with self._lock:
+            self.urcs[prefix] = self.urcs.get(prefix, 0) + 1
+
+    def summary(self):
+        """Rows of (command key, result, n, mean, p50, p95, p99) sorted by total time."""
+        with self._lock:
+            items = list(self.latency.items())
+        rows = [(key, result, s.count, s.total / s.count, s.quantile(0.5), s.quantile(0.95), s.quantile(0.99))
+                for (_, key, result), s in items]
+        return sorted(rows, key=lambda r: -r[2] * r[3])
+
+    def prometheus(self):
+        """Prometheus text exposition format."""
+        out = []
+
+        def series(name, labels, s):
+            for le, cumulative in zip(BUCKETS + ('+Inf',), _cumulative(s.counts)):
+                out.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            out.append(f'{name}_sum{{{labels}}} {s.total:.6f}')
+            out.append(f'{name}_count{{{labels}}} {s.count}')
+
+        with self._lock:
+            out.append('# HELP fov_at_command_seconds Time from command write to final result')
+            out.append('# TYPE fov_at_command_seconds histogram')
+            for (firmware, key, result), s in sorted(self.latency.items()):
+                series('fov_at_command_seconds',
+                       f'firmware={_label(firmware)},command={_label(key)},result="{result}"', s)
+            out.append('# HELP fov_at_first_byte_seconds Time from command write to the first byte back')
+            out.append('# TYPE fov_at_first_byte_seconds histogram')
+            for (firmware, key), s in sorted(self.first_byte_latency.items()):
+                series('fov_at_first_byte_seconds', f'firmware={_label(firmware)},command={_label(key)}', s)
+            out.append('# TYPE fov_at_urcs_total counter')
+            for prefix, n in sorted(self.urcs.items()):
+                out.append(f'fov_at_urcs_total{{urc={_label(prefix)}}} {n}')
+            out.append('# TYPE fov_at_lines_total counter')
+            out.append(f'fov_at_lines_total {self.lines}')
+            out.append('# TYPE fov_at_timeouts_total counter')
+            out.append(f'fov_at_timeouts_total {self.timeouts}')
+        return '\n'.join(out) + '\n'
+
+
+def _cumulative(counts):
+    total = 0
+    for n in counts:
+        total += n
+        yield total
+
+
+def _label(value):
+    return json.dumps(value)  # quotes and escapes " and \ as Prometheus expects
+
+
+def print_summary(histogram, file=sys.stdout):
+    rows = histogram.summary()
+    if not rows:
+        return
+    print(f"\n{'Command':<24} {'result':<7} {'n':>5} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8}", file=file)
+    for key, result, n, mean, p50, p95, p99 in rows:
+        print(f"{key[:24]:<24} {result:<7} {n:>5} {mean * 1000:7.1f}ms {p50 * 1000:7.1f}ms "
+              f"{p95 * 1000:7.1f}ms {p99 * 1000:7.1f}ms", file=file)
+    if histogram.urcs:
+        print("URCs: " + ', '.join(f"{k} {v}" for k, v in sorted(histogram.urcs.items())), file=file)
+
+
+class _SummaryOnClose:
+    """Prints a Histogram's summary when the transport closes (FOV_AT_METRICS=1)."""
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def close(self):
+        print_summary(self.histogram, file=sys.stderr)
+
+
+class MetricsServer:
+    """Serves a Histogram at http://<host>:<port>/metrics from a daemon thread."""
+
+    def __init__(self, histogram, port=DEFAULT_METRICS_PORT, host='127.0.0.1'):
+        self.histogram = histogram
+        outer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip('/') not in ('', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = outer.histogram.prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class JSONLTrace:
+    """
+    Appends one JSON object per event: {"ev": ..., "t": <unix time>, ...}.
+
+    Lines are written from the reader thread, so this sink is the one to
+    leave off when measuring throughput.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'a', buffering=1 << 16)
+        self._lock = threading.Lock()
+        # monotonic -> wall clock, so traces from several processes line up
+        self._offset = time.time() - time.monotonic()
+
+    def _emit(self, record):
+        line = json.dumps(record)
+        with self._lock:
+            self._file.write(line + '\n')
+
+    def write(self, response):
+        self._emit({'ev': 'write', 't': response.sent_at + self._offset, 'cmd': response.command})
+
+    def first_byte(self, response):
+        self._emit({'ev': 'first_byte', 't': response.first_byte_at + self._offset, 'cmd': response.command,
+                    'delay': response.first_byte_at - response.sent_at})
+
+    def line(self, line, at):
+        self._emit({'ev': 'line', 't': at + self._offset, 'line': line})
+
+    def final(self, response):
+        self._emit({'ev': 'final', 't': response.finished_at + self._offset, 'cmd': response.command,
+                    'result': response.result, 'elapsed': response.elapsed})
+
+    def urc(self, line, at):
+        self._emit({'ev': 'urc', 't': at + self._offset, 'line': line})
+
+    def wait(self, marker, started, line):
+        self._emit({'ev': 'wait', 't': started + self._offset, 'marker': marker, 'line': line,
+                    'elapsed': time.monotonic() - started})
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def from_env(device=None):
+    """
+    Instruments configured from the FOV_AT_* environment variables, or None.
+
+    Args:
+        device: Port name, used as the track name in Chrome traces
+    """
+    sinks = []
+    histogram = None
+    port = os.environ.get('FOV_AT_METRICS_PORT')
+    if os.environ.get('FOV_AT_METRICS') or port:
+        histogram = Histogram()
+        sinks.append(histogram)
+    if port:
+        try:
+            sinks.append(MetricsServer(histogram, int(port)))
+        except OSError as e:
+            print(f"⚠️  Metrics endpoint on port {port} not started: {e}", file=sys.stderr)
+    if os.environ.get('FOV_AT_METRICS'):
+        sinks.append(_SummaryOnClose(histogram))
+    if os.environ.get('FOV_AT_TRACE'):
+        sinks.append(JSONLTrace(os.environ['FOV_AT_TRACE']))
+    if os.environ.get('FOV_AT_CHROME_TRACE'):
+        from chrome_trace import ChromeTrace
+        sinks.append(ChromeTrace(os.environ['FOV_AT_CHROME_TRACE'], device))
+    return Instruments(sinks) if sinks else None
+
+
+def measure_overhead(port, baud, n=500):
+    """Mean round trip of bare 'AT' without hooks and with a Histogram attached."""
+    results = {}
+    for name, hooks in (('disabled', None), ('histogram', Instruments([Histogram()]))):
+        with ATTransport.open(port, baud, hooks=hooks) as at:
+            at.send('AT')
+            start = time.perf_counter()
+            for _ in range(n):
+                at.send('AT')
+            results[name] = (time.perf_counter() - start) / n
+    return results
+
+
+def main():
+    from benchmark import FLOWS, run_flow
+    from latency_model import firmware_key
+
+    parser = argparse.ArgumentParser(description='AT latency histograms and a Prometheus endpoint')
+    parser.add_argument('--port', '-p', default=DEFAULT_PORT)
+    parser.add_argument('--baud', '-b', type=int, default=DEFAULT_BAUD)
+    parser.add_argument('--flow', choices=sorted(FLOWS), default='meminfo', help='benchmark.py flow to run')
+    parser.add_argument('--runs', '-n', type=int, default=5)
+    parser.add_argument('--serve', type=int, metavar='PORT', help='Serve /metrics on this port while running')
+    parser.add_argument('--trace', help='Also write a JSONL event trace')
+    parser.add_argument('--overhead', action='store_true', help='Measure the cost of the hooks')
+    parser.add_argument('--simulate', action='store_true', help='Run against at_simulator')
+    args = parser.parse_args()
+
+    modem = None
+    port = args.port
+    if args.simulate:
+        from at_simulator import SimulatedModem
+        modem = SimulatedModem(baud=None, latency=0, boot_banner=False) if args.overhead else SimulatedModem()
+        port = modem.start()
+
+    try:
+        if args.overhead:
+            time.sleep(0.3)
+            results = measure_overhead(port, args.baud)
+            extra = results['histogram'] - results['disabled']
+            print(f"Round trip without hooks {results['disabled'] * 1e6:.0f} us, "
+                  f"with histogram {results['histogram'] * 1e6:.0f} us ({extra * 1e6:+.0f} us/command)")
+            return
+
+        histogram = Histogram()
+        sinks = [histogram]
+        if args.serve is not None:
+            server = MetricsServer(histogram, args.serve)
+            sinks.append(server)
+            print(f"Serving http://127.0.0.1:{server.port}/metrics")
+        if args.trace:
+            sinks.append(JSONLTrace(args.trace))
+        hooks = Instruments(sinks)
+        try:
+            at = ATTransport.open(port, args.baud, hooks=hooks)
+        except serial.SerialException as e:
+            print(f"ERROR: Could not open serial port: {e}")
+            sys.exit(1)
+        with at:
+            if modem:
+                at.wait_for('ready', timeout=2)
+            histogram.firmware = firmware_key(at.send('AT+GMR').lines)
+            for run in range(args.runs):
+                run_flow(at, FLOWS[args.flow], run)
+        print(f"Firmware: {histogram.firmware}")
+        print_summary(histogram)
+    finally:
+        if modem:
+            modem.stop()
+
+
+if __name__ == "__main__":
+    main()
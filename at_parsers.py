@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Typed records for ESP-AT information responses and URCs.
+
+Response handling in the scripts was substring checks ("OK" in response,
+line.startswith(...) + split(',')). This module keeps one table of
+precompiled patterns keyed by response prefix (+CWJAP, +CIPSTA,
++MQTTSUBRECV, +FWMEMINFO, ...). parse_line() finds the pattern with a
+single dict lookup on the text before ':' and returns a namedtuple with
+converted fields, so each line is matched once and never re-split.
+
+Usage:
+    from at_parsers import parse_response, FWMemInfo
+
+    response = at.send('AT+FWMEMINFO')
+    for rec in parse_response(response):
+        if isinstance(rec, FWMemInfo):
+            print(rec.region, rec.free, rec.largest)
+
+    python3 at_parsers.py                # parse throughput on a synthetic stream
+"""
+
+import collections
+import datetime
+import re
+import time
+
+CWJAP = collections.namedtuple('CWJAP', 'ssid bssid channel rssi')
+CWJAPFail = collections.namedtuple('CWJAPFail', 'code')  # 1 timeout, 2 wrong password, 3 no AP, 4 failed
+CWMode = collections.namedtuple('CWMode', 'mode')
+CIPSTA = collections.namedtuple('CIPSTA', 'field value')  # field is ip, gateway or netmask
+CIPDomain = collections.namedtuple('CIPDomain', 'ip')
+SNTPConfig = collections.namedtuple('SNTPConfig', 'enabled timezone')
+SNTPTime = collections.namedtuple('SNTPTime', 'text time synced')
+MQTTConn = collections.namedtuple('MQTTConn', 'link_id state scheme host port path reconnect')
+MQTTConnected = collections.namedtuple('MQTTConnected', 'link_id scheme host port path reconnect')
+MQTTDisconnected = collections.namedtuple('MQTTDisconnected', 'link_id')
+MQTTSub = collections.namedtuple('MQTTSub', 'link_id state topic qos')
+MQTTSubRecv = collections.namedtuple('MQTTSubRecv', 'link_id topic length data')
+MQTTPubResult = collections.namedtuple('MQTTPubResult', 'ok')
+SysRam = collections.namedtuple('SysRam', 'free min_free')
+UserRam = collections.namedtuple('UserRam', 'free')
+FWMemInfo = collections.namedtuple('FWMemInfo', 'region free largest')
+FWBufStatus = collections.namedtuple('FWBufStatus', 'total committed')
+FWBufAck = collections.namedtuple('FWBufAck', 'end')
+UARTConfig = collections.namedtuple('UARTConfig', 'baud databits stopbits parity flow_control')
+CmdInfo = collections.namedtuple('CmdInfo', 'index name test query set execute')
+
+# MQTTConn.state values
+MQTT_STATES = {
+    0: 'uninitialized', 1: 'user config set', 2: 'connection config set',
+    3: 'disconnected', 4: 'connected', 5: 'connected, no subscription',
+    6: 'connected, subscribed',
+}
+
+_QUOTED = r'"((?:[^"\\]|\\.)*)"'
+_UNESCAPE_RE = re.compile(r'\\(.)')
+
+
+def _unquote(text):
+    return _UNESCAPE_RE.sub(r'\1', text)
+
+
+def _flag(text):
+    return text == '1'
+
+
+def _sntp_time(text):
+    text = text.strip()
+    try:
+        stamp = datetime.datetime.strptime(text, '%a %b %d %H:%M:%S %Y')
+    except ValueError:
+        return SNTPTime(text, None, False)
+    # Before the first sync the modem reports the epoch
+    return SNTPTime(text, stamp, stamp.year > 1970)
+
+
+# prefix -> [(compiled pattern, record factory, converter per group, payload)]; the first match wins.
+# Patterns are matched against the text after '<prefix>:'.
+PARSERS = {}
+
+
+def register(prefix, pattern, record, *converters, payload=False):
+    """
+    Add a pattern for lines starting with '<prefix>:'.
+
+    record is called with the converted groups (missing converters mean str).
+    With payload=True the pattern matches only the header and the rest of
+    the line is passed last, as bytes: the exact payload bytes of an
+    at_transport.RawLine, or the text after the header encoded as UTF-8.
+    """
+    PARSERS.setdefault(prefix, []).append((re.compile(pattern), record, converters, payload))
+
+
+register('+CWJAP', rf'^{_QUOTED},"([0-9a-fA-F:]+)",(\d+),(-?\d+)', CWJAP, _unquote, str, int, int)
+register('+CWJAP', r'^(\d+)$', CWJAPFail, int)
+register('+CWMODE', r'^(\d+)', CWMode, int)
+register('+CIPSTA', rf'^(\w+):{_QUOTED}', CIPSTA, str, _unquote)
+register('+CIPDOMAIN', rf'^{_QUOTED}', CIPDomain, _unquote)
+register('+CIPSNTPCFG', r'^(\d),(-?\d+)', SNTPConfig, _flag, int)
+register('+CIPSNTPTIME', r'^(.*)$', _sntp_time)
+register('+MQTTCONN', rf'^(\d+),(\d+),(\d+),{_QUOTED},"?(\d*)"?,{_QUOTED},(\d+)',
+         MQTTConn, int, int, int, _unquote, str, _unquote, _flag)
+register('+MQTTCONNECTED', rf'^(\d+),(\d+),{_QUOTED},"?(\d*)"?,{_QUOTED},(\d+)',
+         MQTTConnected, int, int, _unquote, str, _unquote, _flag)
+register('+MQTTDISCONNECTED', r'^(\d+)', MQTTDisconnected, int)
+register('+MQTTSUB', rf'^(\d+),(\d+),{_QUOTED},(\d)', MQTTSub, int, int, _unquote, int)
+# The payload is raw and may contain anything, including commas and newlines;
+# ATTransport reads it by its length, so it arrives whole
+register('+MQTTSUBRECV', rf'^(\d+),{_QUOTED},(\d+),', MQTTSubRecv, int, _unquote, int, payload=True)
+register('+MQTTPUB', r'^(OK|FAIL)$', MQTTPubResult, lambda s: s == 'OK')
+register('+SYSRAM', r'^(\d+),(\d+)', SysRam, int, int)
+register('+USERRAM', r'^(\d+)', UserRam, int)
+register('+FWMEMINFO', r'^(PSRAM|INTERNAL),(\d+),(\d+)', FWMemInfo, str, int, int)
+register('+FWBUFSTATUS', r'^(\d+),(\d+)', FWBufStatus, int, int)
+register('+FWBUFACK', r'^(\d+)', FWBufAck, int)
+register('+UART_CUR', r'^(\d+),(\d),(\d),(\d),(\d)', UARTConfig, int, int, int, int, int)
+register('+CMD', rf'^(\d+),{_QUOTED},(\d),(\d),(\d),(\d)', CmdInfo,
+         int, _unquote, _flag, _flag, _flag, _flag)
+
+
+def parse_line(line):
+    """
+    Parse one line into a typed record.
+
+    Returns:
+        The record, or None if the line has no registered parser
+    """
+    colon = line.find(':')
+    if colon < 0:
+        return None
+    entries = PARSERS.get(line[:colon])
+    if entries is None:
+        return None
+    body = line[colon + 1:]
+    for pattern, record, converters, payload in entries:
+        match = pattern.match(body)
+        if match is None:
+            continue
+        values = [convert(value) for convert, value in zip(converters, match.groups())]
+        values.extend(match.groups()[len(converters):])
+        if payload:
+            raw = getattr(line, 'payload', None)
+            values.append(raw if raw is not None else body[match.end():].encode())
+        return record(*values)
+    return None
+
+
+def parse_lines(lines):
+    """Yield a record for every line that has a parser, in stream order."""
+    for line in lines:
+        record = parse_line(line)
+        if record is not None:
+            yield record
+
+
+def parse_response(response):
+    """Records for all lines (including URCs) of an ATResponse."""
+    return list(parse_lines(response.lines))
+
+
+def first(records, record_type):
+    """First record of a type, or None."""
+    return next((r for r in records if isinstance(r, record_type)), None)
+
+
+def main():
+    lines = []
+    for i in range(2000):
+        lines += [
+            f'+CWJAP:"tim","a4:2b:b0:11:22:{i % 100:02d}",6,-{40 + i % 40},0,1,3,0,1',
+            '+CIPSTA:ip:"192.168.1.50"',
+            f'+MQTTSUBRECV:0,"fov/sensor/{i % 8}",17,{{"seq":{i:6d},"v":1}}',
+            f'+FWMEMINFO:PSRAM,{7_864_320 - i},7733248',
+            f'+SYSRAM:{187_392 - i},166912',
+            'OK',
+        ]
+    start = time.perf_counter()
+    records = list(parse_lines(lines))
+    elapsed = time.perf_counter() - start
+    counts = collections.Counter(type(r).__name__ for r in records)
+    print(f"{len(lines):,} lines -> {len(records):,} records in {elapsed * 1000:.1f} ms "
+          f"({len(lines) / elapsed / 1000:.0f}k lines/s)")
+    for name, n in sorted(counts.items()):
+        print(f"  {name:<14} {n:,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,752 @@
+#!/usr/bin/env python3
+"""
+Simulated ESP32-C5 ESP-AT modem on a pseudo-terminal.
+
+Opens a pty pair and answers the AT dialect used by the scripts in this repo
+(AT, AT+GMR, AT+RST, AT+CWJAP, AT+CIPSNTPCFG, AT+MQTTUSERCFG/CONN/SUB/PUB/PUBRAW,
+AT+FWMEMINFO, AT+CMD?, ...) so they can be run and benchmarked without a
+board. Response latency, UART baud-rate throttling, the boot banner and the
+'ready' line are all configurable. Command lines longer than ESP-AT's
+256 byte limit are answered with ERROR, like the firmware does.
+
+MQTT is looped back inside the simulator by default (a publish to a
+subscribed topic comes straight back as +MQTTSUBRECV). With --mqtt-broker,
+AT+MQTTCONN opens a real MQTT connection instead, e.g. to mqtt_broker.py,
+so publishes, subscriptions and +MQTTSUBRECV go over the network and
+end-to-end tests run fully offline.
+
+Usage:
+    python3 at_simulator.py [--latency 0.005] [--baud 115200] [--link /tmp/ttyC5]
+    python3 at_simulator.py --mqtt-broker 127.0.0.1:1883   # with mqtt_broker.py
+
+    # then point any script at the printed port (or the --link path)
+    python3 test_meminfo.py --port /dev/pts/3
+
+From Python:
+    from at_simulator import SimulatedModem
+
+    with SimulatedModem(latency=0.01) as modem:
+        with ATTransport.open(modem.port) as at:
+            at.send('AT+GMR')
+"""
+
+import argparse
+import os
+import queue
+import random
+import re
+import select
+import ssl
+import threading
+import time
+import tty
+import zlib
+
+from at_transport import AT_LINE_MAX
+from mqtt_broker import MQTTClient, MQTTProtocolError, topic_matches
+
+# Firmware identity reported by AT+GMR
+GMR_LINES = (
+    'AT version:4.1.0.0-dev(3f2c1a9 - ESP32C5 - Jun  4 2025 10:12:44)',
+    'SDK version:v5.4.1-dirty',
+    'compile time(a91b2c3):Jun  4 2025 10:15:02',
+    'Bin version:v4.1.0.0-dev(ESP32C5-4MB)',
+)
+
+BOOT_BANNER = (
+    'ESP-ROM:esp32c5-eco2-20250121',
+    'Build:Jan 21 2025',
+    'rst:0x1 (POWERON),boot:0x18 (SPI_FAST_FLASH_BOOT)',
+    'SPIWP:0xee',
+    'mode:DIO, clock div:1',
+    'load:0x408556b0,len:0x17cc',
+    'entry 0x4084bba6',
+    'I (43) boot: ESP-IDF v5.4.1-dirty 2nd stage bootloader',
+    'I (121) esp_psram: Found 8MB PSRAM device',
+    'I (402) main_task: Calling app_main()',
+    'at param mode: 1',
+    'AT cmd port:uart1 tx:24 rx:23 cts:26 rts:25 baudrate:115200',
+)
+
+# Largest chunk AT+FWBUFDOWNLOAD accepts (matches the firmware's UART buffer)
+FWBUF_MAX_CHUNK = 8192
+
+# AT+MQTTUSERCFG schemes that run over TLS
+MQTT_TLS_SCHEMES = ('2', '3', '4', '5')
+
+# Latency (seconds) of commands that talk to the network, on top of `latency`
+DEFAULT_LATENCIES = {
+    'AT+RST': 0.05,
+    'AT+CWJAP': 1.5,
+    'AT+CIPDOMAIN': 0.1,
+    'AT+CIPSTART': 0.5,
+    'AT+MQTTCONN': 0.8,
+    'AT+MQTTSUB': 0.1,
+    'AT+MQTTPUB': 0.05,
+    'AT+MQTTPUBRAW': 0.05,
+}
+
+
+def parse_params(text):
+    """Split AT set-command parameters, honouring quotes and backslash escapes."""
+    params = []
+    field = []
+    quoted = False
+    chars = iter(text)
+    for c in chars:
+        if c == '\\':
+            field.append(next(chars, ''))
+        elif c == '"':
+            quoted = not quoted
+        elif c == ',' and not quoted:
+            params.append(''.join(field).strip())
+            field = []
+        else:
+            field.append(c)
+    params.append(''.join(field).strip())
+    return params
+
+
+class SimulatedModem:
+    """
+    ESP-AT modem state machine served over a pty.
+
+    Args:
+        latency: Base processing delay per command in seconds
+        latencies: Extra per-verb delays (defaults to DEFAULT_LATENCIES);
+            pass {} for an instant modem
+        baud: Simulated UART rate; bytes in both directions are paced to it
+            (None disables throttling)
+        boot_banner: Print BOOT_BANNER before 'ready' at start and on AT+RST
+        boot_time: Seconds from start/reset to 'ready'
+        echo: Echo commands back like ESP-AT does by default (ATE1)
+        jitter: Random extra latency fraction (0.1 = up to +10%)
+        psram_free, psram_largest, internal_free, internal_largest:
+            Values reported by AT+FWMEMINFO
+        max_baud: Highest rate the simulated link is stable at; above it
+            responses are garbled, to exercise AT+UART_CUR fallback
+        commit_latency: Seconds to commit one AT+FWBUFDOWNLOAD chunk to PSRAM
+            before its +FWBUFACK is sent
+        mqtt_broker: (host, port) that every AT+MQTTCONN connects to, or True
+            to connect to the host and port in the command. None loops MQTT
+            back inside the simulator. With a broker the MQTT verbs get no
+            simulated latency; the real round trips replace it.
+        mqtt_tls: SSLContext for TLS schemes (default: no certificate checks,
+            like scheme 2)
+    """
+
+    def __init__(self, latency=0.002, latencies=None, baud=115200, boot_banner=True,
+                 boot_time=0.2, echo=True, jitter=0.0,
+                 psram_free=7_864_320, psram_largest=7_733_248,
+                 internal_free=187_392, internal_largest=110_592, max_baud=None,
+                 commit_latency=0.002, mqtt_broker=None, mqtt_tls=None):
+        self.latency = latency
+        self.latencies = dict(DEFAULT_LATENCIES if latencies is None else latencies)
+        self.mqtt_broker = mqtt_broker
+        self.mqtt_tls = mqtt_tls
+        if mqtt_broker is not None:
+            self.latencies = {k: v for k, v in self.latencies.items() if not k.startswith('AT+MQTT')}
+        self.baud = baud
+        self.boot_banner = boot_banner
+        self.boot_time = boot_time
+        self.echo = echo
+        self.jitter = jitter
+        self.mem = {
+            'psram_free': psram_free,
+            'psram_largest': psram_largest,
+            'internal_free': internal_free,
+            'internal_largest': internal_largest,
+        }
+        self.max_baud = max_baud
+        self.commit_latency = commit_latency
+        self.flow_control = 0
+        self.port = None
+        self.commands_seen = []
+        self._master = None
+        self._slave = None
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._link = None
+        self._raw_needed = 0
+        self._raw_callback = None
+        self._commits = queue.Queue()
+        self._commit_thread = None
+        self._mqtt_client = None
+        self._reset_state()
+        self._handlers = {
+            'AT': self._at,
+            'ATE0': self._ate0,
+            'ATE1': self._ate1,
+            'AT+GMR': self._gmr,
+            'AT+RST': self._rst,
+            'AT+CMD': self._cmd_list,
+            'AT+SYSRAM': self._sysram,
+            'AT+USERRAM': self._userram,
+            'AT+FWMEMINFO': self._fwmeminfo,
+            'AT+UART_CUR': self._uart_cur,
+            'AT+FWBUFDOWNLOAD': self._fwbufdownload,
+            'AT+FWBUFSTATUS': self._fwbufstatus,
+            'AT+FWBUFCLEAR': self._fwbufclear,
+            'AT+CWMODE': self._cwmode,
+            'AT+CWJAP': self._cwjap,
+            'AT+CWQAP': self._cwqap,
+            'AT+CIPSTA': self._cipsta,
+            'AT+CIPDOMAIN': self._cipdomain,
+            'AT+CIPSNTPCFG': self._sntpcfg,
+            'AT+CIPSNTPTIME': self._sntptime,
+            'AT+CIPSTART': self._cipstart,
+            'AT+CIPSSLCCONF': self._ok,
+            'AT+MQTTUSERCFG': self._mqttusercfg,
+            'AT+MQTTCONNCFG': self._ok,
+            'AT+MQTTSNI': self._ok,
+            'AT+MQTTCONN': self._mqttconn,
+            'AT+MQTTSUB': self._mqttsub,
+            'AT+MQTTUNSUB': self._mqttunsub,
+            'AT+MQTTPUB': self._mqttpub,
+            'AT+MQTTPUBRAW': self._mqttpubraw,
+            'AT+MQTTCLEAN': self._mqttclean,
+        }
+
+    def _reset_state(self):
+        self.wifi_mode = 1
+        self.ssid = None
+        self.sntp_enabled = False
+        self.time_synced = False
+        self.mqtt_user = None
+        self._mqtt_close()
+        self.subscriptions = {}
+        self.fw_total = 0
+        self.fw_data = None
+        self.fw_next = 0
+        self.fw_committed = 0
+
+    # -- pty plumbing -------------------------------------------------------
+
+    def start(self, link=None):
+        """
+        Open the pty and start serving. Returns the slave device path.
+
+        Args:
+            link: Optional symlink to create pointing at the slave device
+        """
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._master)
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        if link:
+            if os.path.islink(link):
+                os.unlink(link)
+            os.symlink(self.port, link)
+            self._link = link
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        self._boot()
+        return self.port
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+        self._mqtt_close()
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                os.close(fd)
+        self._master = self._slave = None
+        if self._link and os.path.islink(self._link):
+            os.unlink(self._link)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _pace(self, nbytes):
+        # 10 bits per byte on an 8N1 UART
+        if self.baud:
+            time.sleep(nbytes * 10 / self.baud)
+
+    def _write(self, data):
+        with self._write_lock:
+            self._pace(len(data))
+            os.write(self._master, data)
+
+    @property
+    def garbled(self):
+        return bool(self.max_baud and self.baud and self.baud > self.max_baud)
+
+    def emit(self, *lines):
+        """Send lines (each CRLF terminated) to the host, e.g. to inject a URC."""
+        data = b''.join(line.encode() + b'\r\n' for line in lines)
+        if self.garbled:
+            # Framing errors: the host sees noise instead of lines
+            data = bytes(random.randrange(0x80, 0x100) for _ in data)
+        self._write(data)
+
+    def drop_wifi(self):
+        """Lose the AP (and with it the MQTT session), as on a real link drop."""
+        if self.ssid is None:
+            return
+        self.ssid = None
+        if self.mqtt_conn is not None:
+            self._mqtt_close()
+            self.subscriptions.clear()
+            self.emit('+MQTTDISCONNECTED:0')
+        self.emit('WIFI DISCONNECT')
+
+    def drop_mqtt(self):
+        """Lose only the broker connection (e.g. a TLS error or broker restart)."""
+        if self.mqtt_conn is None:
+            return
+        self._mqtt_close()
+        self.subscriptions.clear()
+        self.emit('+MQTTDISCONNECTED:0')
+
+    def _serve(self):
+        buf = b''
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self._master], [], [], 0.05)
+            if not ready:
+                continue
+            try:
+                data = os.read(self._master, 4096)
+            except OSError:
+                return
+            self._pace(len(data))
+            buf += data
+            while True:
+                if self._raw_needed:
+                    if len(buf) < self._raw_needed:
+                        break
+                    payload, buf = buf[:self._raw_needed], buf[self._raw_needed:]
+                    callback = self._raw_callback
+                    self._raw_needed, self._raw_callback = 0, None
+                    callback(payload)
+                    continue
+                end = buf.find(b'\r\n')
+                if end < 0:
+                    break
+                line, buf = buf[:end], buf[end + 2:]
+                if end + 2 > AT_LINE_MAX:
+                    # Too long for the firmware's command buffer, as on a board
+                    self.emit('ERROR')
+                    continue
+                self._handle(line.decode('utf-8', errors='replace').strip())
+
+    def _expect_raw(self, length, callback):
+        """Prompt with '>' and hand the next `length` raw bytes to callback."""
+        self._raw_needed, self._raw_callback = length, callback
+        self.emit('OK', '')
+        self._write(b'>')
+
+    def _later(self, delay, *lines, then=None):
+        """Emit lines from a timer thread, like a URC arriving asynchronously."""
+        def fire():
+            if self._stop.is_set():
+                return
+            if then:
+                then()
+            self.emit(*lines)
+        timer = threading.Timer(delay, fire)
+        timer.daemon = True
+        timer.start()
+
+    def _boot(self):
+        lines = (BOOT_BANNER if self.boot_banner else ()) + ('', 'ready')
+        self._later(self.boot_time, *lines)
+
+    # -- command dispatch ---------------------------------------------------
+
+    def _handle(self, line):
+        if not line:
+            return
+        self.commands_seen.append(line)
+        if self.echo:
+            self.emit(line)
+        match = re.match(r'^(AT(?:\+[A-Z_0-9]+|E[01])?)(=\?|\?|=(.*))?$', line, re.IGNORECASE)
+        if not match:
+            self.emit('ERROR')
+            return
+        verb, suffix, args = match.group(1).upper(), match.group(2) or '', match.group(3)
+        handler = self._handlers.get(verb)
+        if handler is None:
+            self.emit('ERROR')
+            return
+        delay = self.latency
+        if suffix not in ('?', '=?'):
+            # Queries answer from local state; only actions go out to the network
+            delay += self.latencies.get(verb, 0.0)
+        if self.jitter:
+            delay *= 1 + random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+        if suffix == '=?':
+            self.emit('OK')
+            return
+        kind = 'query' if suffix == '?' else 'set' if args is not None else 'exec'
+        handler(kind, parse_params(args) if args else [])
+
+    def _ok(self, kind, params):
+        self.emit('OK')
+
+    def _at(self, kind, params):
+        self.emit('OK')
+
+    def _ate0(self, kind, params):
+        self.echo = False
+        self.emit('OK')
+
+    def _ate1(self, kind, params):
+        self.echo = True
+        self.emit('OK')
+
+    def _gmr(self, kind, params):
+        self.emit(*GMR_LINES, 'OK')
+
+    def _rst(self, kind, params):
+        self.emit('OK')
+        self._reset_state()
+        self._boot()
+
+    def _cmd_list(self, kind, params):
+        if kind != 'query':
+            return self.emit('ERROR')
+        lines = []
+        for index, verb in enumerate(sorted(self._handlers)):
+            # ESP-AT lists extended commands without the AT prefix
+            name = verb[2:] if verb.startswith('AT+') else verb
+            lines.append(f'+CMD:{index},"{name}",1,1,1,1')
+        self.emit(*lines, 'OK')
+
+    def _sysram(self, kind, params):
+        if kind != 'query':
+            return self.emit('ERROR')
+        free = self.mem['internal_free']
+        self.emit(f'+SYSRAM:{free},{free - 20480}', 'OK')
+
+    def _userram(self, kind, params):
+        if kind != 'query':
+            return self.emit('ERROR')
+        self.emit(f"+USERRAM:{self.mem['psram_free']}", 'OK')
+
+    def _fwmeminfo(self, kind, params):
+        if kind == 'set':
+            return self.emit('ERROR')
+        m = self.mem
+        self.emit(f"+FWMEMINFO:PSRAM,{m['psram_free']},{m['psram_largest']}",
+                  f"+FWMEMINFO:INTERNAL,{m['internal_free']},{m['internal_largest']}",
+                  'OK')
+
+    def _uart_cur(self, kind, params):
+        if kind == 'query':
+            return self.emit(f'+UART_CUR:{self.baud or 115200},8,1,0,{self.flow_control}', 'OK')
+        if kind != 'set' or len(params) < 5 or not params[0].isdigit():
+            return self.emit('ERROR')
+        # ESP-AT answers OK at the old rate, then switches
+        self.emit('OK')
+        self.baud = int(params[0])
+        self.flow_control = int(params[4])
+
+    def _fwbufstatus(self, kind, params):
+        if kind != 'query':
+            return self.emit('ERROR')
+        self.emit(f'+FWBUFSTATUS:{self.fw_total},{self.fw_committed}', 'OK')
+
+    def _fwbufclear(self, kind, params):
+        self.fw_total = 0
+        self.fw_data = None
+        self.fw_next = self.fw_committed = 0
+        self.emit('OK')
+
+    def _fwbufdownload(self, kind, params):
+        if kind != 'set' or not all(p.isdigit() for p in params[:2]):
+            return self.emit('ERROR')
+        if len(params) == 1:
+            # Start a session: allocate the PSRAM buffer
+            total = int(params[0])
+            if total == 0 or total > self.mem['psram_largest']:
+                return self.emit('ERROR')
+            self.fw_total = total
+            self.fw_data = bytearray(total)
+            self.fw_next = self.fw_committed = 0
+            return self.emit('OK')
+        if len(params) < 3 or self.fw_data is None:
+            return self.emit('ERROR')
+        offset, length = int(params[0]), int(params[1])
+        crc = int(params[2], 16)
+        # A resuming host may restart anywhere between the last ack and the last chunk received
+        if not self.fw_committed <= offset <= self.fw_next or length > FWBUF_MAX_CHUNK \
+                or offset + length > self.fw_total:
+            return self.emit('ERROR')
+
+        def received(payload):
+            if zlib.crc32(payload) != crc:
+                return self.emit('ERROR')
+            self.fw_data[offset:offset + length] = payload
+            self.fw_next = offset + length
+            self.emit('OK')
+            self._commits.put(offset + length)
+            if self._commit_thread is None:
+                self._commit_thread = threading.Thread(target=self._commit_loop, daemon=True)
+                self._commit_thread.start()
+
+        self._expect_raw(length, received)
+
+    def _commit_loop(self):
+        # Chunks are committed (and acknowledged) in order, one at a time
+        while not self._stop.is_set():
+            try:
+                end = self._commits.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if self.commit_latency:
+                time.sleep(self.commit_latency)
+            self.fw_committed = max(self.fw_committed, end)
+            self.emit(f'+FWBUFACK:{end}')
+
+    def _cwmode(self, kind, params):
+        if kind == 'query':
+            return self.emit(f'+CWMODE:{self.wifi_mode}', 'OK')
+        if kind == 'set' and params and params[0] in ('0', '1', '2', '3'):
+            self.wifi_mode = int(params[0])
+            return self.emit('OK')
+        self.emit('ERROR')
+
+    def _cwjap(self, kind, params):
+        if kind == 'query':
+            if self.ssid is None:
+                return self.emit('No AP', 'OK')
+            return self.emit(f'+CWJAP:"{self.ssid}","a4:2b:b0:11:22:33",6,-52,0,1,3,0,1', 'OK')
+        if kind != 'set' or len(params) < 2 or self.wifi_mode not in (1, 3):
+            return self.emit('ERROR')
+        if self.ssid is not None:
+            self.emit('WIFI DISCONNECT')
+        self.ssid = params[0]
+        self.emit('WIFI CONNECTED', 'WIFI GOT IP', '', 'OK')
+        if self.sntp_enabled and not self.time_synced:
+            self._schedule_sntp()
+
+    def _cwqap(self, kind, params):
+        if self.ssid is not None:
+            self.emit('OK', 'WIFI DISCONNECT')
+            self.ssid = None
+            self._mqtt_close()
+        else:
+            self.emit('OK')
+
+    def _cipsta(self, kind, params):
+        if kind != 'query':
+            return self.emit('ERROR')
+        ip = '192.168.1.50' if self.ssid else '0.0.0.0'
+        gw = '192.168.1.1' if self.ssid else '0.0.0.0'
+        mask = '255.255.255.0' if self.ssid else '0.0.0.0'
+        self.emit(f'+CIPSTA:ip:"{ip}"', f'+CIPSTA:gateway:"{gw}"', f'+CIPSTA:netmask:"{mask}"', 'OK')
+
+    def _cipdomain(self, kind, params):
+        if kind != 'set' or not params or self.ssid is None:
+            return self.emit('ERROR')
+        self.emit('+CIPDOMAIN:"93.184.216.34"', 'OK')
+
+    def _schedule_sntp(self):
+        def synced():
+            self.time_synced = True
+        self._later(0.05, '+TIME_UPDATED', then=synced)
+
+    def _sntpcfg(self, kind, params):
+        if kind == 'query':
+            return self.emit(f'+CIPSNTPCFG:{int(self.sntp_enabled)},0', 'OK')
+        if kind != 'set' or not params:
+            return self.emit('ERROR')
+        self.sntp_enabled = params[0] == '1'
+        self.emit('OK')
+        if self.sntp_enabled and self.ssid is not None:
+            self._schedule_sntp()
+
+    def _sntptime(self, kind, params):
+        if kind != 'query':
+            return self.emit('ERROR')
+        t = time.gmtime() if self.time_synced else time.gmtime(0)
+        self.emit('+CIPSNTPTIME:' + time.strftime('%a %b %d %H:%M:%S %Y', t), 'OK')
+
+    def _cipstart(self, kind, params):
+        if kind != 'set' or self.ssid is None:
+            return self.emit('ERROR')
+        self.emit('CONNECT', '', 'OK')
+
+    def _mqttusercfg(self, kind, params):
+        if kind != 'set' or len(params) < 3:
+            return self.emit('ERROR')
+        self.mqtt_user = params
+        self.emit('OK')
+
+    def _mqttconn(self, kind, params):
+        if kind == 'query':
+            if self.mqtt_conn is None:
+                state = 1 if self.mqtt_user else 0
+                return self.emit(f'+MQTTCONN:0,{state},0,"","","",0', 'OK')
+            host, port, reconnect = self.mqtt_conn
+            scheme = self.mqtt_user[1]
+            return self.emit(f'+MQTTCONN:0,4,{scheme},"{host}","{port}","",{reconnect}', 'OK')
+        if kind != 'set' or len(params) < 4 or self.mqtt_user is None or self.ssid is None:
+            return self.emit('ERROR')
+        host, port, reconnect = params[1], params[2], params[3]
+        scheme = self.mqtt_user[1]
+        if self.mqtt_broker is not None:
+            try:
+                self._mqtt_connect(host, int(port), scheme)
+            except (OSError, ValueError, MQTTProtocolError):
+                return self.emit('ERROR')
+        self.mqtt_conn = (host, port, reconnect)
+        self.emit(f'+MQTTCONNECTED:0,{scheme},"{host}","{port}","",{reconnect}', 'OK')
+
+    def _mqtt_connect(self, host, port, scheme):
+        """Open the real broker connection for AT+MQTTCONN."""
+        if self.mqtt_broker is not True:
+            host, port = self.mqtt_broker
+        tls = None
+        if scheme in MQTT_TLS_SCHEMES:
+            tls = self.mqtt_tls
+            if tls is None:
+                tls = ssl.create_default_context()
+                tls.check_hostname = False
+                tls.verify_mode = ssl.CERT_NONE
+        user = self.mqtt_user + [''] * 5
+        client = MQTTClient(host, port, client_id=user[2], username=user[3], password=user[4],
+                            tls=tls, on_message=self._broker_message)
+        client.on_disconnect = lambda: self._broker_lost(client)
+        self._mqtt_client = client
+
+    def _broker_message(self, topic, payload):
+        self._write(f'+MQTTSUBRECV:0,"{topic}",{len(payload)},'.encode() + payload + b'\r\n')
+
+    def _broker_lost(self, client):
+        if client is self._mqtt_client and self.mqtt_conn is not None:
+            self._mqtt_client = None
+            self.mqtt_conn = None
+            self.subscriptions.clear()
+            self.emit('+MQTTDISCONNECTED:0')
+
+    def _mqtt_close(self):
+        """Forget the MQTT session, closing the broker connection if there is one."""
+        self.mqtt_conn = None
+        client, self._mqtt_client = self._mqtt_client, None
+        if client is not None:
+            client.close()
+
+    def _mqttsub(self, kind, params):
+        if kind == 'query':
+            lines = [f'+MQTTSUB:0,6,"{t}",{q}' for t, q in self.subscriptions.items()]
+            return self.emit(*lines, 'OK')
+        if kind != 'set' or len(params) < 3 or self.mqtt_conn is None:
+            return self.emit('ERROR')
+        if params[1] in self.subscriptions:
+            return self.emit('ALREADY SUBSCRIBE')
+        if self._mqtt_client is not None:
+            try:
+                self._mqtt_client.subscribe(params[1], int(params[2]))
+            except (OSError, TimeoutError):
+                return self.emit('ERROR')
+        self.subscriptions[params[1]] = int(params[2])
+        self.emit('OK')
+
+    def _mqttunsub(self, kind, params):
+        if kind != 'set' or len(params) < 2 or params[1] not in self.subscriptions:
+            return self.emit('NO UNSUBSCRIBE')
+        if self._mqtt_client is not None:
+            try:
+                self._mqtt_client.unsubscribe(params[1])
+            except (OSError, TimeoutError):
+                return self.emit('ERROR')
+        del self.subscriptions[params[1]]
+        self.emit('OK')
+
+    def _mqttpub(self, kind, params):
+        if kind != 'set' or len(params) < 5 or self.mqtt_conn is None:
+            return self.emit('ERROR')
+        topic, data = params[1], params[2]
+        if not self._deliver(topic, data.encode(), params[3]):
+            return self.emit('ERROR')
+        self.emit('OK')
+
+    def _mqttpubraw(self, kind, params):
+        if kind != 'set' or len(params) < 5 or not params[2].isdigit() or self.mqtt_conn is None:
+            return self.emit('ERROR')
+        topic, length = params[1], int(params[2])
+
+        def received(payload):
+            self.emit('+MQTTPUB:OK' if self._deliver(topic, payload, params[3]) else '+MQTTPUB:FAIL')
+
+        self._expect_raw(length, received)
+
+    def _deliver(self, topic, payload, qos='0'):
+        """
+        Send a publish to the broker, or without one loop it back as
+        +MQTTSUBRECV if the topic is subscribed. Returns False if it failed.
+        """
+        if self._mqtt_client is not None:
+            try:
+                self._mqtt_client.publish(topic, payload, int(qos) if qos.isdigit() else 0)
+            except (OSError, TimeoutError):
+                return False
+            return True
+        if any(topic_matches(pattern, topic) for pattern in self.subscriptions):
+            self._write(f'+MQTTSUBRECV:0,"{topic}",{len(payload)},'.encode() + payload + b'\r\n')
+        return True
+
+    def _mqttclean(self, kind, params):
+        if kind != 'set':
+            return self.emit('ERROR')
+        self._mqtt_close()
+        self.subscriptions.clear()
+        self.emit('OK')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulated ESP32-C5 ESP-AT modem on a pty')
+    parser.add_argument('--latency', type=float, default=0.002,
+                        help='Base per-command latency in seconds (default: 0.002)')
+    parser.add_argument('--instant', action='store_true',
+                        help='Drop the per-verb network latencies (CWJAP, MQTTCONN, ...)')
+    parser.add_argument('--baud', type=int, default=115200,
+                        help='Simulated UART rate, 0 for unthrottled (default: 115200)')
+    parser.add_argument('--no-banner', action='store_true', help='Skip the boot log before ready')
+    parser.add_argument('--boot-time', type=float, default=0.2)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--link', help='Create a symlink to the pty, e.g. /tmp/ttyC5')
+    parser.add_argument('--mqtt-broker', metavar='HOST:PORT',
+                        help="Connect AT+MQTTCONN to this broker (e.g. mqtt_broker.py), "
+                             "'direct' for the host in the command")
+    args = parser.parse_args()
+
+    mqtt_broker = None
+    if args.mqtt_broker == 'direct':
+        mqtt_broker = True
+    elif args.mqtt_broker:
+        host, _, port = args.mqtt_broker.rpartition(':')
+        mqtt_broker = (host or '127.0.0.1', int(port))
+
+    modem = SimulatedModem(
+        latency=args.latency,
+        latencies={} if args.instant else None,
+        baud=args.baud or None,
+        boot_banner=not args.no_banner,
+        boot_time=args.boot_time,
+        jitter=args.jitter,
+        mqtt_broker=mqtt_broker,
+    )
+    port = modem.start(link=args.link)
+    print(f"Simulated ESP32-C5 on {port}" + (f" (-> {args.link})" if args.link else ''))
+    print("Ctrl-C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        modem.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+Shared AT command transport for the ESP32-C5 scripts.
+
+The scripts used to write a command, sleep for a fixed 2-15 seconds and then
+do a single read of whatever was waiting. This module reads the serial port in
+a background thread, splits the stream into lines as it arrives and returns
+from send() as soon as a final result code (OK, ERROR, SEND OK, +CME ERROR,
+...) is seen. The per-command timeout is only a ceiling.
+
+Usage:
+    from at_transport import ATTransport
+
+    with ATTransport.open('/dev/ttyUSB0') as at:
+        response = at.send('AT+GMR')
+        print(response.text)
+
+Port 'auto' opens the ESP-AT port found by port_discovery.py (cached per
+USB device). FOV_AT_PORT changes the default port, e.g. FOV_AT_PORT=auto.
+
+Requirements:
+    pip install pyserial
+"""
+
+import collections
+import os
+import re
+import threading
+import time
+
+import serial
+
+from ring_buffer import LineFramer
+
+# Default configuration
+DEFAULT_PORT = os.environ.get('FOV_AT_PORT', '/dev/ttyUSB0')
+AUTO_PORT = 'auto'  # resolved by port_discovery
+DEFAULT_BAUD = 115200
+DEFAULT_TIMEOUT = 2  # seconds, upper bound only
+READ_POLL = 0.05  # seconds the reader thread blocks in read()
+AT_LINE_MAX = 256  # ESP-AT rejects longer command lines (CRLF included)
+
+# Result codes that terminate an AT command
+FINAL_RESULTS = ('OK', 'ERROR', 'SEND OK', 'SEND FAIL', 'FAIL',
+                 'ALREADY SUBSCRIBE', 'NO UNSUBSCRIBE',
+                 '+MQTTPUB:OK', '+MQTTPUB:FAIL')  # last two end AT+MQTTPUBRAW
+ERROR_RESULTS = ('ERROR', 'SEND FAIL', 'FAIL', '+MQTTPUB:FAIL')
+ERROR_PREFIXES = ('+CME ERROR', '+CMS ERROR')
+
+# Prompt for raw data after AT+CIPSEND / AT+MQTTPUBRAW style commands
+PROMPT = b'>'
+
+# Unsolicited result codes the modem emits on its own
+URC_PREFIXES = (
+    'WIFI CONNECTED', 'WIFI GOT IP', 'WIFI DISCONNECT',
+    '+TIME_UPDATED', '+MQTTCONNECTED', '+MQTTDISCONNECTED', '+MQTTSUBRECV',
+    '+IPD', 'CLOSED', 'ready', '+FWBUFACK',
+)
+
+# +MQTTSUBRECV:<link>,"<topic>",<len>,<payload>: the payload is raw bytes and
+# may contain CR/LF, so it is read by its length rather than up to a newline
+COUNTED_PREFIX = b'+MQTTSUBRECV:'
+COUNTED_HEADER = re.compile(rb'\+MQTTSUBRECV:\d+,"(?:[^"\\]|\\.)*",(\d+),')
+COUNTED_HEADER_MAX = 256  # ESP-AT topics are at most 128 bytes
+
+
+class RawLine(str):
+    """A line with a length-counted payload; .payload holds its exact bytes."""
+
+    payload = b''
+
+
+def take_counted(framer):
+    """
+    Take a +MQTTSUBRECV line off the front of a LineFramer by its length field.
+
+    Returns:
+        RawLine (text decoded, .payload as received), None if the buffer
+        does not start with one, or False if the rest has not arrived yet
+    """
+    if not framer.startswith(COUNTED_PREFIX):
+        return None
+    head = framer.peek(COUNTED_HEADER_MAX)
+    match = COUNTED_HEADER.match(head)
+    if match is None:
+        # Header still arriving, or not a counted line after all
+        return False if b'\n' not in head and len(head) < COUNTED_HEADER_MAX else None
+    length = int(match.group(1))
+    if match.end() + length > framer.capacity:
+        return None  # can never be buffered whole
+    raw = framer.take(match.end() + length)
+    if raw is None:
+        return False
+    framer.consume_prefix(b'\r\n')  # if it is not here yet, it frames as an empty line
+    payload = raw[match.end():]
+    line = RawLine(str(raw, 'utf-8', 'replace'))
+    line.payload = payload
+    return line
+
+
+def read_lines(framer):
+    """
+    Yield the complete lines in a LineFramer, decoded and stripped.
+
+    Blank lines are skipped and +MQTTSUBRECV payloads are taken by length.
+    Stops when the next line has not fully arrived.
+    """
+    while True:
+        line = take_counted(framer)
+        if line is False:
+            return
+        if line is not None:
+            yield line
+            continue
+        raw = next(framer.lines(), None)
+        if raw is None:
+            return
+        line = str(raw, 'utf-8', 'replace').strip()
+        if line:
+            yield line
+
+
+def is_final_result(line):
+    """Return True if line is a final result code."""
+    return line in FINAL_RESULTS or line.startswith(ERROR_PREFIXES)
+
+
+def is_error_result(line):
+    """Return True if line is a final result code reporting failure."""
+    return line in ERROR_RESULTS or line.startswith(ERROR_PREFIXES)
+
+
+def is_urc(line):
+    """Return True if line is an unsolicited result code."""
+    return line.startswith(URC_PREFIXES) or line.endswith(',CLOSED')
+
+
+def quote(value):
+    """Quote a string parameter, escaping the characters ESP-AT treats specially."""
+    escaped = value.replace('\\', '\\\\').replace('"', '\\"').replace(',', '\\,')
+    return f'"{escaped}"'
+
+
+class ATError(Exception):
+    """An AT command finished with an error result or timed out."""
+
+    def __init__(self, response):
+        self.response = response
+        reason = response.result or 'timeout'
+        super().__init__(f"{response.command}: {reason}")
+
+
+class ATResponse:
+    """Lines received for one command plus its final result code."""
+
+    def __init__(self, command):
+        self.command = command
+        self.lines = []
+        self.urcs = []
+        self.result = None
+        self.sent_at = None
+        self.first_byte_at = None
+        self.finished_at = None
+
+    @property
+    def ok(self):
+        return self.result is not None and not is_error_result(self.result)
+
+    @property
+    def timed_out(self):
+        return self.result is None
+
+    @property
+    def first_byte(self):
+        """Seconds from write to the first byte received after it."""
+        if self.sent_at is None or self.first_byte_at is None:
+            return None
+        return self.first_byte_at - self.sent_at
+
+    @property
+    def elapsed(self):
+        """Seconds from write to final result (or timeout)."""
+        if self.sent_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.sent_at
+
+    @property
+    def text(self):
+        return '\r\n'.join(self.lines)
+
+    def __contains__(self, item):
+        return item in self.text
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return f"ATResponse({self.command!r}, result={self.result!r}, lines={len(self.lines)})"
+
+
+class ATTransport:
+    """
+    Line-oriented AT transport over an open serial port.
+
+    A daemon thread reads the port and dispatches complete lines as they
+    arrive: to the command currently waiting in send(), and, for URCs
+    (WIFI GOT IP, +MQTTSUBRECV, ...) or lines nobody is waiting for, to
+    ``unsolicited`` and any registered URC listeners.
+
+    With a latency_model.LatencyModel as `timeouts`, every command's
+    latency is recorded and learned timeouts replace the callers' guesses.
+
+    With an at_metrics.Instruments as `hooks` (or one configured through the
+    FOV_AT_* environment variables), write, first
+    byte, line, final result, URC and wait_for() events are reported to its sinks.
+    """
+
+    def __init__(self, ser, timeouts=None, hooks=None):
+        self.ser = ser
+        self.timeouts = timeouts
+        if hooks is None and any(os.environ.get(v) for v in
+                                 ('FOV_AT_METRICS', 'FOV_AT_METRICS_PORT', 'FOV_AT_TRACE',
+                                  'FOV_AT_CHROME_TRACE')):
+            from at_metrics import from_env
+            hooks = from_env(getattr(ser, 'port', None))
+        self.hooks = hooks
+        self.ser.timeout = READ_POLL
+        self.unsolicited = collections.deque(maxlen=256)
+        self._urc_listeners = []
+        self._urc_cond = threading.Condition()
+        self._current = None
+        self._current_until = None
+        self._expect_prompt = False
+        self._current_done = threading.Event()
+        self._cmd_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+
+    @classmethod
+    def open(cls, port=DEFAULT_PORT, baud=DEFAULT_BAUD, timeouts=None, hooks=None):
+        """Open a serial port ('auto' to discover it) and wrap it. Raises serial.SerialException."""
+        if port == AUTO_PORT:
+            from port_discovery import find_at_port
+            port = find_at_port(baud)
+            if port is None:
+                raise serial.SerialException("no serial port answered AT (see port_discovery.py)")
+        return cls(serial.Serial(port, baud, timeout=READ_POLL), timeouts=timeouts, hooks=hooks)
+
+    def _read_loop(self):
+        framer = LineFramer()
+        while not self._stop.is_set():
+            try:
+                data = self.ser.read(self.ser.in_waiting or 1)
+            except (serial.SerialException, OSError, TypeError):
+                # Port closed underneath us
+                break
+            if not data:
+                continue
+            response = self._current
+            if response is not None and response.first_byte_at is None:
+                response.first_byte_at = time.monotonic()
+                if self.hooks is not None:
+                    self.hooks.first_byte(response)
+            framer.feed(data)
+            while True:
+                if self._expect_prompt and framer.consume_prefix(PROMPT):
+                    # The data prompt is not CRLF terminated
+                    framer.consume_prefix(b' ')
+                    self._dispatch(PROMPT.decode())
+                    continue
+                for line in read_lines(framer):
+                    self._dispatch(line)
+                    if self._expect_prompt:
+                        break  # check for the prompt before the next line
+                else:
+                    break
+
+    def _dispatch(self, line):
+        hooks = self.hooks
+        if hooks is not None:
+            now = time.monotonic()
+            hooks.line(line, now)
+        response = self._current
+        urc = is_urc(line)
+        if response is not None and not self._current_done.is_set():
+            response.lines.append(line)
+            if urc:
+                response.urcs.append(line)
+            until = self._current_until
+            if self._expect_prompt:
+                # ESP-AT sends OK before the prompt, so only '>' or an error ends this phase
+                final = line == PROMPT.decode() or is_error_result(line)
+            elif until:
+                final = any(marker in line for marker in until) or is_error_result(line)
+            else:
+                final = is_final_result(line)
+            if final:
+                response.result = line
+                response.finished_at = time.monotonic()
+                self._current_done.set()
+        elif not urc:
+            urc = True  # nobody asked for it
+        if urc:
+            if hooks is not None:
+                hooks.urc(line, now)
+            with self._urc_cond:
+                self.unsolicited.append(line)
+                self._urc_cond.notify_all()
+            for listener in list(self._urc_listeners):
+                listener(line)
+
+    def add_urc_listener(self, callback):
+        """Call callback(line) from the reader thread for every URC."""
+        self._urc_listeners.append(callback)
+
+    def remove_urc_listener(self, callback):
+        self._urc_listeners.remove(callback)
+
+    def send(self, cmd, timeout=DEFAULT_TIMEOUT, until=None):
+        """
+        Send AT command and wait for its final result code.
+
+        Args:
+            cmd: AT command string (without \\r\\n)
+            timeout: Ceiling in seconds; returns earlier on a final result
+            until: Optional marker (or tuple of markers) to wait for instead of
+                the first final result, e.g. 'ready' after AT+RST. An error
+                result still ends the wait.
+
+        Returns:
+            ATResponse (check .ok / .timed_out)
+        """
+        return self._transact(cmd, timeout, until, None)
+
+    def send_data(self, cmd, data, timeout=DEFAULT_TIMEOUT, until=None):
+        """
+        Send a command that answers with a '>' prompt, then its raw payload.
+
+        Used for AT+CIPSEND, AT+MQTTPUBRAW, AT+FWBUFDOWNLOAD and friends.
+        data may be bytes or a memoryview (e.g. a slice of an mmap).
+
+        Returns:
+            ATResponse for the whole exchange; if the modem refuses the
+            command the result is its error code and data is not sent
+        """
+        return self._transact(cmd, timeout, until, data)
+
+    def _transact(self, cmd, timeout, until, data):
+        if isinstance(until, str):
+            until = (until,)
+        if self.timeouts is not None and data is None:
+            timeout = self.timeouts.timeout_for(cmd, timeout, until)
+        response = ATResponse(cmd)
+        with self._cmd_lock:
+            self._current_done.clear()
+            self._current_until = until
+            self._expect_prompt = data is not None
+            self._current = response
+            response.sent_at = time.monotonic()
+            deadline = response.sent_at + timeout
+            self.ser.write(f"{cmd}\r\n".encode())
+            if self.hooks is not None:
+                self.hooks.write(response)
+            self._current_done.wait(timeout)
+            if data is not None and response.result == PROMPT.decode():
+                response.result = None
+                self._expect_prompt = False
+                self._current_done.clear()
+                self.ser.write(data)
+                self._current_done.wait(max(deadline - time.monotonic(), 0))
+            self._expect_prompt = False
+            self._current = None
+            if response.finished_at is None or response.result is None:
+                response.finished_at = time.monotonic()
+        if self.timeouts is not None and data is None:
+            self.timeouts.record(response, until)
+        if self.hooks is not None:
+            self.hooks.final(response)
+        return response
+
+    def set_baud(self, baud, rtscts=None):
+        """Change the host side UART rate (and optionally RTS/CTS) between commands."""
+        with self._cmd_lock:
+            self.ser.baudrate = baud
+            if rtscts is not None:
+                self.ser.rtscts = rtscts
+            self.ser.reset_input_buffer()
+
+    def wait_for(self, marker, timeout=DEFAULT_TIMEOUT):
+        """
+        Wait for a URC line containing marker (e.g. +TIME_UPDATED).
+
+        URCs already received are checked first and consumed on match.
+
+        Returns:
+            The matching line, or None on timeout
+        """
+        started = time.monotonic()
+        line = self._wait_for(marker, started + timeout)
+        if self.hooks is not None:
+            self.hooks.wait(marker, started, line)
+        return line
+
+    def _wait_for(self, marker, deadline):
+        with self._urc_cond:
+            while True:
+                for line in self.unsolicited:
+                    if marker in line:
+                        self.unsolicited.remove(line)
+                        return line
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._urc_cond.wait(remaining)
+
+    def close(self):
+        self._stop.set()
+        self._reader.join(timeout=1)
+        self.ser.close()
+        if self.timeouts is not None:
+            self.timeouts.save()
+        if self.hooks is not None:
+            self.hooks.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-command latency and end-to-end bring-up time.
+
+Runs one of the standard flows (the aws_with_certs.py bring-up, the
+stable_wifi_mqtt.py flow or the test_meminfo.py check) repeatedly against a
+board or the pty simulator, and records for every command the time from
+write to first byte and from write to final result code. Reports
+p50/p95/p99 per command and per stage, total wall time per run, and how
+much of the scripts' fixed sleeps was pure waiting. Results are saved as
+JSON so runs can be compared before and after a transport change.
+
+Usage:
+    python3 benchmark.py aws --port /dev/ttyUSB0 --runs 5
+    python3 benchmark.py aws --simulate --runs 20
+    python3 benchmark.py aws --simulate --compare bench_results/aws-20250601-101500.json
+
+Requirements:
+    pip install pyserial
+"""
+
+import argparse
+import json
+import os
+import time
+
+from at_transport import ATTransport, DEFAULT_BAUD, DEFAULT_PORT
+from bringup import AWS_CLIENT_ID, AWS_ENDPOINT, AWS_TOPIC, WIFI_PASSWORD, WIFI_SSID
+
+RESULTS_DIR = 'bench_results'
+
+
+class Step:
+    """
+    One benchmarked step of a flow.
+
+    Args:
+        stage: Stage name used for grouping (reset, wifi, sntp, ...)
+        cmd: AT command, or None for a pure URC wait
+        timeout: Ceiling for the command / wait
+        until: Marker to wait for instead of the final result
+        wait_urc: URC to wait for (when cmd is None)
+        legacy_delay: Fixed sleep the original script used for this step
+    """
+
+    def __init__(self, stage, cmd, timeout=2, until=None, wait_urc=None, legacy_delay=2):
+        self.stage = stage
+        self.cmd = cmd
+        self.timeout = timeout
+        self.until = until
+        self.wait_urc = wait_urc
+        self.legacy_delay = legacy_delay
+
+    @property
+    def label(self):
+        return self.cmd or f"(wait {self.wait_urc})"
+
+
+FLOWS = {
+    # aws_with_certs.py, with the delays it used
+    'aws': [
+        Step('reset', 'AT+RST', timeout=10, until='ready', legacy_delay=5),
+        Step('reset', 'AT'),
+        Step('wifi', 'AT+CWMODE=1'),
+        Step('wifi', f'AT+CWJAP="{WIFI_SSID}","{WIFI_PASSWORD}"', timeout=15, legacy_delay=15),
+        Step('wifi', 'AT+CIPSTA?'),
+        Step('sntp', 'AT+CIPSNTPCFG=1,0,"pool.ntp.org","time.google.com"', timeout=3, legacy_delay=3),
+        Step('sntp', None, timeout=10, wait_urc='+TIME_UPDATED', legacy_delay=5),
+        Step('sntp', 'AT+CIPSNTPTIME?'),
+        Step('mqtt_connect', f'AT+MQTTUSERCFG=0,5,"{AWS_CLIENT_ID}","","",0,0,""', timeout=3, legacy_delay=3),
+        Step('mqtt_connect', f'AT+MQTTSNI=0,"{AWS_ENDPOINT}"'),
+        Step('mqtt_connect', f'AT+MQTTCONN=0,"{AWS_ENDPOINT}",8883,1', timeout=15, legacy_delay=15),
+        Step('sub', f'AT+MQTTSUB=0,"{AWS_TOPIC}",0', timeout=3, legacy_delay=3),
+        Step('pub', f'AT+MQTTPUB=0,"{AWS_TOPIC}","test_from_c5",0,0', timeout=3, legacy_delay=3),
+    ],
+    # stable_wifi_mqtt.py
+    'wifi-mqtt': [
+        Step('reset', 'AT+RST', timeout=10, until='ready', legacy_delay=3),
+        Step('reset', 'AT'),
+        Step('wifi', 'AT+CWMODE=1'),
+        Step('wifi', f'AT+CWJAP="{WIFI_SSID}","{WIFI_PASSWORD}"', timeout=15, legacy_delay=15),
+        Step('wifi', 'AT+CIPSTA?'),
+        Step('dns', 'AT+CIPDOMAIN="test.mosquitto.org"', timeout=5, legacy_delay=5),
+        Step('mqtt_connect', 'AT+MQTTUSERCFG=0,1,"esp32c5_fov","","",0,0,""'),
+        Step('mqtt_connect', 'AT+MQTTCONN=0,"test.mosquitto.org",1883,0', timeout=10, legacy_delay=10),
+        Step('sub', 'AT+MQTTSUB=0,"fov/test",0', timeout=3, legacy_delay=3),
+        Step('pub', 'AT+MQTTPUB=0,"fov/test","hello_from_c5",0,0', timeout=3, legacy_delay=3),
+        Step('cleanup', 'AT+MQTTCLEAN=0'),
+    ],
+    # test_meminfo.py
+    'meminfo': [
+        Step('probe', 'AT', legacy_delay=0.15),
+        Step('probe', 'AT+FWMEMINFO', legacy_delay=0.15),
+    ],
+}
+
+
+def percentile(values, p):
+    """Linear-interpolated percentile of values (p in 0..100)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def summarize(values):
+    return {
+        'n': len(values),
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'max': max(values) if values else None,
+    }
+
+
+def run_flow(at, steps, iteration):
+    """Run one pass of a flow and return (samples, wall_time)."""
+    samples = []
+    start = time.monotonic()
+    for step in steps:
+        if step.cmd is None:
+            t0 = time.monotonic()
+            line = at.wait_for(step.wait_urc, timeout=step.timeout)
+            elapsed = time.monotonic() - t0
+            samples.append({
+                'iteration': iteration, 'stage': step.stage, 'command': step.label,
+                'first_byte': None, 'elapsed': elapsed,
+                'result': line, 'ok': line is not None,
+                'legacy_delay': step.legacy_delay,
+            })
+            continue
+        response = at.send(step.cmd, timeout=step.timeout, until=step.until)
+        samples.append({
+            'iteration': iteration, 'stage': step.stage, 'command': step.label,
+            'first_byte': response.first_byte, 'elapsed': response.elapsed,
+            'result': response.result, 'ok': response.ok,
+            'legacy_delay': step.legacy_delay,
+        })
+    return samples, time.monotonic() - start
+
+
+def build_report(flow, port, samples, walls):
+    commands = {}
+    stages = {}
+    for sample in samples:
+        entry = commands.setdefault(sample['command'], {'first_byte': [], 'elapsed': [],
+                                                        'legacy_delay': sample['legacy_delay'],
+                                                        'failures': 0})
+        if sample['first_byte'] is not None:
+            entry['first_byte'].append(sample['first_byte'])
+        entry['elapsed'].append(sample['elapsed'])
+        entry['failures'] += not sample['ok']
+        per_run = stages.setdefault(sample['stage'], {})
+        per_run[sample['iteration']] = per_run.get(sample['iteration'], 0) + sample['elapsed']
+
+    steps = FLOWS[flow]
+    legacy_total = sum(step.legacy_delay for step in steps)
+    return {
+        'flow': flow,
+        'port': port,
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'runs': len(walls),
+        'legacy_wall_time': legacy_total,
+        'wall_time': summarize(walls),
+        'stages': {name: summarize(list(per_run.values())) for name, per_run in stages.items()},
+        'commands': {
+            cmd: {
+                'first_byte': summarize(entry['first_byte']),
+                'elapsed': summarize(entry['elapsed']),
+                'legacy_delay': entry['legacy_delay'],
+                'failures': entry['failures'],
+            }
+            for cmd, entry in commands.items()
+        },
+        'samples': samples,
+    }
+
+
+def _ms(value):
+    return '     -' if value is None else f"{value * 1000:6.0f}"
+
+
+def print_report(report):
+    print(f"\n{'Command':<58} {'first byte p50/p95/p99 ms':>26}  {'final p50/p95/p99 ms':>22}  {'legacy':>6}")
+    print('-' * 118)
+    for cmd, entry in report['commands'].items():
+        fb, el = entry['first_byte'], entry['elapsed']
+        fail = f"  ({entry['failures']} failed)" if entry['failures'] else ''
+        print(f"{cmd[:58]:<58} {_ms(fb['p50'])}/{_ms(fb['p95'])}/{_ms(fb['p99'])}    "
+              f"{_ms(el['p50'])}/{_ms(el['p95'])}/{_ms(el['p99'])}  {entry['legacy_delay']:5.1f}s{fail}")
+    print("\nStage                 p50 ms   p95 ms   p99 ms")
+    for stage, s in report['stages'].items():
+        print(f"{stage:<20} {_ms(s['p50'])}   {_ms(s['p95'])}   {_ms(s['p99'])}")
+    wall = report['wall_time']
+    print(f"\nWall time over {report['runs']} run(s): p50 {wall['p50']:.2f}s  "
+          f"p95 {wall['p95']:.2f}s  max {wall['max']:.2f}s")
+    print(f"Fixed sleeps in the original script: {report['legacy_wall_time']:.1f}s")
+
+
+def print_comparison(report, baseline):
+    print(f"\nComparison against baseline from {baseline['started']}:")
+    for cmd, entry in report['commands'].items():
+        old = baseline['commands'].get(cmd)
+        if not old or old['elapsed']['p50'] is None:
+            continue
+        new_p50, old_p50 = entry['elapsed']['p50'], old['elapsed']['p50']
+        print(f"  {cmd[:58]:<58} {old_p50 * 1000:8.0f} -> {new_p50 * 1000:8.0f} ms "
+              f"({(new_p50 - old_p50) * 1000:+.0f})")
+    old_wall, new_wall = baseline['wall_time']['p50'], report['wall_time']['p50']
+    print(f"  {'wall time p50':<58} {old_wall:8.2f} -> {new_wall:8.2f} s  ({new_wall - old_wall:+.2f})")
+
+
+def save_report(report, directory=RESULTS_DIR):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{report['flow']}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def benchmark(flow, port, baud=DEFAULT_BAUD, runs=5):
+    samples = []
+    walls = []
+    with ATTransport.open(port, baud) as at:
+        for iteration in range(runs):
+            run_samples, wall = run_flow(at, FLOWS[flow], iteration)
+            samples.extend(run_samples)
+            walls.append(wall)
+            print(f"run {iteration + 1}/{runs}: {wall:.2f}s")
+    return build_report(flow, port, samples, walls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark AT command latency and bring-up time')
+    parser.add_argument('flow', choices=sorted(FLOWS))
+    parser.add_argument('--port', '-p', default=DEFAULT_PORT)
+    parser.add_argument('--baud', '-b', type=int, default=DEFAULT_BAUD)
+    parser.add_argument('--runs', '-n', type=int, default=5)
+    parser.add_argument('--simulate', action='store_true',
+                        help='Run against at_simulator instead of --port')
+    parser.add_argument('--compare', help='Baseline JSON report to compare against')
+    parser.add_argument('--out-dir', default=RESULTS_DIR)
+    args = parser.parse_args()
+
+    if args.simulate:
+        from at_simulator import SimulatedModem
+        with SimulatedModem(baud=args.baud) as modem:
+            report = benchmark(args.flow, modem.port, args.baud, args.runs)
+        report['port'] = 'simulator'
+    else:
+        report = benchmark(args.flow, args.port, args.baud, args.runs)
+
+    print_report(report)
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(report, json.load(f))
+    print(f"\nSaved {save_report(report, args.out_dir)}")
+
+
+if __name__ == "__main__":
+    main()
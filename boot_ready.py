@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Reset the C5 and wait exactly as long as it takes to become ready.
+
+with_reset.py asks for the reset button and sleeps 3 seconds,
+robust_test_at.py reads for up to 15 seconds looking for "ready", and the
+other scripts sleep 2 seconds after opening the port. This module resets
+the board through DTR/RTS where the auto-reset circuit is wired (or with
+AT+RST, or by asking for the button), streams the boot log as it arrives,
+picks out the ROM / IDF / AT firmware banner, and sends the first command
+the moment 'ready' is seen. If no boot log appears (lines not wired, board
+already running) it falls back to AT probes with exponential backoff.
+
+The time from reset to the first OK is reported so it can be tuned.
+
+Reset methods:
+    rts     EN pulsed low through RTS with IO0 (DTR) released - the esptool
+            auto-reset circuit on the DevKit and our carrier board
+    at      AT+RST (needs a responsive modem)
+    manual  ask for the reset button
+    none    don't reset, just wait for the modem to answer
+
+Usage:
+    python3 boot_ready.py [--port /dev/ttyUSB0] [--method rts] [--runs 5] [--log]
+    python3 boot_ready.py --simulate --method at --runs 10
+
+Requirements:
+    pip install pyserial
+"""
+
+import argparse
+import re
+import sys
+import threading
+import time
+
+import serial
+
+from at_transport import ATTransport, DEFAULT_BAUD, DEFAULT_PORT
+from benchmark import summarize
+
+RESET_METHODS = ('rts', 'at', 'manual', 'none')
+RESET_PULSE = 0.1  # seconds EN is held low
+BOOT_SILENCE = 0.5  # no boot log this long after a reset -> the board did not reset
+READY_TIMEOUT = 15
+PROBE_TIMEOUT = 0.2
+PROBE_BACKOFF = (0.02, 0.5)  # first and longest delay between AT probes
+
+# Boot log lines worth keeping, name -> regex (group 1 is the value)
+BANNER_PATTERNS = {
+    'rom': re.compile(r'^ESP-ROM:(\S+)'),
+    'reset_reason': re.compile(r'^rst:0x[0-9a-f]+ \(([A-Z_]+)\)'),
+    'idf': re.compile(r'ESP-IDF (v\S+)'),
+    'psram': re.compile(r'Found (\d+MB) PSRAM'),
+    'at_port': re.compile(r'^AT cmd port:(.*)$'),
+}
+
+
+class BootResult:
+    """What happened between reset and the first OK."""
+
+    def __init__(self, method):
+        self.method = method
+        self.log = []  # (seconds since reset, line)
+        self.banner = {}
+        self.ready_after = None  # seconds from reset to 'ready'
+        self.first_ok_after = None  # seconds from reset to the first OK
+        self.probes = 0
+
+    @property
+    def ok(self):
+        return self.first_ok_after is not None
+
+    def as_dict(self):
+        return {
+            'method': self.method,
+            'ready_after': self.ready_after,
+            'first_ok_after': self.first_ok_after,
+            'probes': self.probes,
+            'banner': self.banner,
+            'log_lines': len(self.log),
+        }
+
+
+def pulse_reset(ser, pulse=RESET_PULSE):
+    """
+    Reset through the esptool auto-reset circuit (RTS -> EN, DTR -> IO0).
+
+    DTR is released first so IO0 stays high and the chip boots the app
+    rather than the ROM download mode.
+    """
+    ser.dtr = False
+    ser.rts = True
+    time.sleep(pulse)
+    ser.rts = False
+
+
+def reset_board(at, method):
+    """Trigger a reset. Returns False if the method is not available on this port."""
+    if method == 'rts':
+        try:
+            pulse_reset(at.ser)
+        except (serial.SerialException, OSError) as e:
+            # No modem control lines (e.g. a pty or some USB bridges)
+            print(f"⚠️  DTR/RTS reset not possible ({e}), probing instead")
+            return False
+    elif method == 'at':
+        return at.send('AT+RST', timeout=1).ok
+    elif method == 'manual':
+        print("\n⚠️  PRESS THE RESET BUTTON ON THE C5 NOW!")
+    return method != 'none'
+
+
+def probe(at, deadline, result, started):
+    """AT probes with exponential backoff until OK or deadline. Returns True on OK."""
+    delay, longest = PROBE_BACKOFF
+    while True:
+        result.probes += 1
+        if at.send('AT', timeout=PROBE_TIMEOUT).ok:
+            result.first_ok_after = time.monotonic() - started
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, longest)
+
+
+def wait_until_ready(at, method='rts', timeout=READY_TIMEOUT, echo=False):
+    """
+    Reset the modem (per method) and return once it answers AT.
+
+    Args:
+        at: ATTransport
+        method: One of RESET_METHODS
+        timeout: Overall ceiling in seconds
+        echo: Print the boot log as it streams in
+
+    Returns:
+        BootResult (check .ok)
+    """
+    if method not in RESET_METHODS:
+        raise ValueError(f"method must be one of {RESET_METHODS}")
+    result = BootResult(method)
+    ready = threading.Event()
+    started = time.monotonic()
+
+    def on_line(line):
+        result.log.append((time.monotonic() - started, line))
+        if echo:
+            print(f"   | {line}")
+        for name, pattern in BANNER_PATTERNS.items():
+            match = pattern.search(line)
+            if match and name not in result.banner:
+                result.banner[name] = match.group(1).strip()
+        if line == 'ready':
+            result.ready_after = time.monotonic() - started
+            ready.set()
+
+    at.add_urc_listener(on_line)
+    try:
+        reset = reset_board(at, method)
+        started = time.monotonic()  # the reset has been released
+        deadline = started + timeout
+        if reset:
+            # A button press can come any time; an automatic reset logs within BOOT_SILENCE
+            silence = timeout if method == 'manual' else BOOT_SILENCE
+            if ready.wait(silence) or result.log:
+                ready.wait(max(deadline - time.monotonic(), 0))
+        probe(at, deadline, result, started)
+    finally:
+        at.remove_urc_listener(on_line)
+    return result
+
+
+def print_result(result):
+    banner = ', '.join(f"{k}={v}" for k, v in result.banner.items()) or 'no banner'
+    ready = f"{result.ready_after * 1000:.0f} ms" if result.ready_after is not None else 'not seen'
+    if result.ok:
+        print(f"✅ ready {ready}, first OK {result.first_ok_after * 1000:.0f} ms "
+              f"after reset ({result.probes} probe(s)); {banner}")
+    else:
+        print(f"❌ no AT response (ready {ready}, {result.probes} probes); {banner}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reset the C5 and measure time to first command')
+    parser.add_argument('--port', '-p', default=DEFAULT_PORT)
+    parser.add_argument('--baud', '-b', type=int, default=DEFAULT_BAUD)
+    parser.add_argument('--method', '-m', choices=RESET_METHODS, default='rts')
+    parser.add_argument('--runs', '-n', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=READY_TIMEOUT)
+    parser.add_argument('--log', action='store_true', help='Print the boot log')
+    parser.add_argument('--simulate', action='store_true', help='Run against at_simulator')
+    args = parser.parse_args()
+
+    modem = None
+    port = args.port
+    if args.simulate:
+        from at_simulator import SimulatedModem
+        modem = SimulatedModem(baud=args.baud)
+        port = modem.start()
+
+    try:
+        at = ATTransport.open(port, args.baud)
+    except serial.SerialException as e:
+        print(f"ERROR: Could not open serial port: {e}")
+        sys.exit(1)
+
+    results = []
+    with at:
+        if modem:
+            at.wait_for('ready', timeout=2)  # the simulator's power-on boot
+        for run in range(args.runs):
+            result = wait_until_ready(at, args.method, args.timeout, echo=args.log)
+            print_result(result)
+            results.append(result)
+            if not result.ok:
+                break
+    if modem:
+        modem.stop()
+
+    times = [r.first_ok_after for r in results if r.ok]
+    if len(times) > 1:
+        s = summarize(times)
+        print(f"\nTime to first command over {s['n']} resets: p50 {s['p50'] * 1000:.0f} ms, "
+              f"p95 {s['p95'] * 1000:.0f} ms, max {s['max'] * 1000:.0f} ms")
+    if len(times) < len(results) or not results:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+"""
+Declarative WiFi / SNTP / MQTT bring-up with dependency edges.
+
+aws_with_certs.py runs reset -> CWMODE -> CWJAP -> SNTP config -> wait ->
+SNTP query -> MQTTUSERCFG -> MQTTSNI -> MQTTCONN strictly in sequence. Most
+of these steps do not depend on each other: the MQTT user config, SNI and
+SNTP server config can go out before the join, and SNTP starts syncing as
+soon as the modem has an IP. So the time sync runs while the rest of the
+configuration is sent.
+
+A bring-up is a list of Stages. A stage has an optional command, the
+stages it must wait for (`after`), and optionally a URC that completes it
+(`event`, e.g. 'WIFI GOT IP' or '+TIME_UPDATED'). A stage is submitted to
+the ATEngine the moment its prerequisites are done. The engine still keeps
+one command on the wire, as ESP-AT requires, but the host never sits idle
+between steps, and nothing waits on a sleep. Each stage records when its
+prerequisites were met, when it went on the wire and when it finished, and
+print_timeline() draws that as a chart.
+
+Usage:
+    python3 bringup.py [--port /dev/ttyUSB0] --ssid tim --password password
+    python3 bringup.py --aws --reset            # aws_with_certs.py settings
+    python3 bringup.py --simulate --sntp --sub 'fov/#'
+
+From Python:
+    result = BringUp(engine, mqtt_stages(config, reset=True)).run()
+    print_timeline(result)
+
+Requirements:
+    pip install pyserial
+"""
+
+import argparse
+import sys
+import threading
+import time
+
+import serial
+
+from at_engine import ATEngine
+from at_transport import DEFAULT_BAUD, DEFAULT_PORT, quote
+
+SNTP_SERVERS = ('pool.ntp.org', 'time.google.com')
+DEFAULT_TIMEOUT = 60
+DONE = ('ok', 'skipped')  # statuses that satisfy a dependency
+
+# Defaults taken from the original scripts; the other tools import them from here
+WIFI_SSID = 'tim'
+WIFI_PASSWORD = 'password'
+AWS_ENDPOINT = 'a3lkzcadhi1yzr-ats.iot.eu-west-1.amazonaws.com'
+AWS_CLIENT_ID = 'aviva-fov-tablet-1'
+AWS_TOPIC = 'dalymount_IRL/pub'
+
+
+class Stage:
+    """
+    One step of a bring-up.
+
+    Args:
+        name: Unique stage name, used in `after` edges
+        cmd: AT command to send (None for a stage that only waits for an event)
+        after: Names of the stages that must finish first
+        event: URC prefix that must also be seen for the stage to finish.
+            For a stage with a command it must arrive after the command was
+            sent. For an event-only stage it may arrive any time during the
+            bring-up.
+        timeout: Ceiling in seconds for the command or, for event-only stages,
+            for the event once the prerequisites are done
+        until: Passed to ATEngine.submit (e.g. 'ready' for AT+RST)
+        check: Optional callable(response) run on an OK response; returns an
+            error string to fail the stage, or None
+        retries: Extra attempts after a failed command, check or event
+        retry_delay: Seconds between attempts
+    """
+
+    def __init__(self, name, cmd=None, after=(), event=None, timeout=5, until=None,
+                 check=None, retries=0, retry_delay=0.5):
+        self.name = name
+        self.cmd = cmd
+        self.after = tuple(after)
+        self.event = event
+        self.timeout = timeout
+        self.until = until
+        self.check = check
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.attempts = 0
+        self.attempt_at = None
+        self.retry_at = None
+        # Timeline, seconds since the bring-up started
+        self.ready_at = None   # prerequisites done
+        self.sent_at = None    # command on the wire
+        self.done_at = None
+        self.status = 'pending'  # pending, running, ok, skipped, failed, blocked
+        self.error = None
+        self.response = None
+
+    @property
+    def finished(self):
+        return self.status in ('ok', 'skipped', 'failed', 'blocked')
+
+    def command(self):
+        """The command to put on the wire; called when the stage is submitted."""
+        return self.cmd
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, {self.cmd!r}, status={self.status!r})"
+
+
+class BringUpResult:
+    """Stages with their timeline after BringUp.run()."""
+
+    def __init__(self, stages, elapsed):
+        self.stages = stages
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return all(s.status in DONE for s in self.stages)
+
+    @property
+    def failed(self):
+        return [s for s in self.stages if s.status not in DONE]
+
+    @property
+    def skipped(self):
+        return [s.name for s in self.stages if s.status == 'skipped']
+
+    def as_dict(self):
+        return {
+            'ok': self.ok,
+            'elapsed': self.elapsed,
+            'stages': [{'name': s.name, 'cmd': s.cmd, 'status': s.status, 'error': s.error,
+                        'ready_at': s.ready_at, 'sent_at': s.sent_at, 'done_at': s.done_at}
+                       for s in self.stages],
+        }
+
+
+class BringUp:
+    """
+    Runs Stages over an ATEngine as soon as their dependencies allow.
+
+    Args:
+        engine: ATEngine
+        stages: Stages in the order they should be submitted when several are ready
+        satisfied: Names of stages already in effect on the modem (e.g. WiFi
+            still joined after an MQTT drop); they are marked skipped and count
+            as done. Names not in the plan are ignored.
+
+    Raises:
+        ValueError for unknown dependencies, duplicate names or cycles
+    """
+
+    def __init__(self, engine, stages, satisfied=()):
+        self.engine = engine
+        self.stages = list(stages)
+        self.satisfied = set(satisfied)
+        self._by_name = {s.name: s for s in self.stages}
+        if len(self._by_name) != len(self.stages):
+            raise ValueError("duplicate stage names")
+        for stage in self.stages:
+            unknown = [d for d in stage.after if d not in self._by_name]
+            if unknown:
+                raise ValueError(f"stage {stage.name!r} depends on unknown {unknown}")
+        self._check_cycles()
+        self._cond = threading.Condition()
+        self._events = {}  # URC prefix -> times seen (seconds since start)
+        self._start = None
+
+    def _check_cycles(self):
+        state = {}
+
+        def visit(name, path):
+            if state.get(name) == 'done':
+                return
+            if state.get(name) == 'visiting':
+                raise ValueError(f"dependency cycle: {' -> '.join(path + [name])}")
+            state[name] = 'visiting'
+            for dep in self._by_name[name].after:
+                visit(dep, path + [name])
+            state[name] = 'done'
+
+        for stage in self.stages:
+            visit(stage.name, [])
+
+    def _now(self):
+        return time.monotonic() - self._start
+
+    def _on_urc(self, line):
+        with self._cond:
+            now = self._now()
+            for stage in self.stages:
+                if stage.event and line.startswith(stage.event):
+                    self._events.setdefault(stage.event, []).append(now)
+            self._cond.notify_all()
+
+    def _event_seen(self, stage):
+        since = stage.sent_at if stage.cmd else 0
+        return any(t >= since for t in self._events.get(stage.event, ()))
+
+    def _on_response(self, stage, future):
+        with self._cond:
+            try:
+                response = future.result()
+            except Exception as e:
+                response = None
+                stage.error = str(e)
+            stage.response = response
+            if response is not None:
+                if response.sent_at is not None:
+                    stage.sent_at = response.sent_at - self._start
+                if not response.ok:
+                    stage.error = response.result or 'timeout'
+                elif stage.check:
+                    stage.error = stage.check(response)
+            if stage.error:
+                self._fail(stage, stage.error)
+            self._cond.notify_all()
+
+    def _finish(self, stage, status):
+        stage.status = status
+        stage.done_at = self._now()
+
+    def _fail(self, stage, error):
+        """Fail the stage, or put it back to pending if it has retries left."""
+        if stage.attempts <= stage.retries:
+            stage.status = 'pending'
+            stage.retry_at = self._now() + stage.retry_delay
+            stage.response = None
+            stage.error = None
+        else:
+            stage.error = error
+            self._finish(stage, 'failed')
+
+    def _step(self):
+        """Advance every stage that can move. Called with the condition held."""
+        now = self._now()
+        for stage in self.stages:
+            if stage.finished:
+                continue
+            deps = [self._by_name[d] for d in stage.after]
+            if any(d.status in ('failed', 'blocked') for d in deps):
+                stage.error = 'dependency failed'
+                self._finish(stage, 'blocked')
+                continue
+            if stage.status == 'pending':
+                if not all(d.status in DONE for d in deps):
+                    continue
+                if stage.retry_at is not None and now < stage.retry_at:
+                    continue
+                if stage.ready_at is None:
+                    stage.ready_at = now
+                stage.attempt_at = now
+                stage.status = 'running'
+                stage.attempts += 1
+                if stage.cmd:
+                    future = self.engine.submit(stage.command(), timeout=stage.timeout, until=stage.until)
+                    future.add_done_callback(lambda f, s=stage: self._on_response(s, f))
+            # running
+            command_done = not stage.cmd or (stage.response is not None and stage.response.ok)
+            if not command_done:
+                continue
+            if stage.event is None or self._event_seen(stage):
+                self._finish(stage, 'ok')
+            elif now - (stage.sent_at if stage.cmd else stage.attempt_at) > stage.timeout:
+                self._fail(stage, f"no {stage.event}")
+
+    def run(self, timeout=DEFAULT_TIMEOUT):
+        """
+        Run all stages.
+
+        Args:
+            timeout: Overall ceiling in seconds; unfinished stages are marked failed
+
+        Returns:
+            BringUpResult
+        """
+        self._start = time.monotonic()
+        for stage in self.stages:
+            if stage.name in self.satisfied:
+                stage.status = 'skipped'
+        self.engine.transport.add_urc_listener(self._on_urc)
+        try:
+            with self._cond:
+                while True:
+                    before = None
+                    # Finishing one stage can make others ready; loop until nothing moves
+                    while before != [s.status for s in self.stages]:
+                        before = [s.status for s in self.stages]
+                        self._step()
+                    if all(s.finished for s in self.stages):
+                        break
+                    if self._now() > timeout:
+                        for stage in self.stages:
+                            if not stage.finished:
+                                stage.error = 'bring-up timeout'
+                                self._finish(stage, 'failed')
+                        break
+                    # Wake on responses/URCs, or to check event timeouts
+                    self._cond.wait(0.1)
+        finally:
+            self.engine.transport.remove_urc_listener(self._on_urc)
+        return BringUpResult(self.stages, self._now())
+
+
+class BridgeConfig:
+    """WiFi and MQTT settings mqtt_stages() brings up (and the bridge reconnects with)."""
+
+    def __init__(self, ssid=WIFI_SSID, password=WIFI_PASSWORD, broker='test.mosquitto.org',
+                 broker_port=1883, scheme=1, client_id='esp32c5_bridge', sni=None,
+                 sntp=False, username='', mqtt_password=''):
+        self.ssid = ssid
+        self.password = password
+        self.broker = broker
+        self.broker_port = broker_port
+        self.scheme = scheme
+        self.client_id = client_id
+        self.sni = sni
+        self.sntp = sntp
+        self.username = username
+        self.mqtt_password = mqtt_password
+
+
+def mqtt_stages(config, subscriptions=(), reset=False, reconnect=1):
+    """
+    The aws_with_certs.py sequence as a dependency graph.
+
+    Args:
+        config: BridgeConfig
+        subscriptions: Topic filters to subscribe once connected
+        reset: Start with AT+RST
+        reconnect: AT+MQTTCONN reconnect flag (0 when the host supervises the link)
+
+    Returns:
+        list of Stage
+    """
+    c = config
+    stages = []
+    first = ()
+    if reset:
+        stages.append(Stage('reset', 'AT+RST', until='ready', timeout=10))
+        first = ('reset',)
+    stages += [
+        Stage('at', 'AT', after=first),
+        Stage('mode', 'AT+CWMODE=1', after=('at',)),
+    ]
+    mqtt_deps = ['wifi', 'user', 'at']
+    # The join holds the AT channel for seconds; the short config commands
+    # are ordered before it so they don't queue behind it
+    join_after = ['mode', 'user']
+    if c.sntp:
+        # Configured before the join so the sync starts the moment there is an IP
+        servers = ','.join(quote(s) for s in SNTP_SERVERS)
+        stages.append(Stage('sntp', f'AT+CIPSNTPCFG=1,0,{servers}', after=('at',)))
+        join_after.append('sntp')
+    stages.append(Stage('user', f'AT+MQTTUSERCFG=0,{c.scheme},{quote(c.client_id)},'
+                                f'{quote(c.username)},{quote(c.mqtt_password)},0,0,""', after=('at',)))
+    if c.sni:
+        stages.append(Stage('sni', f'AT+MQTTSNI=0,{quote(c.sni)}', after=('user',)))
+        mqtt_deps.append('sni')
+        join_after.append('sni')
+    stages.append(Stage('wifi', f'AT+CWJAP={quote(c.ssid)},{quote(c.password)}', after=join_after,
+                        event='WIFI GOT IP', timeout=20))
+    if c.sntp:
+        # TLS certificate validation needs the time
+        stages.append(Stage('time', after=('sntp', 'wifi'), event='+TIME_UPDATED', timeout=15))
+        mqtt_deps.append('time')
+    stages.append(Stage('mqtt', f'AT+MQTTCONN=0,{quote(c.broker)},{c.broker_port},{reconnect}',
+                        after=mqtt_deps, event='+MQTTCONNECTED', timeout=20))
+    for i, topic in enumerate(subscriptions):
+        stages.append(Stage(f'sub{i}', f'AT+MQTTSUB=0,{quote(topic)},0', after=('mqtt',)))
+    return stages
+
+
+def print_timeline(result, width=40):
+    """Per-stage table with a bar from prerequisites met (.) through on the wire (#) to done."""
+    scale = width / result.elapsed if result.elapsed else 0
+    names = max([8] + [len(s.name) for s in result.stages])
+    print(f"{'Stage':<{names}} {'ready':>7} {'sent':>7} {'done':>7}  timeline")
+    for s in result.stages:
+        def ms(t):
+            return f"{t * 1000:6.0f}ms" if t is not None else '      -'
+
+        bar = ''
+        if s.ready_at is not None:
+            end = s.done_at if s.done_at is not None else result.elapsed
+            sent = s.sent_at if s.sent_at is not None else s.ready_at
+            lead = int(s.ready_at * scale)
+            queued = max(int(sent * scale) - lead, 0)
+            bar = ' ' * lead + '.' * queued + '#' * max(int(end * scale) - lead - queued, 1)
+        mark = {'ok': '✅', 'skipped': '➖', 'failed': '❌', 'blocked': '⏭️'}.get(s.status, '⏳')
+        note = f" {s.error}" if s.error else (' already satisfied' if s.status == 'skipped' else '')
+        print(f"{s.name:<{names}} {ms(s.ready_at)} {ms(s.sent_at)} {ms(s.done_at)}  |{bar:<{width}}| {mark}{note}")
+    print(f"\nTotal {result.elapsed:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bring up WiFi, SNTP and MQTT with dependency ordering')
+    parser.add_argument('--port', '-p', default=DEFAULT_PORT)
+    parser.add_argument('--baud', '-b', type=int, default=DEFAULT_BAUD)
+    parser.add_argument('--ssid', default=WIFI_SSID)
+    parser.add_argument('--password', default=WIFI_PASSWORD)
+    parser.add_argument('--broker', default='test.mosquitto.org')
+    parser.add_argument('--broker-port', type=int, default=1883)
+    parser.add_argument('--scheme', type=int, default=1, help='AT+MQTTUSERCFG scheme (1 = TCP)')
+    parser.add_argument('--client-id', default='esp32c5_bringup')
+    parser.add_argument('--sntp', action='store_true', help='Sync time before connecting')
+    parser.add_argument('--aws', action='store_true', help='Use the AWS IoT settings from aws_with_certs.py')
+    parser.add_argument('--sub', action='append', default=[], help='Topic to subscribe (repeatable)')
+    parser.add_argument('--reset', action='store_true', help='Start with AT+RST')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT)
+    parser.add_argument('--simulate', action='store_true', help='Run against at_simulator')
+    args = parser.parse_args()
+
+    if args.aws:
+        config = BridgeConfig(args.ssid, args.password, AWS_ENDPOINT, 8883, scheme=5,
+                              client_id=AWS_CLIENT_ID, sni=AWS_ENDPOINT, sntp=True)
+    else:
+        config = BridgeConfig(args.ssid, args.password, args.broker, args.broker_port,
+                              scheme=args.scheme, client_id=args.client_id, sntp=args.sntp)
+
+    modem = None
+    port = args.port
+    if args.simulate:
+        from at_simulator import SimulatedModem
+        modem = SimulatedModem()
+        port = modem.start()
+
+    try:
+        engine = ATEngine.open(port, args.baud)
+    except serial.SerialException as e:
+        print(f"ERROR: Could not open serial port: {e}")
+        sys.exit(1)
+
+    try:
+        if modem:
+            engine.transport.wait_for('ready', timeout=2)
+        bringup = BringUp(engine, mqtt_stages(config, args.sub, reset=args.reset))
+        result = bringup.run(args.timeout)
+    finally:
+        engine.close()
+        if modem:
+            modem.stop()
+
+    print_timeline(result)
+    if not result.ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
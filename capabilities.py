@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Firmware capability cache: which AT commands does this C5 build support?
+
+at_aws_iot.py, test_mqtt.py, init_and_mqtt.py and list_at_commands.py used
+to probe AT+CMD? and every AT+MQTT*=? on each run. This module parses
+AT+CMD? once into a command table and stores it on disk under the firmware
+identity from AT+GMR. After that, the only command sent is AT+GMR, which
+is needed to spot a reflash. The AT+CMD? probe runs again only when the
+firmware changes.
+
+AT+CMD? lines look like
+    +CMD:<index>,"<name>",<test>,<query>,<set>,<execute>
+where name is "+MQTTPUB" on ESP-AT ("AT+MQTTPUB" is accepted too) and the
+flags say which of the =?, ?, = and bare forms exist.
+
+Usage:
+    python3 capabilities.py [--port /dev/ttyUSB0] [--refresh] [--list]
+    python3 capabilities.py --require mqtt,ssl     # exit 1 if missing
+
+From Python:
+    caps = discover(at)
+    if caps.has('mqtt'): ...
+
+Requirements:
+    pip install pyserial
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import serial
+
+from at_parsers import CmdInfo, parse_lines
+from at_transport import ATTransport, DEFAULT_BAUD, DEFAULT_PORT
+from json_cache import load_json, save_json
+from latency_model import firmware_key
+
+DEFAULT_PATH = os.environ.get('FOV_AT_CAPABILITIES',
+                              os.path.expanduser('~/.cache/fov-at/capabilities.json'))
+CMD_LIST_TIMEOUT = 5  # AT+CMD? prints a few hundred lines
+
+# Feature name -> commands that must all be present
+FEATURES = {
+    # The at_aws_iot.py MQTT_TESTS set
+    'mqtt': ('AT+MQTTUSERCFG', 'AT+MQTTCONNCFG', 'AT+MQTTCONN', 'AT+MQTTSUB',
+             'AT+MQTTPUB', 'AT+MQTTCLEAN'),
+    'mqttpubraw': ('AT+MQTTPUBRAW',),
+    'ssl': ('AT+CIPSSLCCONF',),
+    'sntp': ('AT+CIPSNTPCFG', 'AT+CIPSNTPTIME'),
+    'uart_cur': ('AT+UART_CUR',),
+    'fwmeminfo': ('AT+FWMEMINFO',),
+    'fwbuf': ('AT+FWBUFDOWNLOAD', 'AT+FWBUFSTATUS', 'AT+FWBUFCLEAR'),
+}
+
+def parse_cmd_list(lines):
+    """
+    Parse AT+CMD? output into a command table.
+
+    Returns:
+        dict of 'AT+NAME' -> {'test': bool, 'query': bool, 'set': bool, 'execute': bool}
+    """
+    table = {}
+    for record in parse_lines(lines):
+        if not isinstance(record, CmdInfo):
+            continue
+        name = record.name.upper()
+        if not name.startswith('AT'):
+            name = 'AT' + name
+        table[name] = {'test': record.test, 'query': record.query,
+                       'set': record.set, 'execute': record.execute}
+    return table
+
+
+class Capabilities:
+    """Command table for one firmware build."""
+
+    def __init__(self, firmware, commands, probed_at=None, cached=False):
+        self.firmware = firmware
+        self.commands = commands
+        self.probed_at = probed_at or time.strftime('%Y-%m-%dT%H:%M:%S')
+        self.cached = cached
+
+    def supports(self, command, form=None):
+        """
+        True if the firmware has command (e.g. 'AT+MQTTPUB').
+
+        Args:
+            form: Optionally require 'test', 'query', 'set' or 'execute'
+        """
+        entry = self.commands.get(command.upper())
+        if entry is None:
+            return False
+        return entry[form] if form else True
+
+    def has(self, feature):
+        """True if every command of a FEATURES entry is supported."""
+        return all(self.supports(cmd) for cmd in FEATURES[feature])
+
+    def features(self):
+        return {name: self.has(name) for name in FEATURES}
+
+    def as_dict(self):
+        return {'probed_at': self.probed_at, 'commands': self.commands}
+
+
+def load_cache(path=DEFAULT_PATH):
+    return load_json(path, 'capability cache')
+
+
+def save_cache(cache, path=DEFAULT_PATH):
+    save_json(cache, path)
+
+
+def discover(at, path=DEFAULT_PATH, refresh=False):
+    """
+    Return the Capabilities of the connected modem, probing only on a cache miss.
+
+    Args:
+        at: ATTransport
+        path: Cache file
+        refresh: Ignore the cache and probe again
+
+    Raises:
+        RuntimeError if AT+GMR or AT+CMD? fails
+    """
+    gmr = at.send('AT+GMR')
+    if not gmr.ok:
+        raise RuntimeError(f"AT+GMR failed: {gmr.result or 'timeout'}")
+    firmware = firmware_key(gmr.lines)
+    cache = load_cache(path)
+    entry = cache.get(firmware)
+    if entry and not refresh:
+        return Capabilities(firmware, entry['commands'], entry['probed_at'], cached=True)
+
+    response = at.send('AT+CMD?', timeout=CMD_LIST_TIMEOUT)
+    commands = parse_cmd_list(response.lines)
+    if not response.ok or not commands:
+        raise RuntimeError(f"AT+CMD? failed: {response.result or 'timeout'}")
+    caps = Capabilities(firmware, commands)
+    cache[firmware] = caps.as_dict()
+    save_cache(cache, path)
+    return caps
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Show (cached) firmware AT command support')
+    parser.add_argument('--port', '-p', default=DEFAULT_PORT)
+    parser.add_argument('--baud', '-b', type=int, default=DEFAULT_BAUD)
+    parser.add_argument('--file', default=DEFAULT_PATH, help=f'Cache file (default {DEFAULT_PATH})')
+    parser.add_argument('--refresh', action='store_true', help='Probe even if cached')
+    parser.add_argument('--list', action='store_true', help='Print the full command table')
+    parser.add_argument('--require', help=f"Comma separated features ({', '.join(FEATURES)})")
+    args = parser.parse_args()
+    required = args.require.split(',') if args.require else []
+    unknown = [f for f in required if f not in FEATURES]
+    if unknown:
+        parser.error(f"unknown feature(s): {', '.join(unknown)}")
+
+    try:
+        at = ATTransport.open(args.port, args.baud)
+    except serial.SerialException as e:
+        print(f"ERROR: Could not open serial port: {e}")
+        sys.exit(1)
+
+    with at:
+        start = time.monotonic()
+        try:
+            caps = discover(at, args.file, args.refresh)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        elapsed = time.monotonic() - start
+
+    source = 'cache' if caps.cached else 'AT+CMD?'
+    print(f"Firmware: {caps.firmware}")
+    print(f"{len(caps.commands)} commands from {source} (probed {caps.probed_at}) in {elapsed * 1000:.0f} ms\n")
+    if args.list:
+        for name, forms in sorted(caps.commands.items()):
+            flags = ''.join(c if forms[f] else '-' for c, f in
+                            (('T', 'test'), ('Q', 'query'), ('S', 'set'), ('E', 'execute')))
+            print(f"  {flags}  {name}")
+        print()
+    for name, present in caps.features().items():
+        print(f"  {'✅' if present else '❌'} {name}")
+
+    missing = [f for f in required if not caps.has(f)]
+    if missing:
+        print(f"\n❌ Missing required features: {', '.join(missing)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Export device sessions as Chrome trace-event JSON (open in ui.perfetto.dev).
+
+Reading the printed >>> / --- blocks of a slow bring-up does not show where
+the time goes. This module records each command as a span from write to
+final result, with a nested span for the wait before the first byte. URCs
+are instant events, and every wait_for() and time.sleep() is recorded as
+a host-side span. Each device gets its own process track, so parallel
+runs (station_runner.py, several simulators) line up on one timeline,
+and the idle gaps and the sleeps that overlap nothing stand out.
+
+Each device has three tracks:
+    commands   one span per AT command (args: result, first byte, lines)
+    urcs       instant events (WIFI GOT IP, +TIME_UPDATED, ...)
+    host       wait_for() spans
+Sleeps go on a 'host sleeps' process, one track per thread, named by the
+file:line that slept.
+
+Usage:
+    python3 chrome_trace.py run trace.json aws_with_certs.py       # any script
+    python3 chrome_trace.py run trace.json station_runner.py meminfo
+    python3 chrome_trace.py merge trace.json a.jsonl b.jsonl      # FOV_AT_TRACE files
+    python3 chrome_trace.py demo trace.json --devices 3 --legacy    # simulators, fixed sleeps
+
+    FOV_AT_CHROME_TRACE=trace.json python3 test_meminfo.py        # same as run
+
+Requirements:
+    pip install pyserial
+"""
+
+import argparse
+import atexit
+import json
+import os
+import runpy
+import sys
+import threading
+import time
+
+# monotonic -> wall clock microseconds, so traces of several processes line up
+_OFFSET = time.time() - time.monotonic()
+SLEEP_PID = 1  # device tracks start at 2
+TID_COMMANDS, TID_URCS, TID_HOST = 1, 2, 3
+
+
+def _us(monotonic):
+    return round((monotonic + _OFFSET) * 1e6)
+
+
+class TraceFile:
+    """
+    Trace events for one output file, shared by every device in the process.
+
+    Written when the process exits (and by write() on demand).
+    """
+
+    _files = {}
+    _files_lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+        self.events = []
+        self._lock = threading.Lock()
+        self._next_pid = SLEEP_PID + 1
+        self._sleep_threads = set()
+        atexit.register(self.write)
+
+    @classmethod
+    def get(cls, path):
+        with cls._files_lock:
+            if path not in cls._files:
+                cls._files[path] = cls(path)
+            return cls._files[path]
+
+    def add(self, event):
+        with self._lock:
+            self.events.append(event)
+
+    def new_device(self, name):
+        """Allocate a process id with named commands / urcs / host tracks."""
+        with self._lock:
+            pid = self._next_pid
+            self._next_pid += 1
+        self._name(pid, name, {TID_COMMANDS: 'commands', TID_URCS: 'urcs', TID_HOST: 'host'})
+        return pid
+
+    def _name(self, pid, name, threads):
+        self.add({'ph': 'M', 'name': 'process_name', 'pid': pid, 'args': {'name': name}})
+        self.add({'ph': 'M', 'name': 'process_sort_index', 'pid': pid, 'args': {'sort_index': pid}})
+        for tid, thread in threads.items():
+            self.add({'ph': 'M', 'name': 'thread_name', 'pid': pid, 'tid': tid, 'args': {'name': thread}})
+
+    def sleep(self, started, seconds, where):
+        tid = threading.get_ident() % 100000
+        with self._lock:
+            first = not self._sleep_threads
+            new = tid not in self._sleep_threads
+            self._sleep_threads.add(tid)
+        if first:
+            self._name(SLEEP_PID, 'host sleeps', {})
+        if new:
+            self.add({'ph': 'M', 'name': 'thread_name', 'pid': SLEEP_PID, 'tid': tid,
+                      'args': {'name': threading.current_thread().name}})
+        self.add({'ph': 'X', 'name': f'sleep {seconds:g}s', 'cat': 'sleep', 'pid': SLEEP_PID, 'tid': tid,
+                  'ts': _us(started), 'dur': round(seconds * 1e6), 'args': {'where': where}})
+
+    def write(self):
+        with self._lock:
+            events = list(self.events)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        os.replace(tmp, self.path)
+
+
+class ChromeTrace:
+    """
+    at_metrics sink that records one device's session into a TraceFile.
+
+    Args:
+        trace: Output path or TraceFile
+        device: Track name (the port)
+    """
+
+    def __init__(self, trace, device=None):
+        self.trace = TraceFile.get(trace) if isinstance(trace, str) else trace
+        self.pid = self.trace.new_device(device or 'device')
+
+    def final(self, response):
+        if response.sent_at is None:
+            return
+        args = {'result': response.result or 'timeout', 'lines': response.lines[:20]}
+        if response.first_byte is not None:
+            args['first_byte_ms'] = round(response.first_byte * 1000, 3)
+        self.trace.add({'ph': 'X', 'name': response.command, 'cat': 'command', 'pid': self.pid,
+                        'tid': TID_COMMANDS, 'ts': _us(response.sent_at),
+                        'dur': round((response.elapsed or 0) * 1e6), 'args': args})
+        if response.first_byte_at is not None:
+            self.trace.add({'ph': 'X', 'name': 'until first byte', 'cat': 'first_byte', 'pid': self.pid,
+                            'tid': TID_COMMANDS, 'ts': _us(response.sent_at),
+                            'dur': round(response.first_byte * 1e6)})
+
+    def urc(self, line, at):
+        self.trace.add({'ph': 'i', 's': 't', 'name': line[:60], 'cat': 'urc', 'pid': self.pid,
+                        'tid': TID_URCS, 'ts': _us(at)})
+
+    def wait(self, marker, started, line):
+        self.trace.add({'ph': 'X', 'name': f'wait_for {marker}', 'cat': 'wait', 'pid': self.pid,
+                        'tid': TID_HOST, 'ts': _us(started), 'dur': round((time.monotonic() - started) * 1e6),
+                        'args': {'matched': line}})
+
+    def close(self):
+        self.trace.write()
+
+
+def trace_sleeps(trace, ignore=('at_simulator.py',)):
+    """
+    Record every time.sleep() as a span on the 'host sleeps' track.
+
+    Args:
+        trace: TraceFile to record into
+        ignore: Calling files whose sleeps are not host waits (the
+            simulator's sleeps model the device, not the script)
+
+    Returns:
+        A function that restores the original time.sleep
+    """
+    original = time.sleep
+
+    def sleep(seconds):
+        frame = sys._getframe(1)
+        filename = os.path.basename(frame.f_code.co_filename)
+        started = time.monotonic()
+        original(seconds)
+        if filename not in ignore:
+            trace.sleep(started, seconds, f"{filename}:{frame.f_lineno}")
+
+    time.sleep = sleep
+    return lambda: setattr(time, 'sleep', original)
+
+
+def from_jsonl(trace, path):
+    """Add the events of an at_metrics FOV_AT_TRACE file as one device."""
+    device = ChromeTrace(trace, os.path.splitext(os.path.basename(path))[0])
+    current = None
+    with open(path) as f:
+        for raw in f:
+            event = json.loads(raw)
+            ts = round(event['t'] * 1e6)
+            kind = event['ev']
+            if kind == 'write':
+                current = {'cmd': event['cmd'], 'ts': ts, 'first_byte': None}
+            elif kind == 'first_byte' and current:
+                current['first_byte'] = event['delay']
+            elif kind == 'final':
+                start = current['ts'] if current else ts - round((event['elapsed'] or 0) * 1e6)
+                args = {'result': event['result'] or 'timeout'}
+                if current and current['first_byte'] is not None:
+                    args['first_byte_ms'] = round(current['first_byte'] * 1000, 3)
+                trace.add({'ph': 'X', 'name': event['cmd'], 'cat': 'command', 'pid': device.pid,
+                           'tid': TID_COMMANDS, 'ts': start, 'dur': ts - start, 'args': args})
+                current = None
+            elif kind == 'urc':
+                trace.add({'ph': 'i', 's': 't', 'name': event['line'][:60], 'cat': 'urc',
+                           'pid': device.pid, 'tid': TID_URCS, 'ts': ts})
+            elif kind == 'wait':
+                trace.add({'ph': 'X', 'name': f"wait_for {event['marker']}", 'cat': 'wait',
+                           'pid': device.pid, 'tid': TID_HOST, 'ts': ts,
+                           'dur': round(event['elapsed'] * 1e6), 'args': {'matched': event['line']}})
+
+
+def merge_chrome(trace, path):
+    """Add the devices of another Chrome trace file, renumbering their pids."""
+    with open(path) as f:
+        events = json.load(f)['traceEvents']
+    pids = {}
+    for event in events:
+        if event['pid'] not in pids:
+            pids[event['pid']] = trace._next_pid
+            trace._next_pid += 1
+        trace.add(dict(event, pid=pids[event['pid']]))
+
+
+def summarize(trace):
+    """Busy time per device and total host sleep, from the recorded spans."""
+    busy = {}
+    names = {}
+    slept = 0
+    for event in trace.events:
+        if event['ph'] == 'M' and event['name'] == 'process_name':
+            names[event['pid']] = event['args']['name']
+        elif event['ph'] == 'X' and event.get('cat') == 'command':
+            busy[event['pid']] = busy.get(event['pid'], 0) + event['dur']
+        elif event['ph'] == 'X' and event.get('cat') == 'sleep':
+            slept += event['dur']
+    return {names.get(pid, pid): us / 1e6 for pid, us in busy.items()}, slept / 1e6
+
+
+def _demo_device(trace, modem, legacy, results, index):
+    """Run the benchmark aws flow on one simulated board, optionally with the fixed sleeps."""
+    from at_transport import ATTransport
+    from at_metrics import Instruments
+    from benchmark import FLOWS
+
+    with ATTransport.open(modem.port, hooks=Instruments([ChromeTrace(trace, f'sim{index} {modem.port}')])) as at:
+        at.wait_for('ready', timeout=2)
+        start = time.monotonic()
+        for step in FLOWS['aws']:
+            if step.cmd is None:
+                at.wait_for(step.wait_urc, timeout=step.timeout)
+            else:
+                at.send(step.cmd, timeout=step.timeout, until=step.until)
+            if legacy:
+                time.sleep(step.legacy_delay * legacy)  # what the original script did
+        results[index] = time.monotonic() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Chrome trace-event export of AT sessions')
+    sub = parser.add_subparsers(dest='action', required=True)
+    p = sub.add_parser('run', help='Run a script with tracing enabled')
+    p.add_argument('out')
+    p.add_argument('script')
+    p.add_argument('args', nargs=argparse.REMAINDER)
+    p = sub.add_parser('merge', help='Combine FOV_AT_TRACE .jsonl and Chrome .json files')
+    p.add_argument('out')
+    p.add_argument('inputs', nargs='+')
+    p = sub.add_parser('demo', help='Trace the aws flow on simulated boards in parallel')
+    p.add_argument('out')
+    p.add_argument('--devices', '-n', type=int, default=2)
+    p.add_argument('--legacy', action='store_true', help="Add the original scripts' fixed sleeps")
+    p.add_argument('--scale', type=float, default=1.0, help='Multiply the legacy sleeps (e.g. 0.1 for a quick look)')
+    args = parser.parse_args()
+
+    # at_metrics imports this file as 'chrome_trace'; share that module's registry
+    from chrome_trace import TraceFile
+    trace = TraceFile.get(args.out)
+    if args.action == 'run':
+        os.environ['FOV_AT_CHROME_TRACE'] = args.out
+        restore = trace_sleeps(trace)
+        sys.argv = [args.script] + args.args
+        try:
+            runpy.run_path(args.script, run_name='__main__')
+        except SystemExit:
+            pass
+        finally:
+            restore()
+    elif args.action == 'merge':
+        for path in args.inputs:
+            if path.endswith('.jsonl'):
+                from_jsonl(trace, path)
+            else:
+                merge_chrome(trace, path)
+    else:
+        from at_simulator import SimulatedModem
+        modems = [SimulatedModem(jitter=0.3) for _ in range(args.devices)]
+        for modem in modems:
+            modem.start()
+        restore = trace_sleeps(trace)
+        results = {}
+        threads = [threading.Thread(target=_demo_device, args=(trace, m, args.legacy and args.scale, results, i),
+                                    name=f'sim{i}') for i, m in enumerate(modems)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        restore()
+        for modem in modems:
+            modem.stop()
+        for i, wall in sorted(results.items()):
+            print(f"sim{i}: {wall:.2f}s")
+
+    trace.write()
+    busy, slept = summarize(trace)
+    for device, seconds in busy.items():
+        print(f"{device}: {seconds:.2f}s in commands")
+    if slept:
+        print(f"Host sleeps: {slept:.2f}s")
+    print(f"Wrote {len(trace.events)} events to {args.out} (open in https://ui.perfetto.dev)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,13 @@
-import serial
-import time
+from at_transport import ATTransport
+from boot_ready import wait_until_ready
+from capabilities import discover
 
-ser = serial.Serial('/dev/ttyUSB0', 115200, timeout=2)
-time.sleep(2)
+at = ATTransport.open('/dev/ttyUSB0', 115200)
+wait_until_ready(at, method='none')
 
-def send_cmd(cmd, delay=2):
-    ser.write((cmd + '\r\n').encode())
-    time.sleep(delay)
-    response = ser.read(ser.in_waiting).decode()
+def send_cmd(cmd, timeout=2):
+    # timeout is a ceiling: returns as soon as OK/ERROR arrives
+    response = at.send(cmd, timeout=timeout).text
     print(f">>> {cmd}")
     print(response)
     print("---")
@@ -15,17 +15,18 @@ def send_cmd(cmd, delay=2):
 
 # Basic connectivity
 send_cmd('AT')
-send_cmd('AT+GMR')
 
 # Check available RAM
 send_cmd('AT+SYSRAM?')
 
-# List ALL available commands - this will tell us if MQTT is registered
-send_cmd('AT+CMD?', delay=5)  # This may take a moment and produce long output
+# Firmware version + command table - this will tell us if MQTT is registered
+# (AT+CMD? is only sent the first time this firmware is seen)
+caps = discover(at)
+print(f"{caps.firmware}: MQTT {'registered' if caps.has('mqtt') else 'NOT registered'}")
 
 # Try WiFi first (MQTT may need network stack initialized)
 send_cmd('AT+CWMODE=1')
-send_cmd('AT+CWJAP="tim","password"', delay=10)
+send_cmd('AT+CWJAP="tim","password"', timeout=10)
 
 # After WiFi connected, try MQTT again
 send_cmd('AT+MQTTUSERCFG=?')
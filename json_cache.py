@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+JSON state files under ~/.cache/fov-at: read leniently, written atomically.
+
+capabilities.py (command tables), latency_model.py (latency history),
+port_discovery.py (port roles) and ota_upload.py (upload sessions) each
+keep a small JSON file between runs. A missing or corrupt file only costs
+a fresh probe, so reads never fail; writes go to a temporary file that is
+renamed over the old one, so an interrupted run can't leave half a file.
+
+Usage:
+    from json_cache import load_json, save_json
+
+    cache = load_json(path, 'port cache')
+    cache[key] = value
+    save_json(cache, path)
+"""
+
+import json
+import os
+import sys
+
+
+def load_json(path, what='cache'):
+    """
+    Read a JSON file.
+
+    Args:
+        path: File to read
+        what: Name for the file in the warning printed if it is unreadable
+
+    Returns:
+        The parsed data, or {} if the file is missing or unreadable
+    """
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        # stderr: the scripts' stdout is often parsed
+        print(f"⚠️  Ignoring unreadable {what} {path}: {e}", file=sys.stderr)
+        return {}
+
+
+def save_json(data, path):
+    """Write data to path atomically, creating the directory if needed."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
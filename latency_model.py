@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Adaptive per-command timeouts learned from observed latencies.
+
+The timeouts in the scripts are guesses (AT+CWJAP gets 10 s in one file and
+15 s in another, AT+CMD? 0.5 s or 5 s). With a LatencyModel attached, the
+transport records how long every command took, per command verb and per
+firmware build (from AT+GMR), in a JSON history file. Once a verb has
+MIN_SAMPLES samples its timeout becomes p99 * MARGIN_FACTOR + MARGIN_SECONDS
+instead of the caller's guess. A timeout is recorded as a sample too, so a
+verb that keeps timing out gets a longer ceiling next time.
+
+Commands are keyed by verb and form: AT+CWJAP= (join) and AT+CWJAP? (query)
+are learned separately, and a wait for a marker such as AT+RST until 'ready'
+gets its own key.
+
+Usage:
+    from latency_model import LatencyModel
+
+    model = LatencyModel()
+    with ATTransport.open(port, timeouts=model) as at:
+        model.identify(at)
+        at.send('AT+CWJAP="tim","password"', timeout=15)   # 15 until learned
+
+    python3 latency_model.py show [--board ...]
+    python3 latency_model.py reset [--board ...] [--verb AT+CWJAP=]
+    python3 latency_model.py learn aws --simulate --runs 10
+
+Requirements:
+    pip install pyserial
+"""
+
+import argparse
+import os
+import re
+import threading
+
+from benchmark import percentile
+from json_cache import load_json, save_json
+
+DEFAULT_PATH = os.environ.get('FOV_AT_LATENCY',
+                              os.path.expanduser('~/.cache/fov-at/latency.json'))
+MAX_SAMPLES = 200  # most recent samples kept per verb
+MIN_SAMPLES = 5  # before this many, the caller's timeout is used
+MARGIN_FACTOR = 1.5
+MARGIN_SECONDS = 0.2
+MIN_TIMEOUT = 0.3
+MAX_TIMEOUT = 60
+SAVE_EVERY = 20  # records between automatic saves
+UNKNOWN_BOARD = 'unknown'
+
+_VERB_RE = re.compile(r'^(AT(?:\+[A-Z_0-9]+|[A-Z][0-9]?)?)(=\?|\?|=)?', re.IGNORECASE)
+
+
+def command_key(cmd, until=None):
+    """
+    Key a command by verb and form, dropping its parameters.
+
+    'AT+CWJAP="tim","pw"' -> 'AT+CWJAP=', 'AT+RST' until 'ready' -> 'AT+RST ~ready'
+    """
+    match = _VERB_RE.match(cmd.strip())
+    key = (match.group(1).upper() + (match.group(2) or '')) if match else cmd.strip()
+    if until:
+        markers = (until,) if isinstance(until, str) else until
+        key += ' ~' + '|'.join(markers)
+    return key
+
+
+def firmware_key(gmr_lines):
+    """Identify a firmware build from AT+GMR output (AT version + bin version)."""
+    parts = []
+    for line in gmr_lines:
+        if line.startswith(('AT version:', 'Bin version:')):
+            parts.append(line.split(':', 1)[1].strip())
+    return ' / '.join(parts) or UNKNOWN_BOARD
+
+
+class LatencyModel:
+    """
+    Persisted latency history and the timeouts derived from it.
+
+    Args:
+        path: JSON history file (created on first save)
+        board: Firmware key to record under; identify() sets it from AT+GMR
+    """
+
+    def __init__(self, path=DEFAULT_PATH, board=UNKNOWN_BOARD):
+        self.path = path
+        self.board = board
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self.history = self._load()
+
+    def _load(self):
+        return load_json(self.path, 'latency history').get('boards', {})
+
+    def save(self):
+        """Write the history atomically."""
+        with self._lock:
+            if not self.history:
+                return
+            save_json({'version': 1, 'boards': self.history}, self.path)
+            self._unsaved = 0
+
+    def identify(self, at):
+        """Set the board key from the firmware's AT+GMR. Returns the key."""
+        # Not recorded: we don't know which board to file it under yet
+        saved, at.timeouts = at.timeouts, None
+        try:
+            response = at.send('AT+GMR')
+        finally:
+            at.timeouts = saved
+        if response.ok:
+            self.board = firmware_key(response.lines)
+        return self.board
+
+    def _entry(self, key, create=False):
+        verbs = self.history.get(self.board)
+        if verbs is None:
+            if not create:
+                return None
+            verbs = self.history[self.board] = {}
+        entry = verbs.get(key)
+        if entry is None and create:
+            entry = verbs[key] = {'samples': [], 'timeouts': 0}
+        return entry
+
+    def timeout_for(self, cmd, default, until=None):
+        """Learned timeout for cmd, or default while there is too little history."""
+        with self._lock:
+            entry = self._entry(command_key(cmd, until))
+            if entry is None or len(entry['samples']) < MIN_SAMPLES:
+                return default
+            p99 = percentile(entry['samples'], 99)
+        return min(MAX_TIMEOUT, max(MIN_TIMEOUT, p99 * MARGIN_FACTOR + MARGIN_SECONDS))
+
+    def record(self, response, until=None):
+        """Add a finished ATResponse. Errors are skipped; timeouts count as a sample."""
+        if response.elapsed is None or (not response.ok and not response.timed_out):
+            return
+        with self._lock:
+            entry = self._entry(command_key(response.command, until), create=True)
+            entry['samples'].append(round(response.elapsed, 4))
+            del entry['samples'][:-MAX_SAMPLES]
+            entry['timeouts'] += response.timed_out
+            self._unsaved += 1
+            due = self._unsaved >= SAVE_EVERY
+        if due:
+            self.save()
+
+    def summary(self, board=None):
+        """Rows of (board, key, n, p50, p99, timeouts, learned timeout) for display."""
+        rows = []
+        with self._lock:
+            for name, verbs in sorted(self.history.items()):
+                if board and name != board:
+                    continue
+                for key, entry in sorted(verbs.items()):
+                    samples = entry['samples']
+                    p99 = percentile(samples, 99)
+                    learned = (min(MAX_TIMEOUT, max(MIN_TIMEOUT, p99 * MARGIN_FACTOR + MARGIN_SECONDS))
+                               if len(samples) >= MIN_SAMPLES else None)
+                    rows.append((name, key, len(samples), percentile(samples, 50), p99,
+                                 entry['timeouts'], learned))
+        return rows
+
+    def reset(self, board=None, verb=None):
+        """Forget history for everything, one board, and/or one command key."""
+        with self._lock:
+            for name in list(self.history):
+                if board and name != board:
+                    continue
+                if verb:
+                    self.history[name].pop(verb, None)
+                if not verb or not self.history[name]:
+                    del self.history[name]
+            if not self.history and os.path.exists(self.path):
+                os.remove(self.path)
+                return
+        self.save()
+
+
+def show(model, board):
+    rows = model.summary(board)
+    if not rows:
+        print(f"No latency history in {model.path}")
+        return
+    current = None
+    for name, key, n, p50, p99, timeouts, learned in rows:
+        if name != current:
+            current = name
+            print(f"\n{name}")
+            print(f"  {'Command':<32} {'n':>4} {'p50 ms':>8} {'p99 ms':>8} {'t/o':>4} {'timeout':>8}")
+        learned_s = f"{learned:7.2f}s" if learned is not None else '       -'
+        print(f"  {key[:32]:<32} {n:>4} {p50 * 1000:8.0f} {p99 * 1000:8.0f} {timeouts:>4} {learned_s}")
+
+
+def learn(model, flow, port, baud, runs, simulate):
+    """Run a benchmark flow with the model attached to build up history."""
+    from at_transport import ATTransport
+    from benchmark import FLOWS, run_flow
+
+    modem = None
+    if simulate:
+        from at_simulator import SimulatedModem
+        modem = SimulatedModem(baud=baud)
+        port = modem.start()
+    try:
+        with ATTransport.open(port, baud, timeouts=model) as at:
+            print(f"Board: {model.identify(at)}")
+            for iteration in range(runs):
+                _, wall = run_flow(at, FLOWS[flow], iteration)
+                print(f"run {iteration + 1}/{runs}: {wall:.2f}s")
+    finally:
+        if modem:
+            modem.stop()
+
+
+def main():
+    from at_transport import DEFAULT_BAUD, DEFAULT_PORT
+    from benchmark import FLOWS
+
+    parser = argparse.ArgumentParser(description='Inspect or reset the learned AT command timeouts')
+    parser.add_argument('--file', default=DEFAULT_PATH, help=f'History file (default {DEFAULT_PATH})')
+    sub = parser.add_subparsers(dest='action', required=True)
+    p_show = sub.add_parser('show', help='Print samples and learned timeouts')
+    p_show.add_argument('--board', help='Only this firmware key')
+    p_reset = sub.add_parser('reset', help='Forget history')
+    p_reset.add_argument('--board', help='Only this firmware key')
+    p_reset.add_argument('--verb', help='Only this command key, e.g. AT+CWJAP=')
+    p_learn = sub.add_parser('learn', help='Run a benchmark flow to collect samples')
+    p_learn.add_argument('flow', choices=sorted(FLOWS))
+    p_learn.add_argument('--port', '-p', default=DEFAULT_PORT)
+    p_learn.add_argument('--baud', '-b', type=int, default=DEFAULT_BAUD)
+    p_learn.add_argument('--runs', '-n', type=int, default=5)
+    p_learn.add_argument('--simulate', action='store_true')
+    args = parser.parse_args()
+
+    model = LatencyModel(args.file)
+    if args.action == 'show':
+        show(model, args.board)
+    elif args.action == 'reset':
+        model.reset(args.board, args.verb)
+        print(f"✓ Reset {args.board or 'all boards'}{' ' + args.verb if args.verb else ''}")
+    else:
+        learn(model, args.flow, args.port, args.baud, args.runs, args.simulate)
+        model.save()
+        show(model, model.board)
+
+
+if __name__ == "__main__":
+    main()
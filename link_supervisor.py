@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+Keep WiFi, SNTP and MQTT up: reconnect fast after a drop, redoing only what was lost.
+
+When WiFi drops or TLS fails, the scripts print the error and keep sending
+commands that fail. LinkSupervisor watches for WIFI DISCONNECT,
++MQTTDISCONNECTED and CLOSED. On a drop it asks the modem what is still in
+effect:
+
+    AT+CWJAP?         still joined        -> skip CWMODE / CWJAP
+    AT+CIPSNTPTIME?   time still valid    -> skip SNTP config and sync
+    AT+MQTTCONN?      broker still up     -> skip user config / SNI / connect
+    AT+MQTTSUB?       subscriptions left  -> resubscribe only the missing ones
+
+It then runs the remaining bringup.py stages. A drop reported while that
+is going on is remembered, and the modem is probed and recovered again
+before the link is reported up, unless a later WIFI GOT IP or
++MQTTCONNECTED in the same recovery superseded it (as with the WIFI
+DISCONNECT that AT+CWJAP itself emits). A failed attempt is retried with
+jittered exponential backoff, so a fleet does not reconnect in lockstep.
+Subscriptions are learned from AT+MQTTSUB? at start-up as well as from
+subscribe(), so subscriptions made by earlier scripts are restored too.
+Every recovery is recorded, from the URC to the restored link.
+
+mqtt_bridge.py runs its link through this class.
+
+Usage:
+    python3 link_supervisor.py [--port /dev/ttyUSB0] [--aws] [--sub 'fov/#']
+    python3 link_supervisor.py --simulate --chaos 2 --duration 30 --sntp --sub 'fov/#'
+
+From Python:
+    link = LinkSupervisor(engine, config)
+    link.start()
+    link.wait_up(30)            # before sending traffic after a drop
+    print(link.status())
+
+Requirements:
+    pip install pyserial
+"""
+
+import argparse
+import random
+import sys
+import threading
+import time
+
+import serial
+
+from at_engine import ATEngine
+from at_parsers import CWJAP, MQTTConn, MQTTSub, SNTPTime, first, parse_response
+from at_transport import DEFAULT_BAUD, DEFAULT_PORT, quote
+from benchmark import summarize
+from bringup import (
+    AWS_CLIENT_ID, AWS_ENDPOINT, WIFI_PASSWORD, WIFI_SSID, BridgeConfig, BringUp, mqtt_stages,
+)
+
+BACKOFF = (0.5, 30)  # first and longest delay between attempts, seconds
+BRINGUP_TIMEOUT = 60
+MQTT_CONNECTED_STATES = (4, 5, 6)  # MQTTConn.state, see at_parsers.MQTT_STATES
+RECOVERY_PASSES = 3  # probe-and-recover passes per attempt while drops keep arriving
+
+
+class Recovery:
+    """One drop and what it took to recover."""
+
+    def __init__(self, trigger, down_at):
+        self.trigger = trigger
+        self.down_at = down_at  # time.monotonic() of the URC
+        self.recovered_at = None
+        self.attempts = 0
+        self.skipped = []  # stages that were still in effect
+        self.resubscribed = []
+
+    @property
+    def seconds(self):
+        return None if self.recovered_at is None else self.recovered_at - self.down_at
+
+    def as_dict(self):
+        return {'trigger': self.trigger, 'seconds': self.seconds, 'attempts': self.attempts,
+                'skipped': self.skipped, 'resubscribed': self.resubscribed}
+
+
+def backoff_delay(attempt, first=BACKOFF[0], longest=BACKOFF[1]):
+    """Full-jitter exponential backoff: uniform between first and the capped exponential."""
+    return random.uniform(first, min(longest, first * 2 ** attempt))
+
+
+class LinkSupervisor:
+    """
+    Brings the link up and keeps it up from a background thread.
+
+    Drop URCs are handled on the reader thread by flagging only; probing and
+    reconnecting happen on the supervisor thread so the reader never blocks.
+
+    Args:
+        engine: ATEngine
+        config: bringup.BridgeConfig
+        backoff: (first, longest) delay between failed attempts in seconds
+        log: Callable for progress messages (default: stderr)
+    """
+
+    def __init__(self, engine, config, backoff=BACKOFF, log=None):
+        self.engine = engine
+        self.config = config
+        self.backoff = backoff
+        self.log = log or (lambda message: print(message, file=sys.stderr))
+        self.wifi_up = False
+        self.mqtt_up = False
+        self.time_valid = False
+        self.subscriptions = {}  # topic filter -> qos
+        self.recoveries = []
+        self._lock = threading.Lock()
+        self._up = threading.Event()
+        self._link_lost = threading.Event()
+        self._pending = None  # Recovery being worked on
+        self._recovering = False
+        self._lost = {}  # layer -> URC, drops seen during recovery and not yet superseded
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._supervise, daemon=True)
+        engine.transport.add_urc_listener(self._on_urc)
+
+    # -- state ----------------------------------------------------------------
+
+    def _on_urc(self, line):
+        if line.startswith('WIFI DISCONNECT'):
+            self.wifi_up = False
+            self.mqtt_up = False
+            lost = ('wifi', 'mqtt')
+        elif line.startswith('+MQTTDISCONNECTED'):
+            self.mqtt_up = False
+            lost = ('mqtt',)
+        elif line == 'CLOSED' or line.endswith(',CLOSED'):
+            lost = ('mqtt',)  # a socket or TLS session closed; the probe decides what is left
+        elif line.startswith('+TIME_UPDATED'):
+            self.time_valid = True
+            return
+        elif self._recovering and line.startswith(('WIFI GOT IP', '+MQTTCONNECTED')):
+            # Our own join / connect came after the drop (CWJAP drops the old AP first)
+            with self._lock:
+                self._lost.pop('wifi' if line.startswith('WIFI') else 'mqtt', None)
+            return
+        else:
+            return
+        if self._recovering:
+            with self._lock:
+                for layer in lost:
+                    self._lost.setdefault(layer, line)
+            return
+        self._up.clear()
+        with self._lock:
+            if self._pending is None:
+                self._pending = Recovery(line, time.monotonic())
+        self._link_lost.set()
+
+    @property
+    def up(self):
+        return self._up.is_set()
+
+    def wait_up(self, timeout=None):
+        """Block until the link is up. Returns False on timeout."""
+        return self._up.wait(timeout)
+
+    def probe(self):
+        """
+        Ask the modem what is still in effect.
+
+        Returns:
+            (set of satisfied bringup stage names, {topic: qos} subscribed on the modem)
+        """
+        futures = {cmd: self.engine.submit(cmd, timeout=3)
+                   for cmd in ('AT+CWJAP?', 'AT+CIPSNTPTIME?', 'AT+MQTTCONN?', 'AT+MQTTSUB?')}
+        records = {cmd: parse_response(f.result()) for cmd, f in futures.items()}
+        satisfied = {'at'}
+        self.wifi_up = first(records['AT+CWJAP?'], CWJAP) is not None
+        if self.wifi_up:
+            satisfied.update(('mode', 'wifi'))
+        sntp = first(records['AT+CIPSNTPTIME?'], SNTPTime)
+        self.time_valid = bool(sntp and sntp.synced)
+        if self.time_valid:
+            satisfied.update(('sntp', 'time'))
+        conn = first(records['AT+MQTTCONN?'], MQTTConn)
+        self.mqtt_up = bool(conn and conn.state in MQTT_CONNECTED_STATES)
+        if self.mqtt_up:
+            satisfied.update(('user', 'sni', 'mqtt'))
+        subscribed = {r.topic: r.qos for r in records['AT+MQTTSUB?'] if isinstance(r, MQTTSub)}
+        return satisfied, subscribed
+
+    def _bring_up(self, recovery=None):
+        """
+        One attempt: probe, run the missing stages, resubscribe. Returns True when up.
+
+        If the link drops again meanwhile, the probe and recovery are repeated.
+        """
+        self._recovering = True
+        try:
+            for _ in range(RECOVERY_PASSES):
+                with self._lock:
+                    self._lost.clear()
+                if not self._recover(recovery):
+                    return False
+                with self._lock:
+                    lost = sorted(set(self._lost.values()))
+                if not lost:
+                    return True
+                self.log(f"{', '.join(lost)} during recovery, probing again")
+            return False
+        finally:
+            self._recovering = False
+
+    def _recover(self, recovery):
+        satisfied, subscribed = self.probe()
+        with self._lock:
+            # Subscriptions made before we started (e.g. by another script) are kept too
+            for topic, qos in subscribed.items():
+                self.subscriptions.setdefault(topic, qos)
+            wanted = dict(self.subscriptions)
+        result = BringUp(self.engine, mqtt_stages(self.config, reconnect=0), satisfied).run(BRINGUP_TIMEOUT)
+        if not result.ok:
+            failed = result.failed[0]
+            self.log(f"bring-up failed at {failed.name}: {failed.error}")
+            return False
+        self.wifi_up = self.mqtt_up = True
+        if self.config.sntp:
+            self.time_valid = True
+        # A fresh MQTT session has no subscriptions, a surviving one keeps them
+        missing = wanted if 'mqtt' not in satisfied else \
+            {t: q for t, q in wanted.items() if t not in subscribed}
+        futures = [(t, self.engine.submit(f'AT+MQTTSUB=0,{quote(t)},{q}', timeout=5))
+                   for t, q in missing.items()]
+        failed = [t for t, f in futures if not f.result().ok]
+        if failed:
+            self.log(f"resubscribe failed: {', '.join(failed)}")
+            return False
+        if recovery:
+            recovery.skipped = result.skipped
+            recovery.resubscribed = sorted(missing)
+        return True
+
+    def start(self):
+        """
+        Initial bring-up, then supervise in the background.
+
+        Raises:
+            RuntimeError if the first bring-up fails
+        """
+        if not self._bring_up():
+            raise RuntimeError("initial bring-up failed")
+        self._up.set()
+        self._thread.start()
+        return self
+
+    def _supervise(self):
+        while not self._stop.is_set():
+            if not self._link_lost.wait(timeout=1) or self._stop.is_set():
+                continue
+            self._link_lost.clear()
+            with self._lock:
+                recovery = self._pending or Recovery('unknown', time.monotonic())
+            self.log(f"link lost ({recovery.trigger}), recovering")
+            while not self._stop.is_set():
+                recovery.attempts += 1
+                try:
+                    if self._bring_up(recovery):
+                        break
+                except Exception as e:
+                    self.log(f"recovery attempt {recovery.attempts} failed: {e}")
+                delay = backoff_delay(recovery.attempts - 1, *self.backoff)
+                self.log(f"retrying in {delay:.1f}s")
+                if self._stop.wait(delay):
+                    return
+            else:
+                return
+            recovery.recovered_at = time.monotonic()
+            with self._lock:
+                self._pending = None
+                self.recoveries.append(recovery)
+            if not self._link_lost.is_set():  # dropped again right after; handled next pass
+                self._up.set()
+            skipped = ', '.join(s for s in recovery.skipped if s != 'at') or 'nothing'
+            self.log(f"link restored in {recovery.seconds:.2f}s after {recovery.attempts} attempt(s) "
+                     f"(skipped {skipped})")
+
+    def subscribe(self, topic, qos=0):
+        """
+        Subscribe and remember the filter for replay after a drop.
+
+        Returns:
+            ATResponse, or None if the link is down (it is subscribed on recovery)
+        """
+        with self._lock:
+            new = topic not in self.subscriptions
+            self.subscriptions[topic] = qos
+        if new and self.mqtt_up:
+            return self.engine.submit(f'AT+MQTTSUB=0,{quote(topic)},{qos}', timeout=5).result()
+        return None
+
+    def status(self):
+        times = [r.seconds for r in self.recoveries]
+        return {
+            'up': self.up,
+            'wifi': self.wifi_up,
+            'mqtt': self.mqtt_up,
+            'time_valid': self.time_valid,
+            'reconnects': len(self.recoveries),
+            'last_recovery': times[-1] if times else None,
+            'recovery': summarize(times) if times else None,
+            'subscriptions': sorted(self.subscriptions),
+        }
+
+    def stop(self):
+        self._stop.set()
+        self._link_lost.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.engine.transport.remove_urc_listener(self._on_urc)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Keep the C5 WiFi/MQTT link up and measure recovery')
+    parser.add_argument('--port', '-p', default=DEFAULT_PORT)
+    parser.add_argument('--baud', '-b', type=int, default=DEFAULT_BAUD)
+    parser.add_argument('--ssid', default=WIFI_SSID)
+    parser.add_argument('--password', default=WIFI_PASSWORD)
+    parser.add_argument('--broker', default='test.mosquitto.org')
+    parser.add_argument('--broker-port', type=int, default=1883)
+    parser.add_argument('--client-id', default='esp32c5_supervisor')
+    parser.add_argument('--sntp', action='store_true', help='Sync time before connecting')
+    parser.add_argument('--aws', action='store_true', help='Use the AWS IoT settings from aws_with_certs.py')
+    parser.add_argument('--sub', action='append', default=[], help='Topic to keep subscribed (repeatable)')
+    parser.add_argument('--duration', '-d', type=float, help='Stop after this many seconds (default: Ctrl-C)')
+    parser.add_argument('--simulate', action='store_true', help='Run against at_simulator')
+    parser.add_argument('--chaos', type=float, default=0,
+                        help='With --simulate: seconds between injected WiFi/MQTT drops')
+    args = parser.parse_args()
+
+    if args.aws:
+        config = BridgeConfig(args.ssid, args.password, AWS_ENDPOINT, 8883, scheme=5,
+                              client_id=AWS_CLIENT_ID, sni=AWS_ENDPOINT, sntp=True)
+    else:
+        config = BridgeConfig(args.ssid, args.password, args.broker, args.broker_port,
+                              client_id=args.client_id, sntp=args.sntp)
+
+    modem = None
+    port = args.port
+    if args.simulate:
+        from at_simulator import SimulatedModem
+        modem = SimulatedModem()
+        port = modem.start()
+
+    try:
+        engine = ATEngine.open(port, args.baud)
+    except serial.SerialException as e:
+        print(f"ERROR: Could not open serial port: {e}")
+        sys.exit(1)
+
+    if modem:
+        engine.transport.wait_for('ready', timeout=2)
+    link = LinkSupervisor(engine, config, log=lambda message: print(f"   {message}"))
+    try:
+        start = time.monotonic()
+        link.start()
+        print(f"✅ Link up in {time.monotonic() - start:.2f}s")
+        for topic in args.sub:
+            link.subscribe(topic)
+        next_drop = time.monotonic() + args.chaos
+        while args.duration is None or time.monotonic() - start < args.duration:
+            time.sleep(0.1)
+            if modem and args.chaos and time.monotonic() >= next_drop and link.up:
+                random.choice((modem.drop_wifi, modem.drop_mqtt))()
+                next_drop = time.monotonic() + args.chaos
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        link.stop()
+        engine.close()
+        if modem:
+            modem.stop()
+
+    status = link.status()
+    print(f"\n{status['reconnects']} recoveries")
+    for r in link.recoveries:
+        print(f"   {r.trigger:<22} {r.seconds * 1000:6.0f} ms  attempts {r.attempts}  "
+              f"skipped {', '.join(s for s in r.skipped if s != 'at') or '-'}")
+    if status['recovery']:
+        s = status['recovery']
+        print(f"Recovery time: p50 {s['p50'] * 1000:.0f} ms, p95 {s['p95'] * 1000:.0f} ms, "
+              f"max {s['max'] * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,13 @@
-import serial
-import time
+from at_transport import ATTransport
+from capabilities import discover
 
-ser = serial.Serial('/dev/ttyUSB0', 115200, timeout=1)
+at = ATTransport.open('/dev/ttyUSB0', 115200)
 
-print("Waiting for device ready...")
-time.sleep(2)
+# List all commands; AT+CMD? is only sent when the firmware is new to the cache
+caps = discover(at)
+at.close()
 
-# Clear any pending data
-ser.reset_input_buffer()
-
-# Send AT+CMD? to list all commands
-print("\n--- Sending AT+CMD? ---")
-ser.write(b'AT+CMD?\r\n')
-time.sleep(0.5)
-
-# Read response
-response = ser.read_all().decode('utf-8', errors='ignore')
-print(response)
-
-ser.close()
+print(f"\n--- {caps.firmware}: {len(caps.commands)} commands "
+      f"({'cached ' + caps.probed_at if caps.cached else 'from AT+CMD?'}) ---")
+for name in sorted(caps.commands):
+    print(name)
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Memory telemetry: sample AT+FWMEMINFO / AT+SYSRAM? over long runs.
+
+test_meminfo.py takes one snapshot. This module polls both commands at a
+fixed interval through an ATEngine, so the queries queue between whatever
+else is using the port (MQTT traffic, an OTA upload) instead of stalling it.
+Each sample is appended to a compact binary time series (32 bytes per
+sample), and the report shows, per region:
+
+    fragmentation   1 - largest/free (0 = one free block)
+    leak slope      least-squares bytes/hour of free and largest block
+    time to limit   when psram_largest reaches MIN_PSRAM_BYTES at that slope
+
+A warning is printed as soon as psram_largest is within --margin of
+MIN_PSRAM_BYTES or is projected to cross it within --horizon, so there
+is time to act before an OTA can no longer be staged.
+
+File format: b'FOVMEM1\\n' then one SAMPLE record per sample
+(unix time, psram free/largest, internal free/largest, sysram free/min free).
+
+Usage:
+    python3 mem_telemetry.py [--port /dev/ttyUSB0] --interval 5 --out mem.bin
+    python3 mem_telemetry.py --duration 3600 --out mem.bin     # stop after an hour
+    python3 mem_telemetry.py --report mem.bin
+    python3 mem_telemetry.py --simulate --interval 0.1 --duration 10 --leak 2000
+
+Requirements:
+    pip install pyserial
+"""
+
+import argparse
+import collections
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import serial
+
+from at_engine import ATEngine
+from at_parsers import FWMemInfo, SysRam, first, parse_response
+from at_transport import DEFAULT_BAUD, DEFAULT_PORT
+from test_meminfo import MIN_PSRAM_BYTES, format_bytes
+
+FILE_MAGIC = b'FOVMEM1\n'
+SAMPLE = struct.Struct('<d6I')
+DEFAULT_INTERVAL = 5.0
+WARN_MARGIN = 0.25  # warn when psram_largest is within 25% of the limit
+WARN_HORIZON = 3600  # ... or projected to reach it within an hour
+TREND_WINDOW = 60  # samples used for the live slope
+
+MemSample = collections.namedtuple(
+    'MemSample', 'time psram_free psram_largest internal_free internal_largest sysram_free sysram_min')
+
+
+def load_samples(path):
+    """Read a telemetry file written by SampleWriter (a truncated last record is dropped)."""
+    with open(path, 'rb') as f:
+        if f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            raise ValueError(f"{path}: not a memory telemetry file")
+        data = f.read()
+    usable = len(data) - len(data) % SAMPLE.size
+    return [MemSample(*values) for values in SAMPLE.iter_unpack(data[:usable])]
+
+
+class SampleWriter:
+    """Appends samples to a telemetry file, flushing each so a crash loses at most one."""
+
+    def __init__(self, path):
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(FILE_MAGIC)
+
+    def add(self, sample):
+        self._file.write(SAMPLE.pack(*sample))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def slope(samples, field):
+    """Least-squares slope of a field in bytes/hour, or None with fewer than 2 samples."""
+    if len(samples) < 2:
+        return None
+    n = len(samples)
+    t0 = samples[0].time
+    xs = [s.time - t0 for s in samples]
+    ys = [getattr(s, field) for s in samples]
+    mean_x, mean_y = sum(xs) / n, sum(ys) / n
+    var = sum((x - mean_x) ** 2 for x in xs)
+    if not var:
+        return None
+    cov = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    return cov / var * 3600
+
+
+def fragmentation(free, largest):
+    return 1 - largest / free if free else 0.0
+
+
+def time_to_limit(samples, limit=MIN_PSRAM_BYTES):
+    """Seconds until psram_largest reaches limit at the current slope (None if not shrinking)."""
+    rate = slope(samples, 'psram_largest')
+    if not rate or rate >= 0:
+        return None
+    return max(samples[-1].psram_largest - limit, 0) / -rate * 3600
+
+
+def trend(samples, limit=MIN_PSRAM_BYTES):
+    """
+    Summarise a series.
+
+    Returns:
+        dict with duration, per-region first/last/min values, fragmentation,
+        slopes in bytes/hour, and seconds until psram_largest reaches limit
+    """
+    if not samples:
+        return {'samples': 0}
+    report = {'samples': len(samples), 'duration': samples[-1].time - samples[0].time, 'regions': {}}
+    for region in ('psram', 'internal'):
+        free, largest = f'{region}_free', f'{region}_largest'
+        report['regions'][region] = {
+            'free': (getattr(samples[0], free), getattr(samples[-1], free)),
+            'largest': (getattr(samples[0], largest), getattr(samples[-1], largest)),
+            'min_largest': min(getattr(s, largest) for s in samples),
+            'fragmentation': (fragmentation(getattr(samples[0], free), getattr(samples[0], largest)),
+                              fragmentation(getattr(samples[-1], free), getattr(samples[-1], largest))),
+            'free_slope': slope(samples, free),
+            'largest_slope': slope(samples, largest),
+        }
+    report['sysram_min'] = min(s.sysram_min for s in samples)
+    report['sysram_slope'] = slope(samples, 'sysram_free')
+    report['time_to_limit'] = time_to_limit(samples, limit)
+    return report
+
+
+class MemorySampler:
+    """
+    Background thread that samples memory through an ATEngine.
+
+    Each sample is two short queued commands; other callers' commands wait
+    at most for those two. A sample is skipped (and counted) if the modem
+    has not answered within the interval.
+
+    Args:
+        engine: ATEngine shared with the rest of the script
+        interval: Seconds between samples
+        writer: Optional SampleWriter
+        limit: psram_largest threshold (MIN_PSRAM_BYTES)
+        margin: Warn when psram_largest < limit * (1 + margin)
+        horizon: Warn when the limit is projected to be reached within this many seconds
+        on_warning: callback(message, sample); defaults to printing
+        on_sample: Optional callback(sample) for every sample taken
+    """
+
+    def __init__(self, engine, interval=DEFAULT_INTERVAL, writer=None, limit=MIN_PSRAM_BYTES,
+                 margin=WARN_MARGIN, horizon=WARN_HORIZON, on_warning=None, on_sample=None):
+        self.engine = engine
+        self.interval = interval
+        self.writer = writer
+        self.limit = limit
+        self.margin = margin
+        self.horizon = horizon
+        self.on_warning = on_warning or (lambda message, sample: print(f"⚠️  {message}"))
+        self.on_sample = on_sample
+        self.samples = collections.deque(maxlen=TREND_WINDOW)
+        self.count = 0
+        self.skipped = 0
+        self.severity = 0  # of the last check: 0 ok, 1 trend, 2 near the limit, 3 below it
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def sample(self, timeout):
+        """Take one sample now. Returns a MemSample, or None if a query failed."""
+        stamp = time.time()
+        meminfo = self.engine.submit('AT+FWMEMINFO')
+        sysram = self.engine.submit('AT+SYSRAM?')
+        deadline = time.monotonic() + timeout
+        try:
+            responses = [f.result(max(deadline - time.monotonic(), 0)) for f in (meminfo, sysram)]
+        except FutureTimeout:
+            return None
+        if not all(r.ok for r in responses):
+            return None
+        records = parse_response(responses[0])
+        psram = next((r for r in records if isinstance(r, FWMemInfo) and r.region == 'PSRAM'), None)
+        internal = next((r for r in records if isinstance(r, FWMemInfo) and r.region == 'INTERNAL'), None)
+        ram = first(parse_response(responses[1]), SysRam)
+        if not (psram and internal and ram):
+            return None
+        return MemSample(stamp, psram.free, psram.largest, internal.free, internal.largest,
+                         ram.free, ram.min_free)
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while not self._stop.is_set():
+            sample = self.sample(timeout=max(self.interval, 1.0))
+            if sample is None:
+                self.skipped += 1
+            else:
+                self.count += 1
+                self.samples.append(sample)
+                if self.writer:
+                    self.writer.add(sample)
+                if self.on_sample:
+                    self.on_sample(sample)
+                self._check(sample)
+            next_tick += self.interval
+            self._stop.wait(max(next_tick - time.monotonic(), 0))
+            if time.monotonic() > next_tick + self.interval:
+                next_tick = time.monotonic()  # fell behind (slow modem); don't burst to catch up
+
+    def _check(self, sample):
+        largest = sample.psram_largest
+        message = None
+        severity = 0
+        if largest < self.limit:
+            severity = 3
+            message = (f"psram_largest {format_bytes(largest)} is below "
+                       f"MIN_PSRAM_BYTES ({format_bytes(self.limit)})")
+        elif largest < self.limit * (1 + self.margin):
+            severity = 2
+            message = f"psram_largest {format_bytes(largest)} is within {self.margin:.0%} of the OTA minimum"
+        else:
+            eta = time_to_limit(list(self.samples), self.limit)
+            if eta is not None and eta < self.horizon:
+                severity = 1
+                message = (f"psram_largest {format_bytes(largest)} shrinking, projected to reach "
+                           f"{format_bytes(self.limit)} in {eta / 60:.0f} min")
+        # Warn when things get worse, not on every sample of the same excursion
+        if severity > self.severity:
+            self.on_warning(message, sample)
+        self.severity = severity
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+
+def _per_hour(rate):
+    return 'n/a' if rate is None else f"{rate:+,.0f} B/h"
+
+
+def print_report(report, limit=MIN_PSRAM_BYTES):
+    if not report['samples']:
+        print("No samples")
+        return
+    print(f"{report['samples']} samples over {report['duration'] / 60:.1f} min\n")
+    for region, r in report['regions'].items():
+        print(f"{region.upper()}")
+        print(f"   Free:          {format_bytes(r['free'][0])} -> {format_bytes(r['free'][1])} "
+              f"({_per_hour(r['free_slope'])})")
+        print(f"   Largest block: {format_bytes(r['largest'][0])} -> {format_bytes(r['largest'][1])} "
+              f"({_per_hour(r['largest_slope'])}), min {format_bytes(r['min_largest'])}")
+        print(f"   Fragmentation: {r['fragmentation'][0]:.1%} -> {r['fragmentation'][1]:.1%}")
+    print(f"SYSRAM min free {format_bytes(report['sysram_min'])} ({_per_hour(report['sysram_slope'])})\n")
+
+    psram = report['regions']['psram']
+    if psram['min_largest'] < limit:
+        print(f"❌ psram_largest fell below MIN_PSRAM_BYTES ({format_bytes(limit)})")
+    elif report['time_to_limit'] is not None:
+        print(f"⚠️  psram_largest shrinking; reaches {format_bytes(limit)} in "
+              f"{report['time_to_limit'] / 3600:.1f} h at this rate")
+    else:
+        print("✅ No PSRAM leak trend")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sample PSRAM/internal memory over time')
+    parser.add_argument('--port', '-p', default=DEFAULT_PORT)
+    parser.add_argument('--baud', '-b', type=int, default=DEFAULT_BAUD)
+    parser.add_argument('--interval', '-i', type=float, default=DEFAULT_INTERVAL,
+                        help=f'Seconds between samples (default {DEFAULT_INTERVAL})')
+    parser.add_argument('--duration', '-d', type=float, help='Stop after this many seconds (default: Ctrl-C)')
+    parser.add_argument('--out', '-o', help='Append samples to this file')
+    parser.add_argument('--report', metavar='FILE', help='Only report on an existing file')
+    parser.add_argument('--margin', type=float, default=WARN_MARGIN)
+    parser.add_argument('--horizon', type=float, default=WARN_HORIZON)
+    parser.add_argument('--simulate', action='store_true', help='Run against at_simulator')
+    parser.add_argument('--leak', type=int, default=0,
+                        help='With --simulate: bytes/s the simulated PSRAM largest block shrinks')
+    args = parser.parse_args()
+
+    if args.report:
+        print_report(trend(load_samples(args.report)))
+        return
+
+    modem = None
+    port = args.port
+    if args.simulate:
+        from at_simulator import SimulatedModem
+        modem = SimulatedModem(baud=None)
+        port = modem.start()
+
+    try:
+        engine = ATEngine.open(port, args.baud)
+    except serial.SerialException as e:
+        print(f"ERROR: Could not open serial port: {e}")
+        sys.exit(1)
+
+    writer = SampleWriter(args.out) if args.out else None
+    collected = []  # the whole run, for the final report
+    sampler = MemorySampler(engine, args.interval, writer, margin=args.margin, horizon=args.horizon,
+                            on_sample=collected.append)
+
+    print(f"Sampling every {args.interval}s" + (f" for {args.duration}s" if args.duration else '')
+          + (f" to {args.out}" if args.out else '') + " (Ctrl-C to stop)")
+    sampler.start()
+    started = time.monotonic()
+    try:
+        while args.duration is None or time.monotonic() - started < args.duration:
+            time.sleep(min(args.interval, 0.1))
+            if modem and args.leak:
+                step = int(args.leak * min(args.interval, 0.1))
+                modem.mem['psram_largest'] = max(modem.mem['psram_largest'] - step, 0)
+                modem.mem['psram_free'] = max(modem.mem['psram_free'] - step // 2, 0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sampler.stop()
+        engine.close()
+        if writer:
+            writer.close()
+        if modem:
+            modem.stop()
+
+    print(f"\n{sampler.count} samples, {sampler.skipped} skipped\n")
+    print_report(trend(collected))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Persistent MQTT bridge: keep the modem's WiFi and MQTT session warm.
+
+stable_wifi_mqtt.py and aws_with_certs.py reset the modem, rejoin WiFi,
+re-sync SNTP and redo the TLS handshake for every single publish (30+
+seconds). This daemon owns the serial port, brings the link up once, keeps
+the AT+MQTTCONN session open (reconnecting on +MQTTDISCONNECTED and WIFI
+DISCONNECT) and lets other host processes publish and subscribe through a
+local Unix socket, so a publish costs one radio round trip. Reconnecting
+is done by link_supervisor.LinkSupervisor, which only redoes the steps that
+were lost and replays the subscriptions.
+
+Socket protocol (one JSON object per line):
+    -> {"op": "pub", "topic": "fov/test", "data": "hello", "qos": 0, "retain": 0}
+    <- {"ok": true, "elapsed": 0.041}
+    -> {"op": "sub", "topic": "fov/#", "qos": 0}
+    <- {"ok": true}
+    <- {"event": "message", "topic": "fov/test", "data": "hello"}   (streamed)
+    -> {"op": "status"}
+    <- {"ok": true, "wifi": true, "mqtt": true, "reconnects": 0, ...}
+
+Usage:
+    python3 mqtt_bridge.py serve --port /dev/ttyUSB0 --broker test.mosquitto.org
+    python3 mqtt_bridge.py serve --aws      # aws_with_certs.py settings
+    python3 mqtt_bridge.py pub fov/test hello
+    python3 mqtt_bridge.py sub 'fov/#'
+
+Requirements:
+    pip install pyserial
+"""
+
+import argparse
+import collections
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+
+from at_engine import ATEngine
+from at_parsers import MQTTSubRecv, parse_line
+from at_transport import DEFAULT_BAUD, DEFAULT_PORT
+from bringup import AWS_CLIENT_ID, AWS_ENDPOINT, WIFI_PASSWORD, WIFI_SSID, BridgeConfig
+from link_supervisor import LinkSupervisor
+from mqtt_broker import topic_matches
+from mqtt_publisher import publish_command
+
+DEFAULT_SOCKET = '/tmp/fov-mqtt-bridge.sock'
+PUBLISH_WAIT = 10  # seconds a publish waits for the link during a recovery
+CLIENT_QUEUE = 1000  # messages held for a slow client before new ones are dropped
+
+
+class MQTTBridge:
+    """
+    Owns the ATEngine, keeps the MQTT session up and fans out messages.
+
+    The link (and recovery after a drop) is handled by a LinkSupervisor.
+    """
+
+    def __init__(self, engine, config):
+        self.engine = engine
+        self.config = config
+        self.link = LinkSupervisor(engine, config)
+        self._listeners = []     # (topic filter, callback)
+        self._lock = threading.Lock()
+        engine.on_urc('+MQTTSUBRECV', self._on_message)
+
+    @property
+    def subscriptions(self):
+        return self.link.subscriptions
+
+    def start(self):
+        """Initial bring-up, then start watching for link loss."""
+        self.link.start()
+
+    def close(self):
+        self.link.stop()
+        self.engine.close()
+
+    # -- pub/sub --------------------------------------------------------------
+
+    def publish(self, topic, data, qos=0, retain=0):
+        """Publish str or bytes; AT+MQTTPUBRAW is used when AT+MQTTPUB can't carry it."""
+        # Don't send into a dead link; a short outage is waited out
+        self.link.wait_up(PUBLISH_WAIT)
+        cmd, raw = publish_command(topic, data, qos, retain)
+        if raw is None:
+            return self.engine.submit(cmd, timeout=10).result()
+        return self.engine.submit_data(cmd, raw, timeout=10).result()
+
+    def subscribe(self, topic, qos=0, callback=None):
+        """
+        Subscribe on the modem (once per filter) and register callback(topic, data bytes).
+
+        The callback runs on the serial reader thread and must not block.
+        """
+        if callback is not None:
+            with self._lock:
+                self._listeners.append((topic, callback))
+        return self.link.subscribe(topic, qos)
+
+    def unsubscribe_callback(self, callback):
+        with self._lock:
+            self._listeners = [(t, cb) for t, cb in self._listeners if cb is not callback]
+
+    def _on_message(self, line):
+        record = parse_line(line)
+        if not isinstance(record, MQTTSubRecv):
+            return
+        topic, data = record.topic, record.data
+        with self._lock:
+            listeners = list(self._listeners)
+        for pattern, callback in listeners:
+            if topic_matches(pattern, topic):
+                callback(topic, data)
+
+    def status(self):
+        return {'broker': self.config.broker, **self.link.status()}
+
+
+class _BridgeHandler(socketserver.StreamRequestHandler):
+    """
+    One client connection: JSON requests in, JSON replies and messages out.
+
+    Messages arrive on the serial reader thread, so they are only queued
+    there; a writer thread per client does the socket writes, and a client
+    that stops reading loses messages instead of stalling the modem.
+    """
+
+    def setup(self):
+        super().setup()
+        self.dropped = 0
+        self._outbox = queue.Queue(CLIENT_QUEUE)
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            obj = self._outbox.get()
+            if obj is None:
+                return
+            try:
+                self.wfile.write(json.dumps(obj).encode() + b'\n')
+                self.wfile.flush()
+            except (OSError, ValueError):
+                return  # client gone
+
+    def _send(self, obj):
+        self._outbox.put(obj)
+
+    def _deliver(self, topic, data):
+        try:
+            self._outbox.put_nowait({'event': 'message', 'topic': topic,
+                                     'data': str(data, 'utf-8', 'replace')})
+        except queue.Full:
+            self.dropped += 1
+
+    def handle(self):
+        bridge = self.server.bridge
+        try:
+            for raw in self.rfile:
+                try:
+                    req = json.loads(raw)
+                    op = req['op']
+                    if op == 'pub':
+                        r = bridge.publish(req['topic'], str(req['data']),
+                                           req.get('qos', 0), req.get('retain', 0))
+                        self._send({'ok': r.ok, 'result': r.result, 'elapsed': r.elapsed})
+                    elif op == 'sub':
+                        r = bridge.subscribe(req['topic'], req.get('qos', 0), self._deliver)
+                        self._send({'ok': r is None or r.ok})
+                    elif op == 'status':
+                        self._send({'ok': True, **bridge.status()})
+                    else:
+                        self._send({'ok': False, 'error': f'unknown op {op!r}'})
+                except (ValueError, KeyError, TypeError) as e:
+                    self._send({'ok': False, 'error': str(e)})
+                except Exception as e:  # serial or engine failure; keep serving this client
+                    self._send({'ok': False, 'error': f'{type(e).__name__}: {e}'})
+        finally:
+            bridge.unsubscribe_callback(self._deliver)
+
+    def finish(self):
+        try:
+            self._outbox.put(None, timeout=1)
+        except queue.Full:
+            pass  # the writer is stuck on a dead client; closing the socket ends it
+        self._writer.join(timeout=1)
+        super().finish()
+
+
+class BridgeServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, bridge):
+        if os.path.exists(path):
+            os.unlink(path)
+        self.bridge = bridge
+        super().__init__(path, _BridgeHandler)
+
+
+class BridgeClient:
+    """Client side of the bridge socket for other host processes."""
+
+    def __init__(self, path=DEFAULT_SOCKET):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.file = self.sock.makefile('rwb')
+        self._events = collections.deque()  # messages that arrived ahead of a reply
+
+    def request(self, **req):
+        self.file.write(json.dumps(req).encode() + b'\n')
+        self.file.flush()
+        while True:
+            reply = json.loads(self.file.readline())
+            if 'event' not in reply:
+                return reply
+            self._events.append(reply)
+
+    def publish(self, topic, data, qos=0, retain=0):
+        return self.request(op='pub', topic=topic, data=data, qos=qos, retain=retain)
+
+    def subscribe(self, topic, qos=0):
+        return self.request(op='sub', topic=topic, qos=qos)
+
+    def messages(self):
+        """Yield (topic, data) for messages on subscribed topics."""
+        while self._events:
+            msg = self._events.popleft()
+            if msg['event'] == 'message':
+                yield msg['topic'], msg['data']
+        for raw in self.file:
+            msg = json.loads(raw)
+            if msg.get('event') == 'message':
+                yield msg['topic'], msg['data']
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+def serve(args):
+    if args.aws:
+        config = BridgeConfig(args.ssid, args.password, AWS_ENDPOINT, 8883, scheme=5,
+                              client_id=AWS_CLIENT_ID, sni=AWS_ENDPOINT, sntp=True)
+    else:
+        config = BridgeConfig(args.ssid, args.password, args.broker, args.broker_port,
+                              scheme=args.scheme, client_id=args.client_id, sntp=args.sntp)
+    engine = ATEngine.open(args.port, args.baud)
+    bridge = MQTTBridge(engine, config)
+    print(f"Bringing up WiFi '{config.ssid}' and MQTT {config.broker}:{config.broker_port}...")
+    start = time.monotonic()
+    bridge.start()
+    print(f"✅ Connected in {time.monotonic() - start:.1f}s, serving on {args.socket}")
+    server = BridgeServer(args.socket, bridge)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+        bridge.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Persistent MQTT bridge over the C5 AT port')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+
+    p = sub.add_parser('serve', help='Run the bridge daemon')
+    p.add_argument('--port', '-p', default=DEFAULT_PORT)
+    p.add_argument('--baud', '-b', type=int, default=DEFAULT_BAUD)
+    p.add_argument('--ssid', default=WIFI_SSID)
+    p.add_argument('--password', default=WIFI_PASSWORD)
+    p.add_argument('--broker', default='test.mosquitto.org')
+    p.add_argument('--broker-port', type=int, default=1883)
+    p.add_argument('--scheme', type=int, default=1, help='AT+MQTTUSERCFG scheme (1 = TCP)')
+    p.add_argument('--client-id', default='esp32c5_bridge')
+    p.add_argument('--sntp', action='store_true', help='Sync time before connecting')
+    p.add_argument('--aws', action='store_true', help='Use the AWS IoT settings from aws_with_certs.py')
+    p.add_argument('--socket', default=DEFAULT_SOCKET)
+
+    p = sub.add_parser('pub', help='Publish through a running bridge')
+    p.add_argument('topic')
+    p.add_argument('data')
+    p.add_argument('--qos', type=int, default=0)
+    p.add_argument('--socket', default=DEFAULT_SOCKET)
+
+    p = sub.add_parser('sub', help='Subscribe through a running bridge and print messages')
+    p.add_argument('topic')
+    p.add_argument('--qos', type=int, default=0)
+    p.add_argument('--socket', default=DEFAULT_SOCKET)
+
+    p = sub.add_parser('status', help='Show bridge link state')
+    p.add_argument('--socket', default=DEFAULT_SOCKET)
+
+    args = parser.parse_args()
+    if args.cmd == 'serve':
+        serve(args)
+        return
+
+    client = BridgeClient(args.socket)
+    if args.cmd == 'pub':
+        print(client.publish(args.topic, args.data, args.qos))
+    elif args.cmd == 'sub':
+        print(client.subscribe(args.topic, args.qos))
+        try:
+            for topic, data in client.messages():
+                print(f"{topic}: {data}")
+        except KeyboardInterrupt:
+            pass
+    elif args.cmd == 'status':
+        print(json.dumps(client.request(op='status'), indent=2))
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
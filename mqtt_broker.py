@@ -0,0 +1,579 @@
+#!/usr/bin/env python3
+"""
+Minimal in-process MQTT 3.1.1 broker (and client) for offline tests.
+
+stable_wifi_mqtt.py and mqtt_with_params_form.py talk to
+test.mosquitto.org and aws_with_certs.py to AWS IoT, so round-trip times
+depend on the internet. This broker runs on the bench PC, or inside the
+test process next to at_simulator. It records when each publish arrives,
+which is what mqtt_latency.py measures against.
+
+Supported: CONNECT/CONNACK, PUBLISH at QoS 0 and 1 (PUBACK), SUBSCRIBE
+with + and # wildcards, UNSUBSCRIBE, retained messages, PINGREQ and
+DISCONNECT. QoS 2, will messages and persistent sessions are not
+implemented (QoS 2 is granted as 1). Authentication is not checked.
+
+TLS uses a self-signed certificate generated with the openssl command
+line tool, or a certificate and key you pass in. ESP-AT scheme 2 (TLS
+without certificate verification) connects to it as is.
+
+Usage:
+    python3 mqtt_broker.py                          # 0.0.0.0:1883
+    python3 mqtt_broker.py --port 8883 --tls        # self-signed TLS
+    python3 mqtt_broker.py --tls --cert c.pem --key k.pem --verbose
+
+From Python:
+    with MQTTBroker(port=0, on_publish=print) as broker:
+        client = MQTTClient('127.0.0.1', broker.port, 'probe')
+        client.subscribe('fov/#')
+        broker.publish('fov/test', b'hello')
+
+Requirements:
+    openssl (command line) for --tls without --cert/--key
+"""
+
+import argparse
+import os
+import socket
+import socketserver
+import ssl
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+
+DEFAULT_MQTT_PORT = 1883
+DEFAULT_MQTTS_PORT = 8883
+
+# Control packet types (high nibble of the fixed header)
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+class MQTTProtocolError(Exception):
+    """Malformed or unsupported packet."""
+
+
+def topic_matches(pattern, topic):
+    """MQTT topic filter match with + and # wildcards."""
+    p_parts = pattern.split('/')
+    t_parts = topic.split('/')
+    for i, part in enumerate(p_parts):
+        if part == '#':
+            return True
+        if i >= len(t_parts) or (part != '+' and part != t_parts[i]):
+            return False
+    return len(p_parts) == len(t_parts)
+
+
+# -- packet codec --------------------------------------------------------------
+
+def encode_packet(kind, flags, body=b''):
+    """Fixed header (type, flags, remaining length) + body."""
+    header = bytes([(kind << 4) | flags])
+    length = len(body)
+    while True:
+        byte, length = length % 128, length // 128
+        header += bytes([byte | (0x80 if length else 0)])
+        if not length:
+            return header + body
+
+
+def encode_string(text):
+    data = text.encode() if isinstance(text, str) else text
+    return struct.pack('>H', len(data)) + data
+
+
+def decode_string(body, offset):
+    (length,) = struct.unpack_from('>H', body, offset)
+    start = offset + 2
+    return body[start:start + length].decode(), start + length
+
+
+def read_packet(sock):
+    """
+    Read one packet.
+
+    Returns:
+        (type, flags, body), or None when the connection is closed
+    """
+    first = _read_exact(sock, 1)
+    if first is None:
+        return None
+    length, shift = 0, 0
+    while True:
+        byte = _read_exact(sock, 1)
+        if byte is None:
+            return None
+        length |= (byte[0] & 0x7F) << shift
+        if not byte[0] & 0x80:
+            break
+        shift += 7
+        if shift > 21:
+            raise MQTTProtocolError('remaining length too long')
+    body = _read_exact(sock, length) if length else b''
+    if body is None:
+        return None
+    return first[0] >> 4, first[0] & 0x0F, body
+
+
+def _read_exact(sock, n):
+    data = b''
+    while len(data) < n:
+        try:
+            chunk = sock.recv(n - len(data))
+        except (OSError, ssl.SSLError):
+            return None
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def publish_packet(topic, payload, qos=0, retain=False, packet_id=1):
+    body = encode_string(topic)
+    if qos:
+        body += struct.pack('>H', packet_id)
+    return encode_packet(PUBLISH, (qos << 1) | int(retain), body + payload)
+
+
+def parse_publish(flags, body):
+    """Returns (topic, payload, qos, retain, packet_id)."""
+    qos = (flags >> 1) & 0x03
+    topic, offset = decode_string(body, 0)
+    packet_id = None
+    if qos:
+        (packet_id,) = struct.unpack_from('>H', body, offset)
+        offset += 2
+    return topic, body[offset:], qos, bool(flags & 0x01), packet_id
+
+
+def self_signed_context(directory=None, common_name='localhost'):
+    """
+    Server SSLContext with a throwaway self-signed certificate.
+
+    Args:
+        directory: Where to write cert.pem / key.pem (default: a temp dir)
+
+    Raises:
+        RuntimeError if the openssl command line tool is not available
+    """
+    directory = directory or tempfile.mkdtemp(prefix='fov-mqtt-')
+    cert, key = os.path.join(directory, 'cert.pem'), os.path.join(directory, 'key.pem')
+    if not (os.path.exists(cert) and os.path.exists(key)):
+        try:
+            subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '30',
+                            '-subj', f'/CN={common_name}', '-keyout', key, '-out', cert],
+                           check=True, capture_output=True)
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise RuntimeError(f"could not create a self-signed certificate with openssl: {e}")
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    return context
+
+
+# -- broker ----------------------------------------------------------------------
+
+class _Session:
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.client_id = None
+        self.subscriptions = {}  # filter -> granted qos, guarded by MQTTBroker._lock
+        self.lock = threading.Lock()
+        self.next_id = 0
+
+    def send(self, data):
+        with self.lock:
+            self.sock.sendall(data)
+
+    def packet_id(self):
+        with self.lock:
+            self.next_id = self.next_id % 65535 + 1
+            return self.next_id
+
+
+class _BrokerHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        broker = self.server.broker
+        sock = self.request
+        if broker.tls is not None:
+            # Handshake on this connection's thread, so a client that never
+            # sends a ClientHello doesn't hold up the accept loop
+            try:
+                sock = broker.tls.wrap_socket(sock, server_side=True)
+            except OSError as e:  # ssl.SSLError included
+                broker._log(f"{self.client_address}: TLS handshake failed: {e}")
+                return
+        broker._serve(_Session(sock, self.client_address))
+
+
+class _BrokerServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def get_request(self):
+        sock, address = super().get_request()
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock, address
+
+
+class MQTTBroker:
+    """
+    Threaded MQTT 3.1.1 broker.
+
+    Args:
+        host: Interface to listen on ('0.0.0.0' to accept a real board)
+        port: TCP port, 0 for any free port (see .port after start())
+        tls: ssl.SSLContext, or True for a self-signed certificate
+        on_publish: Called as on_publish(client_id, topic, payload, at) for
+            every PUBLISH received from a client, `at` being time.monotonic()
+            when the packet was read
+        verbose: Print connects, subscriptions and publishes
+    """
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_MQTT_PORT, tls=None, on_publish=None, verbose=False):
+        self.host = host
+        self.port = port
+        self.tls = self_signed_context() if tls is True else tls
+        self.on_publish = on_publish
+        self.verbose = verbose
+        self.retained = {}
+        self.sessions = set()
+        self.received = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """Listen and serve in a background thread. Returns the port."""
+        self._server = _BrokerServer((self.host, self.port), _BrokerHandler)
+        self._server.broker = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.port
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        with self._lock:
+            sessions = list(self.sessions)
+        for session in sessions:
+            try:
+                session.sock.close()
+            except OSError:
+                pass
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _log(self, message):
+        if self.verbose:
+            print(f"[broker] {message}")
+
+    def disconnect(self, client_id=None):
+        """Drop client connections (all, or one client id), as a broker restart would."""
+        with self._lock:
+            sessions = [s for s in self.sessions if client_id in (None, s.client_id)]
+        for session in sessions:
+            try:
+                session.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        """Publish from the broker side to every matching subscriber."""
+        if isinstance(payload, str):
+            payload = payload.encode()
+        if retain:
+            with self._lock:
+                if payload:
+                    self.retained[topic] = payload
+                else:
+                    self.retained.pop(topic, None)
+        with self._lock:
+            # Subscriptions change on the sessions' own threads, so match under the lock
+            targets = [(session, [q for pattern, q in session.subscriptions.items()
+                                  if topic_matches(pattern, topic)])
+                       for session in self.sessions]
+        for session, granted in targets:
+            if granted:
+                level = min(qos, max(granted))
+                try:
+                    session.send(publish_packet(topic, payload, level, packet_id=session.packet_id()))
+                except OSError:
+                    pass
+
+    def _serve(self, session):
+        try:
+            packet = read_packet(session.sock)
+            if packet is None or packet[0] != CONNECT:
+                return
+            self._connect(session, packet[2])
+            with self._lock:
+                self.sessions.add(session)
+            while True:
+                packet = read_packet(session.sock)
+                if packet is None:
+                    break
+                kind, flags, body = packet
+                if kind == PUBLISH:
+                    self._on_publish(session, flags, body, time.monotonic())
+                elif kind == SUBSCRIBE:
+                    self._subscribe(session, body)
+                elif kind == UNSUBSCRIBE:
+                    self._unsubscribe(session, body)
+                elif kind == PINGREQ:
+                    session.send(encode_packet(PINGRESP, 0))
+                elif kind == DISCONNECT:
+                    break
+                # PUBACK from a subscriber: nothing is kept in flight, nothing to do
+        except (MQTTProtocolError, struct.error, UnicodeDecodeError) as e:
+            self._log(f"{session.client_id or session.address}: {e}")
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self.sessions.discard(session)
+            self._log(f"{session.client_id or session.address} disconnected")
+            try:
+                session.sock.close()
+            except OSError:
+                pass
+
+    def _connect(self, session, body):
+        name, offset = decode_string(body, 0)
+        level = body[offset]
+        if name != 'MQTT' or level != 4:
+            session.send(encode_packet(CONNACK, 0, b'\x00\x01'))  # unacceptable protocol version
+            raise MQTTProtocolError(f"protocol {name!r} level {level}")
+        session.client_id, _ = decode_string(body, offset + 4)  # skip level, flags, keepalive
+        session.send(encode_packet(CONNACK, 0, b'\x00\x00'))
+        self._log(f"{session.client_id} connected from {session.address[0]}")
+
+    def _on_publish(self, session, flags, body, at):
+        topic, payload, qos, retain, packet_id = parse_publish(flags, body)
+        if qos == 1:
+            session.send(encode_packet(PUBACK, 0, struct.pack('>H', packet_id)))
+        elif qos == 2:
+            raise MQTTProtocolError('QoS 2 publish is not supported')
+        with self._lock:
+            self.received += 1
+        self._log(f"{session.client_id} -> {topic} ({len(payload)} bytes)")
+        if self.on_publish:
+            self.on_publish(session.client_id, topic, payload, at)
+        self.publish(topic, payload, qos, retain)
+
+    def _subscribe(self, session, body):
+        (packet_id,) = struct.unpack_from('>H', body, 0)
+        offset, granted, filters = 2, b'', []
+        while offset < len(body):
+            pattern, offset = decode_string(body, offset)
+            qos = min(body[offset] & 0x03, 1)
+            offset += 1
+            with self._lock:
+                session.subscriptions[pattern] = qos
+            granted += bytes([qos])
+            filters.append(pattern)
+        session.send(encode_packet(SUBACK, 0, struct.pack('>H', packet_id) + granted))
+        self._log(f"{session.client_id} subscribed {', '.join(filters)}")
+        with self._lock:
+            retained = [(t, p) for t, p in self.retained.items() if any(topic_matches(f, t) for f in filters)]
+        for topic, payload in retained:
+            session.send(publish_packet(topic, payload, 0, retain=True))
+
+    def _unsubscribe(self, session, body):
+        (packet_id,) = struct.unpack_from('>H', body, 0)
+        offset = 2
+        while offset < len(body):
+            pattern, offset = decode_string(body, offset)
+            with self._lock:
+                session.subscriptions.pop(pattern, None)
+        session.send(encode_packet(UNSUBACK, 0, struct.pack('>H', packet_id)))
+
+
+# -- client ------------------------------------------------------------------------
+
+class MQTTClient:
+    """
+    Small blocking MQTT 3.1.1 client (what at_simulator uses for a real broker).
+
+    Args:
+        host, port: Broker address
+        client_id: Client identifier
+        username, password: Sent in CONNECT when given
+        tls: ssl.SSLContext to wrap the connection in, or None
+        on_message: Called as on_message(topic, payload) for incoming publishes
+        on_disconnect: Called once when the connection is lost
+        timeout: Seconds to wait for CONNACK / SUBACK / PUBACK
+
+    Raises:
+        OSError if the broker cannot be reached, MQTTProtocolError if it
+        refuses the connection
+    """
+
+    def __init__(self, host, port=DEFAULT_MQTT_PORT, client_id='fov', username='', password='',
+                 tls=None, on_message=None, on_disconnect=None, timeout=5, keepalive=120):
+        self.on_message = on_message
+        self.on_disconnect = on_disconnect
+        self.timeout = timeout
+        self._acks = {}
+        self._cond = threading.Condition()
+        self._send_lock = threading.Lock()
+        self._next_id = 0
+        self._closed = False
+        sock = socket.create_connection((host, port), timeout=timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if tls is not None:
+            sock = tls.wrap_socket(sock, server_hostname=host)
+        sock.settimeout(None)
+        self.sock = sock
+
+        flags = 0x02  # clean session
+        payload = encode_string(client_id)
+        if username:
+            flags |= 0x80
+            payload += encode_string(username)
+        if password:
+            flags |= 0x40
+            payload += encode_string(password)
+        body = encode_string('MQTT') + bytes([4, flags]) + struct.pack('>H', keepalive) + payload
+        sock.sendall(encode_packet(CONNECT, 0, body))
+        sock.settimeout(timeout)
+        packet = read_packet(sock)
+        sock.settimeout(None)
+        if packet is None or packet[0] != CONNACK or packet[2][1] != 0:
+            sock.close()
+            raise MQTTProtocolError(f"connection refused: {packet}")
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+
+    def _packet_id(self):
+        with self._cond:
+            self._next_id = self._next_id % 65535 + 1
+            return self._next_id
+
+    def _send(self, data):
+        with self._send_lock:
+            self.sock.sendall(data)
+
+    def _wait_ack(self, kind, packet_id):
+        with self._cond:
+            ok = self._cond.wait_for(lambda: (kind, packet_id) in self._acks or self._closed, self.timeout)
+            body = self._acks.pop((kind, packet_id), None)
+        if not ok or body is None:
+            raise TimeoutError(f"no ack for packet {packet_id}")
+        return body
+
+    def subscribe(self, topic, qos=0):
+        """Subscribe and wait for SUBACK. Returns the granted QoS."""
+        packet_id = self._packet_id()
+        self._send(encode_packet(SUBSCRIBE, 0x02, struct.pack('>H', packet_id) + encode_string(topic) + bytes([qos])))
+        return self._wait_ack(SUBACK, packet_id)[0]
+
+    def unsubscribe(self, topic):
+        packet_id = self._packet_id()
+        self._send(encode_packet(UNSUBSCRIBE, 0x02, struct.pack('>H', packet_id) + encode_string(topic)))
+        self._wait_ack(UNSUBACK, packet_id)
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        """Publish; at QoS 1 this waits for the PUBACK."""
+        if isinstance(payload, str):
+            payload = payload.encode()
+        packet_id = self._packet_id() if qos else 0
+        self._send(publish_packet(topic, payload, min(qos, 1), retain, packet_id))
+        if qos:
+            self._wait_ack(PUBACK, packet_id)
+
+    def _read_loop(self):
+        while True:
+            try:
+                packet = read_packet(self.sock)
+            except MQTTProtocolError:
+                packet = None
+            if packet is None:
+                break
+            kind, flags, body = packet
+            if kind == PUBLISH:
+                topic, payload, qos, _, packet_id = parse_publish(flags, body)
+                if qos:
+                    self._send(encode_packet(PUBACK, 0, struct.pack('>H', packet_id)))
+                if self.on_message:
+                    self.on_message(topic, payload)
+            elif kind in (SUBACK, UNSUBACK, PUBACK):
+                (packet_id,) = struct.unpack_from('>H', body, 0)
+                with self._cond:
+                    self._acks[(kind, packet_id)] = body[2:]
+                    self._cond.notify_all()
+        with self._cond:
+            was_closed = self._closed
+            self._closed = True
+            self._cond.notify_all()
+        if not was_closed and self.on_disconnect:
+            self.on_disconnect()
+
+    def close(self):
+        """Send DISCONNECT and close (on_disconnect is not called)."""
+        with self._cond:
+            self._closed = True
+        try:
+            self._send(encode_packet(DISCONNECT, 0))
+        except OSError:
+            pass
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local MQTT 3.1.1 broker for offline tests')
+    parser.add_argument('--host', default='0.0.0.0', help='Interface to listen on (default: all)')
+    parser.add_argument('--port', type=int, help='Default 1883, or 8883 with --tls')
+    parser.add_argument('--tls', action='store_true', help='Serve MQTT over TLS')
+    parser.add_argument('--cert', help='PEM certificate (default: self-signed)')
+    parser.add_argument('--key', help='PEM private key for --cert')
+    parser.add_argument('--verbose', '-v', action='store_true')
+    args = parser.parse_args()
+
+    tls = None
+    if args.tls:
+        if args.cert:
+            tls = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            tls.load_cert_chain(args.cert, args.key)
+        else:
+            try:
+                tls = self_signed_context()
+            except RuntimeError as e:
+                print(f"❌ {e}")
+                raise SystemExit(1)
+    port = args.port or (DEFAULT_MQTTS_PORT if args.tls else DEFAULT_MQTT_PORT)
+    broker = MQTTBroker(args.host, port, tls=tls, verbose=args.verbose)
+    try:
+        broker.start()
+    except OSError as e:
+        print(f"❌ Could not listen on {args.host}:{port}: {e}")
+        raise SystemExit(1)
+    print(f"MQTT broker on {args.host}:{broker.port}" + (' (TLS)' if tls else ''))
+    print("Ctrl-C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.stop()
+        print(f"{broker.received} publishes received")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+End-to-end MQTT latency and throughput through the modem, against a local broker.
+
+Runs mqtt_broker.MQTTBroker in this process and brings the modem's MQTT
+session up against it. The host and broker share one clock, so both
+directions are measured without clock sync:
+
+    uplink    AT+MQTTPUB written to the UART -> PUBLISH read by the broker
+              (AT+MQTTPUBRAW once the command would pass the AT line limit)
+    downlink  broker publishes                -> +MQTTSUBRECV framed on the host
+
+Each direction is measured one message at a time (latency percentiles),
+then as a burst of back-to-back messages (throughput, and messages lost).
+
+With --simulate the modem is at_simulator connected to the broker over
+loopback, so the whole path runs offline. With a real board, the board
+must reach this PC: pass its LAN address with --host.
+
+Usage:
+    python3 mqtt_latency.py --simulate
+    python3 mqtt_latency.py --simulate --tls --qos 1 --size 256 --count 200
+    python3 mqtt_latency.py --port /dev/ttyUSB0 --host 192.168.1.20 --ssid tim --password password
+    python3 mqtt_latency.py --simulate --json latency.json
+
+Requirements:
+    pip install pyserial
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+
+import serial
+
+from at_engine import ATEngine
+from at_parsers import MQTTSubRecv, parse_line
+from at_transport import DEFAULT_BAUD, DEFAULT_PORT
+from benchmark import summarize
+from bringup import WIFI_PASSWORD, WIFI_SSID, BridgeConfig, BringUp, mqtt_stages
+from mqtt_broker import DEFAULT_MQTT_PORT, DEFAULT_MQTTS_PORT, MQTTBroker
+from mqtt_publisher import publish_command
+
+TOPIC_PREFIX = 'fov/latency'
+SEQ_DIGITS = 6  # payloads start with a zero-padded sequence number
+DELIVERY_TIMEOUT = 5
+
+
+class LatencyHarness:
+    """
+    Times publishes in both directions between an ATEngine and an MQTTBroker.
+
+    Args:
+        engine: ATEngine with the MQTT session up and subscribed to down_topic
+        broker: MQTTBroker the modem is connected to
+        qos: QoS for both directions (0 or 1)
+        size: Payload bytes (at least SEQ_DIGITS)
+    """
+
+    def __init__(self, engine, broker, qos=0, size=16, topic_prefix=TOPIC_PREFIX):
+        self.engine = engine
+        self.broker = broker
+        self.qos = qos
+        self.size = max(size, SEQ_DIGITS)
+        self.up_topic = f'{topic_prefix}/up'
+        self.down_topic = f'{topic_prefix}/down'
+        self._cond = threading.Condition()
+        self._up = {}    # seq -> broker arrival time
+        self._down = {}  # seq -> host arrival time
+        broker.on_publish = self._on_broker_publish
+        engine.on_urc('+MQTTSUBRECV', self._on_subrecv)
+
+    def _payload(self, seq):
+        return f'{seq:0{SEQ_DIGITS}d}'.ljust(self.size, 'x')
+
+    def _on_broker_publish(self, client_id, topic, payload, at):
+        if topic == self.up_topic:
+            with self._cond:
+                self._up.setdefault(int(payload[:SEQ_DIGITS]), at)
+                self._cond.notify_all()
+
+    def _on_subrecv(self, line):
+        at = time.monotonic()
+        record = parse_line(line)
+        if isinstance(record, MQTTSubRecv) and record.topic == self.down_topic:
+            with self._cond:
+                self._down.setdefault(int(record.data[:SEQ_DIGITS]), at)
+                self._cond.notify_all()
+
+    def _wait(self, arrivals, seqs, timeout=DELIVERY_TIMEOUT):
+        with self._cond:
+            self._cond.wait_for(lambda: all(s in arrivals for s in seqs), timeout)
+            return {s: arrivals[s] for s in seqs if s in arrivals}
+
+    def _publish(self, seq):
+        """Submit the publish for seq; returns the engine future."""
+        cmd, raw = publish_command(self.up_topic, self._payload(seq), self.qos)
+        if raw is None:
+            return self.engine.submit(cmd, timeout=10)
+        return self.engine.submit_data(cmd, raw, timeout=10)
+
+    def uplink(self, count, start=0):
+        """
+        Publish from the modem one at a time.
+
+        Returns:
+            (latencies to the broker, command round trips until OK, in seconds;
+            publishes the modem answered with ERROR or not at all)
+        """
+        latencies, acks = [], []
+        errors = 0
+        for seq in range(start, start + count):
+            response = self._publish(seq).result()
+            if not response.ok:
+                errors += 1
+                continue
+            acks.append(response.elapsed)
+            arrived = self._wait(self._up, [seq])
+            if seq in arrived:
+                latencies.append(arrived[seq] - response.sent_at)
+        return latencies, acks, errors
+
+    def downlink(self, count, start=0):
+        """Publish from the broker one at a time; returns latencies to +MQTTSUBRECV."""
+        latencies = []
+        for seq in range(start, start + count):
+            sent = time.monotonic()
+            self.broker.publish(self.down_topic, self._payload(seq), self.qos)
+            arrived = self._wait(self._down, [seq])
+            if seq in arrived:
+                latencies.append(arrived[seq] - sent)
+        return latencies
+
+    def uplink_burst(self, count, start=0):
+        """
+        Queue count publishes back to back on the engine.
+
+        Returns:
+            (messages per second at the broker, messages lost, publishes
+            that failed on the modem)
+        """
+        seqs = list(range(start, start + count))
+        begin = time.monotonic()
+        futures = [self._publish(seq) for seq in seqs]
+        arrived = self._wait(self._up, seqs, DELIVERY_TIMEOUT + count * 0.1)
+        errors = sum(not f.result().ok for f in futures)
+        return _rate(begin, arrived), count - len(arrived) - errors, errors
+
+    def downlink_burst(self, count, start=0):
+        """Publish count messages from the broker at once; returns (messages/s at the host, lost)."""
+        seqs = list(range(start, start + count))
+        begin = time.monotonic()
+        for seq in seqs:
+            self.broker.publish(self.down_topic, self._payload(seq), self.qos)
+        arrived = self._wait(self._down, seqs, DELIVERY_TIMEOUT + count * 0.1)
+        return _rate(begin, arrived), count - len(arrived)
+
+    def run(self, count=50, burst=100):
+        """All four measurements. Returns a report dict (seconds, messages/s)."""
+        up, acks, up_errors = self.uplink(count)
+        down = self.downlink(count)
+        up_rate, up_lost, burst_errors = self.uplink_burst(burst, start=count)
+        down_rate, down_lost = self.downlink_burst(burst, start=count)
+        return {
+            'qos': self.qos,
+            'size': self.size,
+            'uplink': summarize(up),
+            'uplink_ack': summarize(acks),
+            'downlink': summarize(down),
+            'lost': {'uplink': count - len(up) - up_errors, 'downlink': count - len(down),
+                     'uplink_burst': up_lost, 'downlink_burst': down_lost},
+            'errors': {'uplink': up_errors, 'uplink_burst': burst_errors},
+            'throughput': {'uplink': up_rate, 'downlink': down_rate, 'burst': burst},
+        }
+
+
+def _rate(begin, arrived):
+    if not arrived:
+        return 0.0
+    span = max(arrived.values()) - begin
+    return len(arrived) / span if span > 0 else None
+
+
+def _ms(value):
+    return f"{value * 1000:8.2f}" if value is not None else '       -'
+
+
+def print_report(report):
+    print(f"\nQoS {report['qos']}, {report['size']} byte payloads")
+    print(f"{'':<22} {'n':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for key, label in (('uplink', 'uplink (to broker)'), ('uplink_ack', 'uplink (AT OK)'),
+                       ('downlink', 'downlink (SUBRECV)')):
+        s = report[key]
+        print(f"{label:<22} {s['n']:>4} {_ms(s['p50'])} {_ms(s['p95'])} {_ms(s['p99'])} {_ms(s['max'])}")
+    t = report['throughput']
+    lost = report['lost']
+    print(f"\nBurst of {t['burst']}: uplink {t['uplink'] or 0:.0f} msg/s, downlink {t['downlink'] or 0:.0f} msg/s")
+    if any(lost.values()):
+        print(f"⚠️ Lost: {', '.join(f'{k} {v}' for k, v in lost.items() if v)}")
+    else:
+        print("✅ No messages lost")
+    errors = report['errors']
+    if any(errors.values()):
+        print(f"❌ Publishes refused by the modem: {', '.join(f'{k} {v}' for k, v in errors.items() if v)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MQTT pub/sub latency through the modem to a local broker')
+    parser.add_argument('--port', '-p', default=DEFAULT_PORT)
+    parser.add_argument('--baud', '-b', type=int, default=DEFAULT_BAUD)
+    parser.add_argument('--simulate', action='store_true', help='Use at_simulator connected to the broker')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='Address the board uses to reach this PC (real board only)')
+    parser.add_argument('--broker-port', type=int, help='Default 1883, or 8883 with --tls (0 = any)')
+    parser.add_argument('--tls', action='store_true',
+                        help='Serve TLS with a self-signed cert; the modem uses scheme 2 (no verify)')
+    parser.add_argument('--ssid', default=WIFI_SSID)
+    parser.add_argument('--password', default=WIFI_PASSWORD)
+    parser.add_argument('--qos', type=int, choices=(0, 1), default=0)
+    parser.add_argument('--size', type=int, default=16, help='Payload bytes (default: 16)')
+    parser.add_argument('--count', '-n', type=int, default=50, help='Messages timed one by one per direction')
+    parser.add_argument('--burst', type=int, default=100, help='Messages per throughput burst')
+    parser.add_argument('--json', help='Write the report to this file')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Log broker activity')
+    args = parser.parse_args()
+
+    port = args.broker_port
+    if port is None:
+        port = 0 if args.simulate else (DEFAULT_MQTTS_PORT if args.tls else DEFAULT_MQTT_PORT)
+    # A real board connects over the LAN; the simulator over loopback
+    broker = MQTTBroker('127.0.0.1' if args.simulate else '0.0.0.0', port, tls=args.tls or None,
+                        verbose=args.verbose)
+    try:
+        broker.start()
+    except (OSError, RuntimeError) as e:
+        print(f"❌ Could not start the broker: {e}")
+        sys.exit(1)
+    print(f"Broker on port {broker.port}" + (' (TLS)' if args.tls else ''))
+
+    modem = None
+    serial_port = args.port
+    if args.simulate:
+        from at_simulator import SimulatedModem
+        modem = SimulatedModem(mqtt_broker=('127.0.0.1', broker.port))
+        serial_port = modem.start()
+
+    try:
+        engine = ATEngine.open(serial_port, args.baud)
+    except serial.SerialException as e:
+        print(f"ERROR: Could not open serial port: {e}")
+        broker.stop()
+        sys.exit(1)
+
+    report = None
+    try:
+        if modem:
+            engine.transport.wait_for('ready', timeout=2)
+        config = BridgeConfig(args.ssid, args.password, args.host, broker.port,
+                              scheme=2 if args.tls else 1, client_id='fov_latency')
+        harness = LatencyHarness(engine, broker, qos=args.qos, size=args.size)
+        result = BringUp(engine, mqtt_stages(config, [harness.down_topic], reconnect=0)).run()
+        if not result.ok:
+            failed = result.failed[0]
+            print(f"❌ MQTT bring-up failed at {failed.name}: {failed.error}")
+        else:
+            print(f"✅ Connected in {result.elapsed:.2f}s, measuring...")
+            report = harness.run(args.count, args.burst)
+            engine.submit('AT+MQTTCLEAN=0').result()
+    finally:
+        engine.close()
+        if modem:
+            modem.stop()
+        broker.stop()
+
+    if report is None:
+        sys.exit(1)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if any(report['errors'].values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
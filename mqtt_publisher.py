@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Batched MQTT publisher with per-topic coalescing and AT+MQTTPUBRAW.
+
+stable_wifi_mqtt.py and aws_with_certs.py publish with one AT+MQTTPUB and a
+3 second sleep per message, and a payload containing a quote, comma or
+newline breaks the command. This publisher queues messages, coalesces them
+per topic over a short window (a sensor that reports faster than the link
+can carry only needs its latest value sent), and keeps the ATEngine pipeline
+full with up to --in-flight publishes submitted back to back. Payloads that
+cannot be sent as an AT string parameter - binary data, CR/LF, or a command
+over the 256 byte AT line limit - go out as AT+MQTTPUBRAW with the raw bytes
+after the '>' prompt.
+
+ESP-AT still executes one command at a time; "in flight" means queued on
+the host and written the moment the previous publish finishes.
+
+Usage:
+    python3 mqtt_publisher.py --port /dev/ttyUSB0 --topics 8 --rate 200 --duration 10
+    python3 mqtt_publisher.py --simulate --size 512 --binary
+
+From Python:
+    publisher = BatchPublisher(engine, window=0.05)
+    publisher.publish('fov/sensor/1', b'\\x01\\x02')
+    publisher.flush()
+    print(publisher.report())
+
+Requirements:
+    pip install pyserial
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+from at_engine import ATEngine
+from at_transport import AT_LINE_MAX, DEFAULT_BAUD, DEFAULT_PORT, quote
+from benchmark import percentile
+from bringup import BridgeConfig
+
+PUBLISH_TIMEOUT = 10
+DEFAULT_WINDOW = 0.05  # seconds to collect messages per topic before sending
+DEFAULT_IN_FLIGHT = 8
+
+
+def publish_command(topic, payload, qos=0, retain=0, link_id=0):
+    """
+    Build the AT command for one publish.
+
+    Args:
+        topic: MQTT topic
+        payload: str or bytes
+        qos, retain: MQTT publish flags
+
+    Returns:
+        (command, data) - data is None for AT+MQTTPUB, otherwise the raw
+        bytes to send after the AT+MQTTPUBRAW prompt
+    """
+    if isinstance(payload, str):
+        raw = payload.encode()
+        text = payload
+    else:
+        raw = bytes(payload)
+        try:
+            text = raw.decode('utf-8')
+        except UnicodeDecodeError:
+            text = None
+    if text is not None and not any(c in text for c in '\r\n\0'):
+        cmd = f'AT+MQTTPUB={link_id},{quote(topic)},{quote(text)},{qos},{retain}'
+        if len(cmd) + 2 <= AT_LINE_MAX:
+            return cmd, None
+    return f'AT+MQTTPUBRAW={link_id},{quote(topic)},{len(raw)},{qos},{retain}', raw
+
+
+class _Pending:
+    """A topic's queued message; later publishes replace (or join) it."""
+
+    def __init__(self, payload, qos, retain, queued_at):
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.queued_at = queued_at
+        self.count = 1
+
+
+class BatchPublisher:
+    """
+    Queue publishes and send them through an ATEngine in coalesced batches.
+
+    Args:
+        engine: ATEngine with an MQTT connection already up
+        window: Seconds a topic's first queued message waits for newer ones
+            before it is sent (0 sends as soon as a slot is free)
+        max_in_flight: Publishes submitted to the engine but not finished
+        join: None to keep only the latest payload per topic, or a separator
+            (e.g. b'\\n') to send all payloads of a window joined together
+        link_id: MQTT LinkID used in the AT commands
+    """
+
+    def __init__(self, engine, window=DEFAULT_WINDOW, max_in_flight=DEFAULT_IN_FLIGHT,
+                 join=None, link_id=0):
+        self.engine = engine
+        self.window = window
+        self.join = join
+        self.link_id = link_id
+        self.queued = 0
+        self.coalesced = 0
+        self.published = 0
+        self.failed = 0
+        self.raw = 0
+        self.bytes = 0
+        self.latencies = []  # seconds on the wire per publish
+        self.started = None
+        self.finished = None
+        self._pending = {}  # topic -> _Pending, in first-arrival order
+        self._in_flight = 0
+        self._slots = threading.Semaphore(max_in_flight)
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def publish(self, topic, payload, qos=0, retain=0):
+        """Queue a message (str or bytes). Returns immediately."""
+        now = time.monotonic()
+        with self._cond:
+            self.queued += 1
+            if self.started is None:
+                self.started = now
+            entry = self._pending.get(topic)
+            if entry is None:
+                self._pending[topic] = _Pending(payload, qos, retain, now)
+                self._cond.notify_all()
+                return
+            self.coalesced += 1
+            entry.count += 1
+            entry.qos, entry.retain = qos, retain
+            if self.join is None:
+                entry.payload = payload
+            else:
+                entry.payload = _as_bytes(entry.payload) + _as_bytes(self.join) + _as_bytes(payload)
+
+    def _due(self, now):
+        """Topics whose window has expired, oldest first."""
+        return [topic for topic, entry in self._pending.items()
+                if now - entry.queued_at >= self.window]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stop and not self._pending:
+                        return
+                    now = time.monotonic()
+                    due = self._due(now) if not self._stop else list(self._pending)
+                    if due:
+                        break
+                    oldest = min((e.queued_at for e in self._pending.values()), default=None)
+                    self._cond.wait(None if oldest is None else oldest + self.window - now)
+            for topic in due:
+                # Messages arriving while we wait for a slot coalesce into _pending
+                self._slots.acquire()
+                with self._cond:
+                    entry = self._pending.pop(topic, None)
+                    if entry is None:
+                        self._slots.release()
+                        continue
+                    self._in_flight += 1
+                self._send(topic, entry)
+
+    def _send(self, topic, entry):
+        cmd, data = publish_command(topic, entry.payload, entry.qos, entry.retain, self.link_id)
+        if data is None:
+            future = self.engine.submit(cmd, timeout=PUBLISH_TIMEOUT)
+            size = len(_as_bytes(entry.payload))
+        else:
+            future = self.engine.submit_data(cmd, data, timeout=PUBLISH_TIMEOUT)
+            size = len(data)
+        future.add_done_callback(lambda f: self._done(f, size, data is not None))
+
+    def _done(self, future, size, raw):
+        try:
+            response = future.result()
+            ok = response.ok
+        except Exception:
+            response, ok = None, False
+        with self._cond:
+            if ok:
+                self.published += 1
+                self.bytes += size
+                self.raw += raw
+                self.latencies.append(response.elapsed)
+            else:
+                self.failed += 1
+            self._in_flight -= 1
+            self.finished = time.monotonic()
+            self._cond.notify_all()
+        self._slots.release()
+
+    def flush(self, timeout=None):
+        """Send everything queued now, without waiting out the window. Returns True when drained."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            for entry in self._pending.values():
+                entry.queued_at = float('-inf')
+            self._cond.notify_all()
+            while self._pending or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def report(self):
+        """Counters plus messages/second and payload bytes/second over the active period."""
+        with self._cond:
+            seconds = (self.finished - self.started) if self.started and self.finished else 0
+            return {
+                'queued': self.queued,
+                'coalesced': self.coalesced,
+                'published': self.published,
+                'failed': self.failed,
+                'raw': self.raw,
+                'bytes': self.bytes,
+                'seconds': seconds,
+                'msgs_per_s': self.published / seconds if seconds else None,
+                'bytes_per_s': self.bytes / seconds if seconds else None,
+                'latency_p50': percentile(self.latencies, 50),
+                'latency_p95': percentile(self.latencies, 95),
+            }
+
+    def close(self):
+        """Send what is queued, then stop the sender thread (the engine stays open)."""
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._thread.join()
+        self.flush()
+
+
+def _as_bytes(payload):
+    return payload.encode() if isinstance(payload, str) else bytes(payload)
+
+
+def generate_load(publisher, topics, rate, duration, size, binary):
+    """Publish `rate` messages/second round-robin over `topics` topics for `duration` seconds."""
+    interval = 1 / rate
+    deadline = time.monotonic() + duration
+    next_at = time.monotonic()
+    n = 0
+    while next_at < deadline:
+        topic = f'fov/sensor/{n % topics}'
+        if binary:
+            payload = os.urandom(size)
+        else:
+            payload = f'{{"seq":{n},"t":{time.time():.3f}}}'.ljust(size, ' ')
+        publisher.publish(topic, payload)
+        n += 1
+        next_at += interval
+        delay = next_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def print_report(report):
+    print(f"\nQueued {report['queued']}, coalesced {report['coalesced']}, "
+          f"published {report['published']} ({report['raw']} via MQTTPUBRAW), failed {report['failed']}")
+    if report['msgs_per_s'] is None:
+        print("❌ Nothing published")
+        return
+    print(f"✅ {report['msgs_per_s']:.1f} msgs/s, {report['bytes_per_s'] / 1024:.1f} KB/s payload "
+          f"over {report['seconds']:.2f}s")
+    print(f"   publish latency p50 {report['latency_p50'] * 1000:.0f} ms, "
+          f"p95 {report['latency_p95'] * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Batched MQTT publish throughput test')
+    parser.add_argument('--port', '-p', default=DEFAULT_PORT)
+    parser.add_argument('--baud', '-b', type=int, default=DEFAULT_BAUD)
+    parser.add_argument('--simulate', action='store_true', help='Run against at_simulator')
+    parser.add_argument('--broker', default='test.mosquitto.org')
+    parser.add_argument('--broker-port', type=int, default=1883)
+    parser.add_argument('--topics', type=int, default=4, help='Number of sensor topics')
+    parser.add_argument('--rate', type=float, default=100, help='Messages/second offered')
+    parser.add_argument('--duration', type=float, default=5, help='Seconds of load')
+    parser.add_argument('--size', type=int, default=32, help='Payload bytes')
+    parser.add_argument('--binary', action='store_true', help='Random binary payloads (MQTTPUBRAW)')
+    parser.add_argument('--window', type=float, default=DEFAULT_WINDOW,
+                        help=f'Coalescing window in seconds (default {DEFAULT_WINDOW})')
+    parser.add_argument('--in-flight', type=int, default=DEFAULT_IN_FLIGHT)
+    args = parser.parse_args()
+
+    modem = None
+    port = args.port
+    if args.simulate:
+        from at_simulator import SimulatedModem
+        modem = SimulatedModem(baud=args.baud, boot_time=0)
+        port = modem.start()
+
+    # Imported here: mqtt_bridge imports publish_command() from this module
+    from mqtt_bridge import MQTTBridge
+    try:
+        bridge = MQTTBridge(ATEngine.open(port, args.baud),
+                            BridgeConfig(broker=args.broker, broker_port=args.broker_port))
+        try:
+            bridge.start()
+        except Exception as e:
+            print(f"❌ MQTT bring-up failed: {e}")
+            bridge.close()
+            sys.exit(1)
+        print(f"Offering {args.rate:g} msgs/s of {args.size} bytes over {args.topics} topics "
+              f"for {args.duration:g}s")
+        publisher = BatchPublisher(bridge.engine, window=args.window, max_in_flight=args.in_flight)
+        generate_load(publisher, args.topics, args.rate, args.duration, args.size, args.binary)
+        publisher.close()
+        print_report(publisher.report())
+        bridge.close()
+    finally:
+        if modem:
+            modem.stop()
+
+
+if __name__ == "__main__":
+    main()
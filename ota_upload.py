@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Stream a firmware image into the C5's PSRAM buffer - Phase 2 of FOV OTA.
+
+Host side of the AT+FWBUF* command family that test_meminfo.py lists as the
+next phase. The image is memory-mapped and sent in chunks sliced from the
+map, with up to --window chunks sent but not yet committed by the
+modem. Progress is tracked from +FWBUFACK and checked against
+AT+FWBUFSTATUS?; after a disconnect the upload resumes from the last
+acknowledged offset instead of starting again.
+
+The modem only knows how many bytes it holds, not which image they came
+from, so the CRC32 of the whole image is recorded per port when a
+session starts (~/.cache/fov-at/ota_sessions.json, or FOV_OTA_SESSIONS).
+A later run resumes only if the buffered session has the same size and
+CRC32; otherwise the buffer is cleared and the upload starts over. Pass
+--resume to continue a session this host has no record of (e.g. one
+started from another PC) with the same image.
+
+Wire protocol:
+    AT+FWBUFSTATUS?                   -> +FWBUFSTATUS:<total>,<committed>  OK
+    AT+FWBUFCLEAR                     -> OK  (free the buffer)
+    AT+FWBUFDOWNLOAD=<total>          -> OK  (allocate, start a session)
+    AT+FWBUFDOWNLOAD=<off>,<len>,<crc32 hex>
+                                      -> OK  >  <len raw bytes>  OK
+    URC once a chunk is in PSRAM      -> +FWBUFACK:<off+len>
+
+Usage:
+    python3 ota_upload.py firmware.bin [--port /dev/ttyUSB1] [--chunk 4096] [--window 4]
+    python3 ota_upload.py firmware.bin --resume   # trust an unrecorded partial upload
+
+Requirements:
+    pip install pyserial
+"""
+
+import argparse
+import mmap
+import os
+import sys
+import threading
+import time
+import zlib
+
+import serial
+
+from at_parsers import FWBufAck, FWBufStatus, first, parse_line, parse_response
+from at_transport import ATTransport, DEFAULT_BAUD, DEFAULT_PORT
+from json_cache import load_json, save_json
+from test_meminfo import MIN_PSRAM_BYTES, format_bytes, parse_meminfo_response
+
+DEFAULT_CHUNK = 4096
+DEFAULT_WINDOW = 4
+MAX_CHUNK = 8192  # firmware UART receive buffer
+ACK_TIMEOUT = 5  # seconds without progress before giving up on the window
+CHUNK_RETRIES = 3  # consecutive failures of one chunk before giving up
+RECONNECT_ATTEMPTS = 5
+RECONNECT_DELAY = 1
+SESSION_PATH = os.environ.get('FOV_OTA_SESSIONS',
+                              os.path.expanduser('~/.cache/fov-at/ota_sessions.json'))
+
+
+class UploadError(Exception):
+    """Upload cannot continue (gate failed, modem refused, no progress)."""
+
+
+class AckTracker:
+    """Highest committed offset, fed by +FWBUFACK URCs from the reader thread."""
+
+    def __init__(self, offset=0):
+        self.offset = offset
+        self._cond = threading.Condition()
+
+    def __call__(self, line):
+        record = parse_line(line)
+        if isinstance(record, FWBufAck):
+            with self._cond:
+                if record.end > self.offset:
+                    self.offset = record.end
+                    self._cond.notify_all()
+
+    def wait_past(self, offset, timeout):
+        """Wait until the committed offset is >= offset. Returns True on success."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.offset >= offset, timeout)
+
+
+def query_status(at):
+    """Return (total, committed) from AT+FWBUFSTATUS?, or None if unsupported."""
+    status = first(parse_response(at.send('AT+FWBUFSTATUS?')), FWBufStatus)
+    return (status.total, status.committed) if status else None
+
+
+def check_memory(at, image_size):
+    """Gate on the Phase 1 PSRAM check before touching the buffer."""
+    response = at.send('AT+FWMEMINFO')
+    if '+FWMEMINFO:PSRAM' not in response:
+        raise UploadError('AT+FWMEMINFO not supported - run test_meminfo.py first')
+    mem = parse_meminfo_response(response.text)
+    need = max(MIN_PSRAM_BYTES, image_size)
+    if mem['psram_largest'] < need:
+        raise UploadError(f"largest PSRAM block {format_bytes(mem['psram_largest'])} "
+                          f"< required {format_bytes(need)}")
+    return mem
+
+
+def load_sessions(path=SESSION_PATH):
+    """Recorded sessions, {port: {'size': ..., 'crc32': ...}}."""
+    return load_json(path, 'session file')
+
+
+def record_session(port, size, crc, path=SESSION_PATH):
+    """Remember which image the buffer session on port belongs to."""
+    sessions = load_sessions(path)
+    sessions[port] = {'size': size, 'crc32': f'{crc:08x}'}
+    save_json(sessions, path)
+
+
+def start_session(at, size, crc, port, resume=False, path=SESSION_PATH):
+    """
+    Open (or resume) a buffer session for an image of size bytes.
+
+    A partial session is resumed only if it was recorded for this port with
+    the same size and CRC32, or if resume is set.
+
+    Returns:
+        Offset to continue from
+    """
+    status = query_status(at)
+    if status is None:
+        raise UploadError('AT+FWBUFSTATUS? not supported by this firmware')
+    total, committed = status
+    if total == size and 0 < committed <= size:
+        recorded = load_sessions(path).get(port)
+        if recorded == {'size': size, 'crc32': f'{crc:08x}'}:
+            print(f"Resuming from {format_bytes(committed)} already in PSRAM")
+            return committed
+        if resume:
+            print(f"⚠️  Resuming from {format_bytes(committed)} of an unrecorded session (--resume)")
+            record_session(port, size, crc, path)
+            return committed
+        reason = 'another image' if recorded else 'an unrecorded upload'
+        print(f"⚠️  PSRAM holds {format_bytes(committed)} of {reason}; starting over "
+              f"(--resume to keep it)")
+    if total:
+        at.send('AT+FWBUFCLEAR')
+    if not at.send(f'AT+FWBUFDOWNLOAD={size}').ok:
+        raise UploadError('modem refused to allocate the download buffer')
+    record_session(port, size, crc, path)
+    return 0
+
+
+def stream(at, image, start, chunk_size, window):
+    """
+    Send image[start:] in chunks with up to `window` unacknowledged.
+
+    Returns:
+        Committed offset when done (== len(image) on success)
+    """
+    size = len(image)
+    acks = AckTracker(start)
+    at.add_urc_listener(acks)
+    try:
+        offset = start
+        last_report = 0
+        failures = 0
+        while offset < size:
+            # Keep at most `window` chunks between sent and committed
+            if not acks.wait_past(offset - window * chunk_size, ACK_TIMEOUT):
+                raise UploadError(f"no +FWBUFACK past {acks.offset} for {ACK_TIMEOUT}s")
+            length = min(chunk_size, size - offset)
+            # A slice left alive (e.g. in a traceback) keeps the mmap from closing
+            payload = image[offset:offset + length]
+            try:
+                cmd = f'AT+FWBUFDOWNLOAD={offset},{length},{zlib.crc32(payload):08x}'
+                response = at.send_data(cmd, payload, timeout=ACK_TIMEOUT)
+            finally:
+                payload.release()
+            if not response.ok:
+                failures += 1
+                if failures > CHUNK_RETRIES:
+                    raise UploadError(f"{cmd}: {response.result or 'timeout'} "
+                                      f"{failures} times in a row")
+                # Rewind to what the modem has actually committed
+                status = query_status(at)
+                offset = status[1] if status else acks.offset
+                print(f"\n⚠️  {cmd}: {response.result or 'timeout'}, rewinding to {offset}")
+                continue
+            offset += length
+            failures = 0
+            if offset - last_report >= size // 20 or offset == size:
+                last_report = offset
+                print(f"\r   {offset * 100 // size:3d}%  {format_bytes(offset)}", end='', flush=True)
+        print()
+        if not acks.wait_past(size, ACK_TIMEOUT):
+            raise UploadError(f"last chunks not acknowledged (committed {acks.offset} of {size})")
+        return acks.offset
+    finally:
+        at.remove_urc_listener(acks)
+
+
+def upload(path, port=DEFAULT_PORT, baud=DEFAULT_BAUD, chunk_size=DEFAULT_CHUNK,
+           window=DEFAULT_WINDOW, resume=False):
+    """
+    Upload a firmware file, reconnecting and resuming on serial errors.
+
+    resume: Continue a partial session even if it was not recorded for this image
+
+    Returns:
+        dict with bytes, seconds, mb_per_s and reconnects
+    """
+    if not 0 < chunk_size <= MAX_CHUNK:
+        raise UploadError(f"chunk size must be 1..{MAX_CHUNK}")
+    size = os.path.getsize(path)
+    if size == 0:
+        raise UploadError(f"{path} is empty")
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        image = memoryview(mm)
+        crc = zlib.crc32(image)
+        try:
+            reconnects = 0
+            sent_from = None
+            start_time = None
+            while True:
+                try:
+                    with ATTransport.open(port, baud) as at:
+                        if not at.send('AT').ok:
+                            raise UploadError('no AT response')
+                        if start_time is None:
+                            check_memory(at, size)
+                        offset = start_session(at, size, crc, port, resume)
+                        if start_time is None:
+                            sent_from = offset
+                            start_time = time.monotonic()
+                        stream(at, image, offset, chunk_size, window)
+                        status = query_status(at)
+                        if status != (size, size):
+                            raise UploadError(f"FWBUFSTATUS reports {status}, expected ({size}, {size})")
+                    break
+                except (serial.SerialException, OSError) as e:
+                    reconnects += 1
+                    if reconnects > RECONNECT_ATTEMPTS:
+                        raise UploadError(f"giving up after {RECONNECT_ATTEMPTS} reconnects: {e}")
+                    print(f"\n⚠️  Serial error ({e}), reconnecting in {RECONNECT_DELAY}s...")
+                    time.sleep(RECONNECT_DELAY)
+            seconds = time.monotonic() - start_time
+        finally:
+            image.release()
+    sent = size - sent_from
+    return {
+        'bytes': sent,
+        'seconds': seconds,
+        'mb_per_s': sent / seconds / 1024 / 1024 if seconds else None,
+        'reconnects': reconnects,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Upload firmware into the ESP32-C5 PSRAM buffer')
+    parser.add_argument('firmware', help='Firmware image (.bin)')
+    parser.add_argument('--port', '-p', default=DEFAULT_PORT)
+    parser.add_argument('--baud', '-b', type=int, default=DEFAULT_BAUD)
+    parser.add_argument('--chunk', type=int, default=DEFAULT_CHUNK,
+                        help=f'Chunk size in bytes (max {MAX_CHUNK}, default {DEFAULT_CHUNK})')
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW,
+                        help=f'Chunks in flight before waiting for an ack (default {DEFAULT_WINDOW})')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue a partial upload even if this host did not record it for this image')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("FOV OTA - Phase 2: Firmware Buffer Download")
+    print("=" * 60)
+    print(f"\n{args.firmware}: {format_bytes(os.path.getsize(args.firmware))}")
+    print(f"Port {args.port} at {args.baud} baud, {args.chunk} byte chunks, window {args.window}\n")
+
+    try:
+        stats = upload(args.firmware, args.port, args.baud, args.chunk, args.window, args.resume)
+    except UploadError as e:
+        print(f"\n❌ UPLOAD FAILED: {e}")
+        sys.exit(1)
+
+    print(f"\n✅ Uploaded {format_bytes(stats['bytes'])} in {stats['seconds']:.1f}s "
+          f"({stats['mb_per_s']:.3f} MB/s, {stats['reconnects']} reconnects)")
+
+
+if __name__ == "__main__":
+    main()
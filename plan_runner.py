@@ -0,0 +1,489 @@
+#!/usr/bin/env python3
+"""
+Declarative test plans, compiled once and run over the AT engine.
+
+The scripts in this repo are linear send_cmd() sequences with the WiFi
+credentials, broker, topics and delays baked in. A plan describes the same
+sequence in TOML (or YAML, if PyYAML is installed). It lists the steps,
+what each response must match, values to capture, dependencies and
+retries. The plan is parsed and checked once. It is then compiled into
+bringup.Stage objects, so a step goes on the wire the moment its
+dependencies are done, with no fixed sleeps. Steps run in file order
+unless they say otherwise with `after`.
+
+A plan file:
+
+    name = "stable_wifi_mqtt"
+    include = ["blocks.toml"]              # reusable blocks, relative to this file
+
+    [vars]
+    ssid = "tim"
+    password = "password"
+    topic = "fov/test"
+
+    [[steps]]
+    use = "wifi_join"                      # expands the block's steps as wifi_join.*
+
+    [[steps]]
+    name = "user"
+    send = 'AT+MQTTUSERCFG=0,1,"fov_${board}","","",0,0,""'
+    after = []                             # does not need WiFi, goes out before the join
+
+    [[steps]]
+    send = 'AT+MQTTCONN=0,"test.mosquitto.org",1883,0'
+    after = ["wifi_join", "user"]
+    event = "+MQTTCONNECTED"
+    timeout = 10
+    retries = 2
+
+    [[steps]]
+    send = "AT+GMR"
+    expect = 'AT version:'
+    capture = { at_version = 'AT version:(\\S+)' }
+
+    [blocks.wifi_join]                     # or in an included file
+    vars = { ssid = "tim" }                # defaults, overridden by the plan and `with`
+    steps = [{ send = "AT+CWMODE=1" },
+             { send = 'AT+CWJAP="${ssid}","${password}"', timeout = 20 }]
+
+Step keys:
+    send / wait / use   the command, a URC prefix to wait for, or a block
+    name                defaults to the command verb ('cwjap'), the URC or the block
+    after               step or block names ('wifi_join', or 'sntp.config' for one
+                        step of a block); omitted means the previous step
+    event               URC that must follow the command (e.g. "WIFI GOT IP")
+    until, timeout      as for ATTransport.send
+    expect              regex the response must contain
+    capture             {variable = regex}; group 1 (or the match) is stored
+                        and can be used as ${variable} by later steps
+    at_least            {variable = number} minimum for captured numbers
+    retries, retry_delay
+    with                variables for a `use` block
+
+${port} and ${board} (the port name without /dev/) are set per board, so
+one plan runs on many boards at once. Repeated `AT` and `AT+X=?` probes
+that several blocks start with are sent once.
+
+Usage:
+    python3 plan_runner.py show aws_with_certs              # compiled steps and edges
+    python3 plan_runner.py run aws_with_certs --port /dev/ttyUSB0
+    python3 plan_runner.py run stable_wifi_mqtt --var ssid=lab --var password=secret
+    python3 plan_runner.py run meminfo --simulate 4         # four simulated boards
+    python3 station_runner.py plans/meminfo.toml            # every attached board
+
+Requirements:
+    pip install pyserial
+    pip install pyyaml   # only for .yaml plans
+"""
+
+import argparse
+import collections
+import os
+import re
+import sys
+import tomllib
+
+import serial
+
+from at_engine import ATEngine
+from at_transport import DEFAULT_BAUD, DEFAULT_PORT
+from bringup import DEFAULT_TIMEOUT, BringUp, Stage, print_timeline
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+PLANS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plans')
+PLAN_EXTENSIONS = ('.toml', '.yaml', '.yml')
+STEP_KEYS = {'name', 'send', 'wait', 'use', 'with', 'after', 'event', 'until', 'timeout',
+             'expect', 'capture', 'at_least', 'retries', 'retry_delay'}
+BOARD_VARS = ('port', 'board')  # set per board at run time
+VAR = re.compile(r'\$\{(\w+)\}')
+PROBE = re.compile(r'^(AT|ATE[01]|AT\+\w+=\?)$')  # idempotent, sent once per plan
+
+PlanStep = collections.namedtuple('PlanStep', [
+    'name', 'cmd', 'after', 'event', 'until', 'timeout', 'expect', 'capture', 'at_least',
+    'retries', 'retry_delay', 'deferred'])
+
+
+class PlanError(Exception):
+    """The plan file is invalid."""
+
+
+def find_plan(name):
+    """Resolve a plan name ('aws_with_certs') or path to a file."""
+    if os.path.isfile(name):
+        return name
+    for ext in PLAN_EXTENSIONS:
+        path = os.path.join(PLANS_DIR, name + ext)
+        if os.path.isfile(path):
+            return path
+    raise PlanError(f"plan {name!r} not found (looked in {PLANS_DIR})")
+
+
+def read_plan_file(path):
+    """Parse a .toml or .yaml plan file into a dict."""
+    if path.endswith('.toml'):
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    if path.endswith(('.yaml', '.yml')):
+        if yaml is None:
+            raise PlanError(f"{path}: YAML plans need PyYAML (pip install pyyaml)")
+        with open(path) as f:
+            return yaml.safe_load(f) or {}
+    raise PlanError(f"{path}: unknown plan format (use {', '.join(PLAN_EXTENSIONS)})")
+
+
+def substitute(text, values):
+    """Fill in the ${name}s found in values; leave the others for run time."""
+    return VAR.sub(lambda m: str(values[m.group(1)]) if m.group(1) in values else m.group(0), text)
+
+
+def _slug(text):
+    return re.sub(r'\W+', '_', text).strip('_').lower()
+
+
+class PlanStage(Stage):
+    """A compiled step bound to one board's variables."""
+
+    def __init__(self, step, values):
+        check = self._check if step.expect or step.capture else None
+        super().__init__(step.name, step.cmd, step.after, step.event, step.timeout, step.until,
+                         check=check, retries=step.retries, retry_delay=step.retry_delay)
+        self.step = step
+        self.values = values
+
+    def command(self):
+        if self.step.deferred:
+            self.cmd = VAR.sub(lambda m: str(self.values[m.group(1)]), self.step.cmd)
+        return self.cmd
+
+    def _check(self, response):
+        text = response.text
+        if self.step.expect and not self.step.expect.search(text):
+            return f"expected /{self.step.expect.pattern}/"
+        for name, pattern in self.step.capture.items():
+            match = pattern.search(text)
+            if not match:
+                return f"no /{pattern.pattern}/ for {name}"
+            value = match.group(1) if pattern.groups else match.group(0)
+            minimum = self.step.at_least.get(name)
+            if minimum is not None and float(value) < minimum:
+                return f"{name} {value} < {minimum}"
+            self.values[name] = value
+        return None
+
+
+class Plan:
+    """
+    A parsed and checked plan, ready to run on any number of boards.
+
+    Args:
+        path: Plan file
+        overrides: Variables that replace the plan's [vars] (e.g. from --var)
+
+    Raises:
+        PlanError for unknown keys, names, blocks or variables, and cycles
+    """
+
+    def __init__(self, path, overrides=None):
+        self.path = path
+        data = read_plan_file(path)
+        self.name = data.get('name', os.path.splitext(os.path.basename(path))[0])
+        self.description = data.get('description', '')
+        self.variables = dict(data.get('vars', {}), **(overrides or {}))
+        self.blocks = {}
+        self._load_blocks(path, data, set())
+        self.dropped = []  # names of repeated probes that were merged away
+        steps = self._expand(data.get('steps', []), '', self.variables, (), [self.name])
+        self.steps = self._finish(steps)
+        try:
+            BringUp(None, [Stage(s.name, after=s.after) for s in self.steps])
+        except ValueError as e:
+            raise PlanError(f"{path}: {e}")
+
+    def _load_blocks(self, path, data, seen):
+        seen.add(os.path.abspath(path))
+        for include in data.get('include', []):
+            included = os.path.join(os.path.dirname(path), include)
+            if os.path.abspath(included) not in seen:
+                self._load_blocks(included, read_plan_file(included), seen)
+        self.blocks.update(data.get('blocks', {}))
+
+    def _expand(self, raw_steps, prefix, variables, entry, where):
+        """Flatten steps and blocks into step dicts with full names and dependencies."""
+        flat = []
+        scope = {}  # local name -> full names that finish it
+        previous = tuple(entry)
+        for raw in raw_steps:
+            here = '/'.join(where)
+            unknown = set(raw) - STEP_KEYS
+            if unknown:
+                raise PlanError(f"{here}: unknown step keys {sorted(unknown)}")
+            kinds = [k for k in ('send', 'wait', 'use') if k in raw]
+            if len(kinds) != 1:
+                raise PlanError(f"{here}: a step needs exactly one of send, wait or use: {raw}")
+            name = raw.get('name') or self._default_name(raw, scope)
+            if name in scope:
+                raise PlanError(f"{here}: duplicate step name {name!r}")
+            if 'after' in raw:
+                after = tuple(entry)
+                for dep in raw['after']:
+                    if dep not in scope:
+                        raise PlanError(f"{here}/{name}: 'after' names unknown step {dep!r}")
+                    after += scope[dep]
+            else:
+                after = previous
+
+            if 'use' in raw:
+                block = self.blocks.get(raw['use'])
+                if block is None:
+                    raise PlanError(f"{here}/{name}: unknown block {raw['use']!r}")
+                if len(where) > 8:
+                    raise PlanError(f"{here}: blocks nested too deep")
+                values = dict(block.get('vars', {}), **variables)
+                values.update({k: substitute(str(v), variables) for k, v in raw.get('with', {}).items()})
+                steps = self._expand(block.get('steps', []), f"{prefix}{name}.", values, after,
+                                     where + [name])
+                inner = {d for s in steps for d in s['after']}
+                finished = tuple(s['name'] for s in steps if s['name'] not in inner) or after
+                for step in steps:  # 'block.step' can be named in later `after` lists
+                    scope[step['name'][len(prefix):]] = (step['name'],)
+                flat += steps
+            else:
+                step = {k: v for k, v in raw.items() if k not in ('name', 'send', 'wait')}
+                step.update(name=prefix + name, after=after, where=f"{here}/{name}")
+                step['cmd'] = substitute(raw['send'], variables) if 'send' in raw else None
+                if 'wait' in raw:
+                    step['event'] = raw['wait']
+                for key in ('expect', 'event', 'until'):
+                    if key in step:
+                        step[key] = substitute(step[key], variables)
+                step['capture'] = {k: substitute(v, variables) for k, v in raw.get('capture', {}).items()}
+                flat.append(step)
+                finished = (step['name'],)
+            scope[name] = finished
+            previous = finished
+        return flat
+
+    @staticmethod
+    def _default_name(raw, scope):
+        if 'use' in raw:
+            base = raw['use']
+        elif 'wait' in raw:
+            base = _slug(raw['wait'])
+        else:
+            base = _slug(re.split(r'[=?]', raw['send'])[0].replace('AT+', '')) or 'at'
+        name, n = base, 1
+        while name in scope:
+            n += 1
+            name = f"{base}_{n}"
+        return name
+
+    def _finish(self, steps):
+        """Merge repeated probes, resolve run-time variables and compile patterns."""
+        alias = {}
+        probes = {}
+        captured_by = {}
+        compiled = []
+        for step in steps:
+            after = []
+            for dep in step['after']:
+                for name in alias.get(dep, (dep,)):
+                    if name not in after:
+                        after.append(name)
+            cmd = step['cmd']
+            plain = not (step.get('expect') or step['capture'] or step.get('event') or step.get('until'))
+            if cmd and plain and PROBE.match(cmd):
+                if cmd in probes:
+                    alias[step['name']] = tuple(dict.fromkeys([probes[cmd]] + after))
+                    self.dropped.append(step['name'])
+                    continue
+                probes[cmd] = step['name']
+
+            deferred = False
+            for var in VAR.findall(cmd or ''):
+                if var in BOARD_VARS:
+                    deferred = True
+                elif var in captured_by:
+                    deferred = True
+                    if captured_by[var] not in after:
+                        after.append(captured_by[var])
+                else:
+                    raise PlanError(f"{step['where']}: undefined variable ${{{var}}}")
+            for text in [step.get('expect'), step.get('event'), *step['capture'].values()]:
+                if text and VAR.search(text):
+                    raise PlanError(f"{step['where']}: only plan variables can be used in patterns: {text}")
+            try:
+                expect = re.compile(step['expect']) if step.get('expect') else None
+                capture = {k: re.compile(v) for k, v in step['capture'].items()}
+            except re.error as e:
+                raise PlanError(f"{step['where']}: bad pattern: {e}")
+            at_least = step.get('at_least', {})
+            for var in at_least:
+                if var not in capture:
+                    raise PlanError(f"{step['where']}: at_least {var!r} is not captured by this step")
+            for var in capture:
+                captured_by[var] = step['name']
+            compiled.append(PlanStep(
+                step['name'], cmd, tuple(after), step.get('event'), step.get('until'),
+                step.get('timeout', 5), expect, capture, at_least,
+                step.get('retries', 0), step.get('retry_delay', 0.5), deferred))
+        return compiled
+
+    def stages(self, values):
+        """Fresh Stages for one run; captures are stored into values."""
+        return [PlanStage(step, values) for step in self.steps]
+
+    def run(self, engine, port=None, timeout=DEFAULT_TIMEOUT):
+        """
+        Run the plan on one board.
+
+        Args:
+            engine: ATEngine of the board
+            port: Port name for ${port} / ${board}
+            timeout: Overall ceiling in seconds
+
+        Returns:
+            (BringUpResult, captured values)
+        """
+        port = port or getattr(engine.transport.ser, 'port', '') or ''
+        values = {'port': port, 'board': port.replace('/dev/', '').replace('/', '_')}
+        result = BringUp(engine, self.stages(values)).run(timeout)
+        captured = {k: v for k, v in values.items() if k not in BOARD_VARS}
+        return result, captured
+
+    def station_plan(self, timeout=DEFAULT_TIMEOUT):
+        """The plan as a station_runner plan function: plan(at, run)."""
+        from station_runner import CheckFailed
+
+        def plan(at, run):
+            engine = ATEngine(at)
+            try:
+                result, captured = self.run(engine, run.port, timeout)
+            finally:
+                engine.stop()
+            for stage in result.stages:
+                response = stage.response
+                run.steps.append({
+                    'command': stage.cmd or f"(wait {stage.event})",
+                    'result': response.result if response is not None else stage.status,
+                    'elapsed': round((stage.done_at or result.elapsed) - (stage.ready_at or 0), 4),
+                })
+            run.info.update(captured)
+            if not result.ok:
+                stage = result.failed[0]
+                raise CheckFailed(f"{stage.name}: {stage.error}")
+
+        return plan
+
+    def describe(self):
+        """Compiled steps with their dependencies, one per line."""
+        width = max((len(s.name) for s in self.steps), default=0)
+        lines = [f"{self.name}: {len(self.steps)} steps" + (f" - {self.description}" if self.description else '')]
+        for s in self.steps:
+            what = s.cmd if s.cmd else f"(wait {s.event})"
+            extra = []
+            if s.cmd and s.event:
+                extra.append(f"event {s.event}")
+            if s.capture:
+                extra.append(f"capture {', '.join(s.capture)}")
+            if s.retries:
+                extra.append(f"retries {s.retries}")
+            after = ', '.join(s.after) or '-'
+            lines.append(f"  {s.name:<{width}}  after {after:<24} {what}"
+                         + (f"  [{'; '.join(extra)}]" if extra else ''))
+        if self.dropped:
+            lines.append(f"  (repeated probes sent once: {', '.join(self.dropped)})")
+        return '\n'.join(lines)
+
+
+_plans = {}
+
+
+def load_plan(name, overrides=None):
+    """Parse and compile a plan once per process (per file version and overrides)."""
+    path = find_plan(name)
+    key = (os.path.abspath(path), os.path.getmtime(path), tuple(sorted((overrides or {}).items())))
+    if key not in _plans:
+        _plans[key] = Plan(path, overrides)
+    return _plans[key]
+
+
+def parse_vars(pairs):
+    values = {}
+    for pair in pairs:
+        name, sep, value = pair.partition('=')
+        if not sep:
+            raise PlanError(f"--var needs name=value, got {pair!r}")
+        values[name] = value
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run declarative AT test plans')
+    sub = parser.add_subparsers(dest='action', required=True)
+    p = sub.add_parser('show', help='Print the compiled steps')
+    p.add_argument('plan', help='Plan name in plans/ or a path')
+    p.add_argument('--var', action='append', default=[], help='name=value (repeatable)')
+    p = sub.add_parser('run', help='Run a plan on one or more boards')
+    p.add_argument('plan', help='Plan name in plans/ or a path')
+    p.add_argument('--var', action='append', default=[], help='name=value (repeatable)')
+    p.add_argument('--port', '-p', action='append', help='Serial port, repeatable')
+    p.add_argument('--baud', '-b', type=int, default=DEFAULT_BAUD)
+    p.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT)
+    p.add_argument('--simulate', type=int, metavar='N', help='Run on N simulated boards')
+    args = parser.parse_args()
+
+    try:
+        plan = load_plan(args.plan, parse_vars(args.var))
+    except (PlanError, OSError, tomllib.TOMLDecodeError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    if args.action == 'show':
+        print(plan.describe())
+        return
+
+    modems = []
+    ports = args.port or []
+    if args.simulate:
+        from at_simulator import SimulatedModem
+        modems = [SimulatedModem() for _ in range(args.simulate)]
+        ports = [modem.start() for modem in modems]
+    ports = ports or [DEFAULT_PORT]
+
+    try:
+        if len(ports) == 1:
+            try:
+                engine = ATEngine.open(ports[0], args.baud)
+            except serial.SerialException as e:
+                print(f"ERROR: Could not open serial port: {e}")
+                sys.exit(1)
+            try:
+                if modems:
+                    engine.transport.wait_for('ready', timeout=2)
+                result, captured = plan.run(engine, ports[0], args.timeout)
+            finally:
+                engine.close()
+            print_timeline(result)
+            for name, value in captured.items():
+                print(f"{name} = {value}")
+            ok = result.ok
+        else:
+            from station_runner import run_station
+            report = run_station(plan.name, ports, args.baud, plan=plan.station_plan(args.timeout))
+            for board in report['results']:
+                mark = '✅' if board['passed'] else '❌'
+                detail = '' if board['passed'] else f"  {board['error']}"
+                print(f"{mark} {board['port']}  {board['duration']:.2f}s{detail}")
+            print(f"\n{report['passed']}/{report['boards']} passed in {report['wall_time']:.2f}s")
+            ok = report['failed'] == 0
+    finally:
+        for modem in modems:
+            modem.stop()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
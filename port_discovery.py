@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Find the ESP-AT command port, and remember it per USB device.
+
+Every script defaults to /dev/ttyUSB0, but on boards with two USB serial
+interfaces (or the C5's built-in USB-JTAG next to a bridge) the AT port is
+often the other one. This module lists the serial ports, opens every
+candidate at once and sends a plain AT with a short timeout, then sorts
+the answers:
+
+    at          answered OK / ERROR: the ESP-AT command UART
+    console     sent something other than a result code (boot ROM or IDF
+                log): the debug / flash UART
+    flash       silent Espressif USB-JTAG/serial port (used for flashing)
+    silent      no answer (board held in reset, wrong baud, not an ESP)
+    unavailable could not be opened (busy or no permission)
+
+The ports are probed in parallel, so sixteen take about as long as one.
+The port is opened with DTR and RTS released, so the auto-reset circuit
+does not reset the chip.
+
+Answers are cached by USB identity (VID:PID, serial number and interface,
+or the USB path when there is no serial number). Later runs map the
+ports to roles without opening any of them; pass --refresh after
+reflashing. Ports without a USB identity (ptys, ttyS*) are always probed.
+
+Any script that goes through ATTransport.open() or ATEngine.open() can use
+port 'auto', so `--port auto` or FOV_AT_PORT=auto picks the cached AT
+port.
+
+Usage:
+    python3 port_discovery.py                 # roles of all ESP-like ports
+    python3 port_discovery.py --refresh --all # re-probe every serial port
+    python3 port_discovery.py --at            # just print the AT port (for scripts)
+    FOV_AT_PORT=auto python3 test_meminfo.py
+
+From Python:
+    port = find_at_port()                     # None if no board answers
+
+Requirements:
+    pip install pyserial
+"""
+
+import argparse
+import collections
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import serial
+from serial.tools import list_ports
+
+from at_transport import DEFAULT_BAUD
+from json_cache import load_json, save_json
+
+DEFAULT_PATH = os.environ.get('FOV_AT_PORTS',
+                              os.path.expanduser('~/.cache/fov-at/ports.json'))
+PROBE_TIMEOUT = 0.3  # an idle ESP-AT answers AT in a few ms
+CACHED_ROLES = ('at', 'console', 'flash')  # silent / unavailable ports are probed again
+
+# USB vendor IDs of the bridges found on ESP32-C5 boards
+ESP_USB_VIDS = {
+    0x303A: 'Espressif USB-JTAG/serial',
+    0x10C4: 'Silicon Labs CP210x',
+    0x1A86: 'WCH CH34x',
+    0x0403: 'FTDI',
+}
+ESPRESSIF_VID = 0x303A
+
+Port = collections.namedtuple('Port', 'device key description vid')
+Identified = collections.namedtuple('Identified', 'device key role source detail elapsed')
+
+
+def usb_key(info):
+    """
+    Stable identity of a serial port across runs and device renumbering.
+
+    'VID:PID/serial#interface' for USB ports with a serial number,
+    'VID:PID@usb-path#interface' without one, 'dev:/dev/x' otherwise.
+    """
+    if info.vid is None:
+        return f"dev:{info.device}"
+    path, _, interface = (info.location or '').partition(':')
+    ident = f"/{info.serial_number}" if info.serial_number else f"@{path}"
+    return f"{info.vid:04X}:{info.pid:04X}{ident}" + (f"#{interface}" if interface else '')
+
+
+def list_candidates(devices=None, all_ports=False):
+    """
+    Serial ports to identify.
+
+    Args:
+        devices: Explicit device paths (ptys included); default: enumerate
+        all_ports: Include ports whose USB vendor is not a known ESP bridge
+    """
+    infos = {info.device: info for info in list_ports.comports()}
+    if devices:
+        return [Port(d, usb_key(infos[d]), infos[d].description, infos[d].vid) if d in infos
+                else Port(d, f"dev:{d}", '', None) for d in devices]
+    return sorted((Port(i.device, usb_key(i), i.description, i.vid) for i in infos.values()
+                   if all_ports or i.vid in ESP_USB_VIDS), key=lambda p: p.device)
+
+
+def probe(port, baud=DEFAULT_BAUD, timeout=PROBE_TIMEOUT):
+    """
+    Send AT to one port and classify the answer.
+
+    Args:
+        port: Port from list_candidates()
+
+    Returns:
+        Identified with source 'probe'
+    """
+    start = time.monotonic()
+    ser = serial.Serial()
+    ser.port, ser.baudrate, ser.timeout = port.device, baud, 0.02
+    ser.dtr = ser.rts = False  # don't pulse EN / IO0 through the auto-reset circuit
+    try:
+        ser.open()
+    except (serial.SerialException, OSError) as e:
+        return Identified(port.device, port.key, 'unavailable', 'probe', str(e), time.monotonic() - start)
+    data = b''
+    try:
+        ser.reset_input_buffer()
+        ser.write(b'AT\r\n')
+        deadline = start + timeout
+        while time.monotonic() < deadline:
+            data += ser.read(ser.in_waiting or 1)
+            lines = [line.strip() for line in data.split(b'\n')]
+            if b'OK' in lines or b'ERROR' in lines:
+                return Identified(port.device, port.key, 'at', 'probe', None, time.monotonic() - start)
+    except (serial.SerialException, OSError) as e:
+        return Identified(port.device, port.key, 'unavailable', 'probe', str(e), time.monotonic() - start)
+    finally:
+        ser.close()
+    elapsed = time.monotonic() - start
+    if data.strip():
+        sample = data.strip().splitlines()[0][:40].decode('ascii', 'replace')
+        return Identified(port.device, port.key, 'console', 'probe', sample, elapsed)
+    role = 'flash' if port.vid == ESPRESSIF_VID else 'silent'
+    return Identified(port.device, port.key, role, 'probe', None, elapsed)
+
+
+def load_cache(path=DEFAULT_PATH):
+    return load_json(path, 'port cache')
+
+
+def save_cache(cache, path=DEFAULT_PATH):
+    save_json(cache, path)
+
+
+def identify(devices=None, baud=DEFAULT_BAUD, refresh=False, all_ports=False, path=DEFAULT_PATH,
+             timeout=PROBE_TIMEOUT, probe_missing=True):
+    """
+    Role of every candidate port, from the cache where possible.
+
+    Ports not in the cache (or all of them with refresh) are probed in
+    parallel, and the answers that identify a port are written back.
+    With probe_missing=False only cached ports are returned.
+
+    Returns:
+        list of Identified, sorted by device
+    """
+    ports = list_candidates(devices, all_ports)
+    cache = load_cache(path)
+    results, to_probe = [], []
+    for port in ports:
+        entry = cache.get(port.key)
+        if entry and not refresh:
+            results.append(Identified(port.device, port.key, entry['role'], 'cache', None, 0.0))
+        elif probe_missing:
+            to_probe.append(port)
+    if to_probe:
+        with ThreadPoolExecutor(max_workers=len(to_probe)) as pool:
+            probed = list(pool.map(lambda p: probe(p, baud, timeout), to_probe))
+        changed = False
+        for result in probed:
+            if result.role in CACHED_ROLES and not result.key.startswith('dev:'):
+                cache[result.key] = {'role': result.role, 'device': result.device, 'baud': baud,
+                                     'probed_at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+                changed = True
+            elif cache.pop(result.key, None):
+                changed = True
+        if changed:
+            save_cache(cache, path)
+        results += probed
+    return sorted(results, key=lambda r: r.device)
+
+
+def find_at_ports(devices=None, baud=DEFAULT_BAUD, refresh=False, path=DEFAULT_PATH):
+    """Device paths of every port that is (or was last seen as) an ESP-AT port."""
+    return [r.device for r in identify(devices, baud, refresh, path=path) if r.role == 'at']
+
+
+def find_at_port(baud=DEFAULT_BAUD, refresh=False, path=DEFAULT_PATH):
+    """The first ESP-AT port, or None. A cached port is returned without probing anything."""
+    if not refresh:
+        cached = [r.device for r in identify(baud=baud, path=path, probe_missing=False) if r.role == 'at']
+        if cached:
+            return cached[0]
+    ports = find_at_ports(baud=baud, refresh=refresh, path=path)
+    return ports[0] if ports else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find which serial port is the ESP-AT port')
+    parser.add_argument('--port', '-p', action='append', help='Only these devices (repeatable)')
+    parser.add_argument('--baud', '-b', type=int, default=DEFAULT_BAUD)
+    parser.add_argument('--refresh', action='store_true', help='Ignore the cache and probe again')
+    parser.add_argument('--all', action='store_true', help='Also probe non-ESP USB serial ports')
+    parser.add_argument('--timeout', type=float, default=PROBE_TIMEOUT, help='AT answer timeout per port')
+    parser.add_argument('--at', action='store_true', help='Print only the AT port path')
+    parser.add_argument('--cache', default=DEFAULT_PATH, help=f'Cache file (default: {DEFAULT_PATH})')
+    parser.add_argument('--simulate', type=int, metavar='N', help='Add N simulated modems (ptys) to the probe')
+    args = parser.parse_args()
+
+    devices = args.port
+    modems = []
+    if args.simulate:
+        from at_simulator import SimulatedModem
+        modems = [SimulatedModem(boot_time=0) for _ in range(args.simulate)]
+        devices = (devices or [p.device for p in list_candidates(all_ports=args.all)]) + \
+            [modem.start() for modem in modems]
+        time.sleep(0.05)  # let the boot banners drain before the AT goes out
+
+    start = time.monotonic()
+    try:
+        results = identify(devices, args.baud, args.refresh, args.all, args.cache, args.timeout)
+        wall = time.monotonic() - start
+    finally:
+        for modem in modems:
+            modem.stop()
+
+    at_ports = [r.device for r in results if r.role == 'at']
+    if args.at:
+        if not at_ports:
+            sys.exit(1)
+        print(at_ports[0])
+        return
+
+    if not results:
+        print("❌ No ESP32-C5 serial ports found (try --all or --port)")
+        sys.exit(1)
+    marks = {'at': '✅', 'console': '📜', 'flash': '🔧', 'silent': '⚠️', 'unavailable': '❌'}
+    for r in results:
+        timing = 'cached' if r.source == 'cache' else f"{r.elapsed * 1000:.0f} ms"
+        detail = f"  {r.detail}" if r.detail else ''
+        print(f"{marks.get(r.role, '?')} {r.device:<16} {r.role:<12} {timing:>8}  {r.key}{detail}")
+    probed = sum(r.source == 'probe' for r in results)
+    print(f"\n{len(results)} port(s), {probed} probed in {wall * 1000:.0f} ms")
+    if len(at_ports) > 1:
+        print(f"⚠️  {len(at_ports)} AT ports; 'auto' picks {at_ports[0]}")
+    elif not at_ports:
+        print("❌ No port answered AT")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Record serial sessions and replay them through a fake serial port.
+
+Field issues could only be reproduced with a board on the desk. `record`
+runs any script in this repo with serial.Serial swapped for a recording
+subclass, so every write and every read (with its timestamp) goes into a
+session file. `run` runs a script against a ReplaySerial that plays the
+modem's side back. Bytes recorded after a write are only released once
+the script has made that write, so command/response ordering is the same
+as on the bench. Playback can be at recorded speed, faster, or as fast as
+possible. `bench` pushes a session's received bytes (or a serial_log.py
+capture) through the LineFramer and at_parsers to measure parse throughput.
+
+Session file (gzip compressed if the name ends in .gz):
+    b'FOVREC1\\n' + uint16 length + JSON metadata (port, baud, argv, started)
+    records: direction ('T' written / 'R' read) + seconds since start (double)
+             + length (uint32) + bytes
+
+Usage:
+    python3 replay.py record session.rec test_meminfo.py --port /dev/ttyUSB0
+    python3 replay.py run session.rec test_meminfo.py            # recorded speed
+    python3 replay.py run session.rec --speed 10 test_meminfo.py
+    python3 replay.py run session.rec --asap --strict aws_with_certs.py
+    python3 replay.py info session.rec
+    python3 replay.py bench session.rec
+    python3 replay.py bench serial_logs/ --repeat 5
+
+Requirements:
+    pip install pyserial
+"""
+
+import argparse
+import gzip
+import json
+import os
+import runpy
+import struct
+import sys
+import threading
+import time
+
+import serial
+
+from at_parsers import parse_line
+from ring_buffer import LineFramer
+
+SESSION_MAGIC = b'FOVREC1\n'
+META_LEN = struct.Struct('<H')
+RECORD = struct.Struct('<cdI')  # direction, seconds since start, length
+WRITTEN, READ = b'T', b'R'
+
+
+class ReplayMismatch(Exception):
+    """The script wrote something other than what was recorded (strict mode)."""
+
+
+def _open(path, mode):
+    return gzip.open(path, mode) if path.endswith('.gz') else open(path, mode)
+
+
+# -- recording -----------------------------------------------------------------
+
+class SessionWriter:
+    """Append-only session file; thread safe (reader and writer threads share it)."""
+
+    def __init__(self, path, meta):
+        self.path = path
+        self._file = _open(path, 'wb')
+        header = json.dumps(meta).encode()
+        self._file.write(SESSION_MAGIC + META_LEN.pack(len(header)) + header)
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, direction, data):
+        if not data:
+            return
+        record = RECORD.pack(direction, time.monotonic() - self._start, len(data))
+        with self._lock:
+            self._file.write(record)
+            self._file.write(data)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class RecordingSerial(serial.Serial):
+    """serial.Serial that logs every write and read to a session file."""
+
+    session_path = 'session.rec'
+    _opened = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        cls = RecordingSerial
+        path = cls.session_path
+        if cls._opened:
+            # Second port in the same script: session.rec -> session-2.rec
+            base, ext = os.path.splitext(path[:-3] if path.endswith('.gz') else path)
+            path = f"{base}-{cls._opened + 1}{ext}" + ('.gz' if path.endswith('.gz') else '')
+        cls._opened += 1
+        self._session = SessionWriter(path, {
+            'port': self.port, 'baud': self.baudrate, 'argv': sys.argv,
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        })
+        print(f"[replay] recording {self.port} to {path}", file=sys.stderr)
+
+    def write(self, data):
+        self._session.add(WRITTEN, bytes(data))
+        return super().write(data)
+
+    def read(self, size=1):
+        data = super().read(size)
+        self._session.add(READ, data)
+        return data
+
+    def close(self):
+        super().close()
+        session = getattr(self, '_session', None)
+        if session:
+            self._session = None
+            session.close()
+
+
+# -- replaying -----------------------------------------------------------------
+
+def load_session(path):
+    """Return (meta, [(direction, seconds, bytes), ...])."""
+    with _open(path, 'rb') as f:
+        if f.read(len(SESSION_MAGIC)) != SESSION_MAGIC:
+            raise ValueError(f"{path}: not a session recording")
+        (length,) = META_LEN.unpack(f.read(META_LEN.size))
+        meta = json.loads(f.read(length))
+        events = []
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                break  # end (or a recording cut short)
+            direction, seconds, size = RECORD.unpack(header)
+            data = f.read(size)
+            if len(data) < size:
+                break
+            events.append((direction, seconds, data))
+    return meta, events
+
+
+class ReplaySerial:
+    """
+    The subset of serial.Serial the transport uses, fed from a recording.
+
+    Each recorded read becomes due at (time the script made the preceding
+    recorded write) + (recorded gap since that write) / speed, or
+    immediately once that write happened when speed is 0.
+
+    Args:
+        events: From load_session()
+        speed: 1 = recorded timing, 10 = ten times faster, 0 = no delays
+        strict: Raise ReplayMismatch if a write differs from the recording
+    """
+
+    def __init__(self, events, speed=1.0, strict=False, port='replay', baudrate=115200, timeout=None):
+        self.events = events
+        self.speed = speed
+        self.strict = strict
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.rtscts = False
+        self.dtr = self.rts = True
+        self.is_open = True
+        self.mismatches = 0
+        self._cond = threading.Condition()
+        self._buffer = bytearray()
+        self._next = 0  # next event not yet delivered / matched
+        self._tx_pending = bytearray()
+        self._anchor = (time.monotonic(), 0.0)  # (real time, recorded time) of the last matched write
+
+    @classmethod
+    def load(cls, path, speed=1.0, strict=False):
+        meta, events = load_session(path)
+        return cls(events, speed, strict, port=meta.get('port', 'replay'),
+                   baudrate=meta.get('baud', 115200))
+
+    @property
+    def finished(self):
+        return self._next >= len(self.events) and not self._buffer
+
+    def _due(self, recorded):
+        real, base = self._anchor
+        if not self.speed:
+            return real
+        return real + (recorded - base) / self.speed
+
+    def _advance(self, now):
+        """Move due reads into the buffer. Returns seconds until the next one, or None."""
+        while self._next < len(self.events):
+            direction, recorded, data = self.events[self._next]
+            if direction != READ:
+                return None  # waiting for the script to write
+            due = self._due(recorded)
+            if due > now:
+                return due - now
+            self._buffer += data
+            self._next += 1
+        return None
+
+    @property
+    def in_waiting(self):
+        with self._cond:
+            self._advance(time.monotonic())
+            return len(self._buffer)
+
+    def read(self, size=1):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        with self._cond:
+            while self.is_open:
+                now = time.monotonic()
+                wait = self._advance(now)
+                if self._buffer:
+                    data = bytes(self._buffer[:size])
+                    del self._buffer[:size]
+                    return data
+                if deadline is not None:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        return b''
+                    wait = remaining if wait is None else min(wait, remaining)
+                self._cond.wait(wait)
+            raise serial.SerialException('replay port closed')
+
+    def write(self, data):
+        with self._cond:
+            if not self.is_open:
+                raise serial.SerialException('replay port closed')
+            self._tx_pending += data
+            self._match_writes()
+            self._cond.notify_all()
+        return len(data)
+
+    def _match_writes(self):
+        while self._tx_pending:
+            # Reads recorded before this write are delivered at once
+            index = self._next
+            while index < len(self.events) and self.events[index][0] != WRITTEN:
+                index += 1
+            if index >= len(self.events):
+                self._tx_pending.clear()  # nothing left to match; the modem stays silent
+                return
+            _, recorded, expected = self.events[index]
+            if len(self._tx_pending) < len(expected) and expected.startswith(bytes(self._tx_pending)):
+                return  # partial write, wait for the rest
+            got = bytes(self._tx_pending[:len(expected)])
+            if got != expected:
+                self.mismatches += 1
+                if self.strict:
+                    raise ReplayMismatch(f"event {index}: wrote {got!r}, recorded {expected!r}")
+            for _, _, data in self.events[self._next:index]:
+                self._buffer += data
+            del self._tx_pending[:len(expected)]
+            self._next = index + 1
+            self._anchor = (time.monotonic(), recorded)
+
+    def reset_input_buffer(self):
+        with self._cond:
+            self._buffer.clear()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        with self._cond:
+            self.is_open = False
+            self._cond.notify_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# -- script runner, bench -------------------------------------------------------
+
+def run_script(script, argv, serial_factory):
+    """Run a repo script as __main__ with serial.Serial replaced by serial_factory."""
+    original = serial.Serial
+    serial.Serial = serial_factory
+    sys.argv = [script] + argv
+    try:
+        runpy.run_path(script, run_name='__main__')
+    except SystemExit as e:
+        return e.code or 0
+    finally:
+        serial.Serial = original
+    return 0
+
+
+def received_chunks(path):
+    """Received byte chunks from a session recording or a serial_log.py capture."""
+    if os.path.isdir(path) or path.endswith('.fovlog'):
+        from serial_log import LogReader
+        return [data for _, data in LogReader(path).frames()]
+    _, events = load_session(path)
+    return [data for direction, _, data in events if direction == READ]
+
+
+def bench(chunks, repeat=1):
+    """Frame and parse chunks as fast as possible; returns throughput figures."""
+    total = sum(len(c) for c in chunks) * repeat
+    lines = records = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        framer = LineFramer()
+        for chunk in chunks:
+            framer.feed(chunk)
+            for raw in framer.lines():
+                lines += 1
+                if parse_line(str(raw, 'utf-8', 'replace')) is not None:
+                    records += 1
+    elapsed = time.perf_counter() - start
+    return {
+        'bytes': total, 'lines': lines, 'records': records, 'seconds': elapsed,
+        'mb_per_s': total / elapsed / 1e6 if elapsed else None,
+        'lines_per_s': lines / elapsed if elapsed else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record and replay serial sessions')
+    sub = parser.add_subparsers(dest='action', required=True)
+    p = sub.add_parser('record', help='Run a script and record its serial traffic')
+    p.add_argument('session')
+    p.add_argument('script')
+    p.add_argument('args', nargs=argparse.REMAINDER)
+    p = sub.add_parser('run', help='Run a script against a recorded session')
+    p.add_argument('session')
+    p.add_argument('--speed', type=float, default=1.0, help='Playback speed factor (default 1)')
+    p.add_argument('--asap', action='store_true', help='No delays at all')
+    p.add_argument('--strict', action='store_true', help='Fail if the script writes something different')
+    p.add_argument('script')
+    p.add_argument('args', nargs=argparse.REMAINDER)
+    p = sub.add_parser('info', help='Summarise a session')
+    p.add_argument('session')
+    p = sub.add_parser('bench', help='Parse throughput on a session or serial_log capture')
+    p.add_argument('session')
+    p.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.action == 'record':
+        RecordingSerial.session_path = args.session
+        sys.exit(run_script(args.script, args.args, RecordingSerial))
+
+    if args.action == 'run':
+        meta, events = load_session(args.session)
+        ports = []
+
+        def factory(*a, **kw):
+            port = ReplaySerial(events, 0 if args.asap else args.speed, args.strict,
+                                port=meta.get('port', 'replay'), baudrate=meta.get('baud', 115200),
+                                timeout=kw.get('timeout'))
+            ports.append(port)
+            return port
+
+        start = time.monotonic()
+        code = run_script(args.script, args.args, factory)
+        mismatches = sum(p.mismatches for p in ports)
+        print(f"\n[replay] {time.monotonic() - start:.2f}s, {len(events)} events, "
+              f"{mismatches} write mismatch(es)", file=sys.stderr)
+        sys.exit(code or (1 if mismatches else 0))
+
+    if args.action == 'info':
+        meta, events = load_session(args.session)
+        written = sum(len(d) for k, _, d in events if k == WRITTEN)
+        read = sum(len(d) for k, _, d in events if k == READ)
+        duration = events[-1][1] if events else 0
+        print(json.dumps(meta, indent=1))
+        print(f"{len(events)} events over {duration:.2f}s: {written:,} bytes written, {read:,} bytes read")
+        for direction, seconds, data in events:
+            if direction == WRITTEN:
+                print(f"  {seconds:9.3f}s  >> {data.decode('utf-8', 'replace').strip()[:70]}")
+        return
+
+    stats = bench(received_chunks(args.session), args.repeat)
+    print(f"{stats['bytes']:,} bytes, {stats['lines']:,} lines, {stats['records']:,} typed records "
+          f"in {stats['seconds'] * 1000:.1f} ms")
+    print(f"  {stats['mb_per_s']:.2f} MB/s, {stats['lines_per_s'] / 1000:.0f}k lines/s")
+
+
+if __name__ == "__main__":
+    main()
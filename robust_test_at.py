@@ -1,27 +1,16 @@
-import serial
-import time
+from at_transport import ATTransport
+from boot_ready import print_result, wait_until_ready
 
-ser = serial.Serial('/dev/ttyUSB0', 115200, timeout=0.1)
+at = ATTransport.open('/dev/ttyUSB0', 115200)
 print("Listening... Reset the C5 board now (press reset button)")
 
-# Wait for boot and ready
-start = time.time()
-buffer = ""
-while time.time() - start < 15:
-    data = ser.read(100)
-    if data:
-        text = data.decode('utf-8', errors='ignore')
-        print(text, end='')
-        buffer += text
-        
-        # As soon as we see "ready", send AT command
-        if "ready" in buffer:
-            print("\n\n--- Sending AT command ---")
-            time.sleep(0.2)  # Small delay after ready
-            ser.write(b'AT\r\n')
-            time.sleep(0.5)
-            response = ser.read_all()
-            print("Response:", response.decode('utf-8', errors='ignore'))
-            break
+# Streams the boot log and returns as soon as "ready" and the first OK are in
+with at:
+    result = wait_until_ready(at, method='manual', timeout=15, echo=True)
+    print_result(result)
 
-ser.close()
+    # As soon as we see "ready", send AT command
+    if result.ok:
+        print("\n\n--- Sending AT command ---")
+        response = at.send('AT', timeout=0.5)
+        print("Response:", response.text)
@@ -0,0 +1,547 @@
+#!/usr/bin/env python3
+"""
+Long-duration capture of modem output to compact, indexed log files.
+
+monitor_serial_port.py prints 10 seconds of output and drops it. For soak
+tests this captures days of raw serial traffic into append-only segment
+files that can be queried afterwards without reading them end to end.
+
+Segment file layout (little endian):
+    header   b'FOVLOG1\\n' + created (double, epoch seconds)
+    block    'F' flags payload_len raw_len n_frames t_first t_last urc_mask
+             + payload: n_frames x (timestamp double, length uint32, bytes),
+             zlib compressed when flags & 1
+    index    'I' count prev_index_offset + count x (t_first, t_last, offset, urc_mask)
+    footer   last_index_offset (uint64) + b'FOVEND1\\n'   (written on close)
+
+A block is cut at a line boundary so every block holds whole lines. Its
+urc_mask has one bit per at_transport.URC_PREFIXES entry seen in it, so
+grepping for '+MQTTDISCONNECTED' only decompresses blocks that contain
+one. Index blocks are written every INDEX_EVERY blocks and chained
+backwards from the footer. If the capture died before writing a footer,
+the reader hops from block header to block header instead.
+
+The serial port is read on one thread and blocks are compressed and
+written on another, so a slow disk never stalls the UART reads.
+
+Usage:
+    python3 serial_log.py capture --port /dev/ttyUSB0 --baud 921600 --dir serial_logs --compress
+    python3 serial_log.py info serial_logs
+    python3 serial_log.py read serial_logs --since 2025-06-01T10:00 --until 2025-06-01T10:05
+    python3 serial_log.py grep serial_logs +MQTTDISCONNECTED
+    python3 serial_log.py grep serial_logs 'WIFI (DISCONNECT|GOT IP)' --regex
+    python3 serial_log.py selftest
+
+Requirements:
+    pip install pyserial
+"""
+
+import argparse
+import datetime
+import glob
+import os
+import queue
+import re
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+import serial
+
+from at_transport import DEFAULT_BAUD, DEFAULT_PORT, URC_PREFIXES
+from ring_buffer import LineFramer
+
+DEFAULT_DIR = 'serial_logs'
+FILE_MAGIC = b'FOVLOG1\n'
+FOOTER_MAGIC = b'FOVEND1\n'
+FILE_HEADER = struct.Struct('<8sd')
+BLOCK_HEADER = struct.Struct('<cBIIIddI')  # type, flags, payload_len, raw_len, n_frames, t_first, t_last, urc_mask
+FRAME_HEADER = struct.Struct('<dI')
+INDEX_HEADER = struct.Struct('<cIQ')  # type, count, previous index offset (0 = none)
+INDEX_ENTRY = struct.Struct('<ddQI')
+FOOTER = struct.Struct('<Q8s')
+
+FLAG_ZLIB = 1
+BLOCK_BYTES = 64 * 1024  # raw bytes per block
+BLOCK_SECONDS = 1.0  # data reaches the disk at least this often
+INDEX_EVERY = 64  # blocks between index blocks
+ROTATE_BYTES = 64 * 1024 * 1024
+ROTATE_SECONDS = 3600
+
+_URC_BYTES = [prefix.encode() for prefix in URC_PREFIXES]
+
+
+def urc_mask(raw):
+    """Bit i set if URC_PREFIXES[i] occurs in raw."""
+    mask = 0
+    for bit, prefix in enumerate(_URC_BYTES):
+        if prefix in raw:
+            mask |= 1 << bit
+    return mask
+
+
+def mask_for(text):
+    """
+    Mask bit a block must have to contain text, or 0 if any block might.
+
+    A line containing text contains a URC prefix only if text itself does.
+    """
+    for bit, prefix in enumerate(URC_PREFIXES):
+        if prefix in text:
+            return 1 << bit
+    return 0
+
+
+# -- writing -------------------------------------------------------------------
+
+class LogWriter:
+    """
+    Append frames to rotating segment files.
+
+    Args:
+        directory: Where segments go (created if missing)
+        prefix: Segment file name prefix, e.g. the port name
+        compress: zlib-compress blocks
+        rotate_bytes, rotate_seconds: Start a new segment past either limit
+    """
+
+    def __init__(self, directory=DEFAULT_DIR, prefix='capture', compress=False,
+                 rotate_bytes=ROTATE_BYTES, rotate_seconds=ROTATE_SECONDS):
+        self.directory = directory
+        self.prefix = prefix
+        self.compress = compress
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.segments = []
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._file = None
+        self._frames = []
+        self._raw_len = 0
+        self._index = []
+        self._last_index = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _open_segment(self, now):
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(now))
+        path = os.path.join(self.directory, f'{self.prefix}-{stamp}.fovlog')
+        n = 1
+        while os.path.exists(path):
+            path = os.path.join(self.directory, f'{self.prefix}-{stamp}-{n}.fovlog')
+            n += 1
+        self._file = open(path, 'wb')
+        self._file.write(FILE_HEADER.pack(FILE_MAGIC, now))
+        self._opened = now
+        self._index = []
+        self._last_index = 0
+        self.segments.append(path)
+
+    def _close_segment(self):
+        self._write_index()
+        self._file.write(FOOTER.pack(self._last_index, FOOTER_MAGIC))
+        self.bytes_out += self._file.tell()
+        self._file.close()
+        self._file = None
+
+    def _write_index(self):
+        if not self._index:
+            return
+        offset = self._file.tell()
+        parts = [INDEX_HEADER.pack(b'I', len(self._index), self._last_index)]
+        parts.extend(INDEX_ENTRY.pack(*entry) for entry in self._index)
+        self._file.write(b''.join(parts))
+        self._last_index = offset
+        self._index = []
+
+    def add(self, timestamp, data):
+        """Buffer one frame (bytes read at timestamp); writes a block when full."""
+        self._frames.append((timestamp, data))
+        self._raw_len += len(data)
+        self.bytes_in += len(data)
+        if self._raw_len >= BLOCK_BYTES or timestamp - self._frames[0][0] >= BLOCK_SECONDS:
+            self.flush_block(keep_partial_line=True)
+
+    def flush_block(self, keep_partial_line=False):
+        """Write buffered frames as one block, holding back an unterminated last line."""
+        frames = self._frames
+        if not frames:
+            return
+        carry = []
+        if keep_partial_line:
+            for i in range(len(frames) - 1, -1, -1):
+                timestamp, data = frames[i]
+                cut = data.rfind(b'\n') + 1
+                if cut:
+                    tail = [(timestamp, data[cut:])] if cut < len(data) else []
+                    carry = tail + frames[i + 1:]
+                    frames = frames[:i] + [(timestamp, data[:cut])]
+                    break
+            else:
+                if self._raw_len < BLOCK_BYTES:
+                    return  # one partial line so far; wait for its newline
+        parts = []
+        for timestamp, data in frames:
+            parts.append(FRAME_HEADER.pack(timestamp, len(data)))
+            parts.append(data)
+        raw_payload = b''.join(parts)
+        raw = b''.join(data for _, data in frames)  # a URC may span several reads
+        payload = zlib.compress(raw_payload, 1) if self.compress else raw_payload
+        t_first, t_last = frames[0][0], frames[-1][0]
+        if self._file is None:
+            self._open_segment(t_first)
+        mask = urc_mask(raw)
+        offset = self._file.tell()
+        self._file.write(BLOCK_HEADER.pack(b'F', FLAG_ZLIB if self.compress else 0, len(payload),
+                                           len(raw), len(frames), t_first, t_last, mask))
+        self._file.write(payload)
+        self._index.append((t_first, t_last, offset, mask))
+        if len(self._index) >= INDEX_EVERY:
+            self._write_index()
+        self._file.flush()
+        self._frames = carry
+        self._raw_len = sum(len(data) for _, data in carry)
+        if (self._file.tell() >= self.rotate_bytes
+                or t_last - self._opened >= self.rotate_seconds):
+            self._close_segment()
+
+    def close(self):
+        self.flush_block()
+        if self._file is not None:
+            self._close_segment()
+
+
+class Capture:
+    """
+    Read a serial port on one thread, write segments on another.
+
+    The reader only timestamps and queues what pyserial returns, so it is
+    back in read() within microseconds.
+    """
+
+    def __init__(self, ser, writer, echo=False):
+        self.ser = ser
+        self.writer = writer
+        self.echo = echo
+        self.frames = 0
+        self.max_backlog = 0
+        self._queue = queue.SimpleQueue()
+        self._stop = threading.Event()
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+
+    def start(self):
+        self.started = time.time()
+        self._writer.start()
+        self._reader.start()
+
+    def _read_loop(self):
+        while not self._stop.is_set():
+            try:
+                data = self.ser.read(self.ser.in_waiting or 1)
+            except (serial.SerialException, OSError, TypeError):
+                break
+            if data:
+                self._queue.put((time.time(), data))
+        self._queue.put(None)
+
+    def _write_loop(self):
+        while True:
+            backlog = self._queue.qsize()
+            if backlog > self.max_backlog:
+                self.max_backlog = backlog
+            try:
+                item = self._queue.get(timeout=BLOCK_SECONDS)
+            except queue.Empty:
+                # Idle line: push out what we have so the file is never far behind
+                self.writer.flush_block(keep_partial_line=True)
+                continue
+            if item is None:
+                break
+            self.frames += 1
+            self.writer.add(*item)
+            if self.echo:
+                sys.stdout.write(item[1].decode('utf-8', errors='replace'))
+                sys.stdout.flush()
+        self.writer.close()
+
+    def stop(self):
+        self._stop.set()
+        self._reader.join()
+        self._writer.join()
+
+    def stats(self):
+        seconds = time.time() - self.started
+        return {
+            'seconds': seconds,
+            'bytes': self.writer.bytes_in,
+            'frames': self.frames,
+            'bytes_per_s': self.writer.bytes_in / seconds if seconds else None,
+            'max_backlog': self.max_backlog,
+            'segments': list(self.writer.segments),
+        }
+
+
+# -- reading -------------------------------------------------------------------
+
+class Segment:
+    """One segment file: its start time and block index."""
+
+    def __init__(self, path):
+        self.path = path
+        self.complete = False
+        with open(path, 'rb') as f:
+            magic, self.created = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+            if magic != FILE_MAGIC:
+                raise ValueError(f"{path}: not a capture segment")
+            self.blocks = self._read_index(f) if self._has_footer(f) else self._scan(f)
+        self.start = self.blocks[0][0] if self.blocks else self.created
+        self.end = self.blocks[-1][1] if self.blocks else self.created
+
+    def _has_footer(self, f):
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size < FILE_HEADER.size + FOOTER.size:
+            return False
+        f.seek(size - FOOTER.size)
+        self._last_index, magic = FOOTER.unpack(f.read(FOOTER.size))
+        self.complete = magic == FOOTER_MAGIC
+        return self.complete
+
+    def _read_index(self, f):
+        blocks = []
+        offset = self._last_index
+        while offset:
+            f.seek(offset)
+            _, count, offset = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+            data = f.read(count * INDEX_ENTRY.size)
+            blocks[:0] = list(INDEX_ENTRY.iter_unpack(data))
+        return blocks
+
+    def _scan(self, f):
+        # No footer (capture was killed): hop over block payloads
+        blocks = []
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        offset = FILE_HEADER.size
+        while offset + 1 <= size:
+            f.seek(offset)
+            kind = f.read(1)
+            if kind == b'I':
+                f.seek(offset)
+                header = f.read(INDEX_HEADER.size)
+                if len(header) < INDEX_HEADER.size:
+                    break
+                _, count, _ = INDEX_HEADER.unpack(header)
+                offset += INDEX_HEADER.size + count * INDEX_ENTRY.size
+                continue
+            f.seek(offset)
+            header = f.read(BLOCK_HEADER.size)
+            if kind != b'F' or len(header) < BLOCK_HEADER.size:
+                break
+            _, _, payload_len, _, _, t_first, t_last, mask = BLOCK_HEADER.unpack(header)
+            end = offset + BLOCK_HEADER.size + payload_len
+            if end > size:
+                break  # torn last block
+            blocks.append((t_first, t_last, offset, mask))
+            offset = end
+        return blocks
+
+    def frames(self, start=None, end=None, mask=0):
+        """Yield (timestamp, bytes) for frames in [start, end] from blocks matching mask."""
+        with open(self.path, 'rb') as f:
+            for t_first, t_last, offset, block_mask in self.blocks:
+                if (start is not None and t_last < start) or (end is not None and t_first > end):
+                    continue
+                if mask and not block_mask & mask:
+                    continue
+                f.seek(offset)
+                _, flags, payload_len, _, _, _, _, _ = BLOCK_HEADER.unpack(f.read(BLOCK_HEADER.size))
+                payload = f.read(payload_len)
+                if flags & FLAG_ZLIB:
+                    payload = zlib.decompress(payload)
+                view = memoryview(payload)
+                pos = 0
+                while pos < len(view):
+                    timestamp, length = FRAME_HEADER.unpack_from(view, pos)
+                    pos += FRAME_HEADER.size
+                    if (start is None or timestamp >= start) and (end is None or timestamp <= end):
+                        yield timestamp, bytes(view[pos:pos + length])
+                    pos += length
+
+
+class LogReader:
+    """Time-ordered view over a capture directory (or a list of segment files)."""
+
+    def __init__(self, paths):
+        if isinstance(paths, str):
+            paths = sorted(glob.glob(os.path.join(paths, '*.fovlog'))) if os.path.isdir(paths) else [paths]
+        self.segments = sorted((Segment(p) for p in paths), key=lambda s: s.start)
+
+    def frames(self, start=None, end=None, mask=0):
+        for segment in self.segments:
+            if (start is not None and segment.end < start) or (end is not None and segment.start > end):
+                continue
+            yield from segment.frames(start, end, mask)
+
+    def lines(self, start=None, end=None, mask=0):
+        """Yield (timestamp, line) with the timestamp of the frame that completed the line."""
+        framer = LineFramer()
+        for timestamp, data in self.frames(start, end, mask):
+            framer.feed(data)
+            for raw in framer.lines():
+                yield timestamp, str(raw, 'utf-8', 'replace')
+
+    def grep(self, pattern, start=None, end=None, regex=False):
+        """
+        Yield (timestamp, line) for lines containing pattern (or matching it as a regex).
+
+        Only blocks whose URC mask allows a match are read when pattern
+        names a known URC.
+        """
+        mask = 0 if regex else mask_for(pattern)
+        match = re.compile(pattern).search if regex else (lambda line: pattern in line)
+        for timestamp, line in self.lines(start, end, mask):
+            if match(line):
+                yield timestamp, line
+
+
+# -- CLI -------------------------------------------------------------------------
+
+def _parse_time(text):
+    if text is None:
+        return None
+    return datetime.datetime.fromisoformat(text).timestamp()
+
+
+def _fmt_time(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp).isoformat(sep=' ', timespec='milliseconds')
+
+
+def capture(args):
+    try:
+        ser = serial.Serial(args.port, args.baud, timeout=0.05)
+    except serial.SerialException as e:
+        print(f"ERROR: Could not open serial port: {e}")
+        sys.exit(1)
+    writer = LogWriter(args.dir, prefix=os.path.basename(args.port), compress=args.compress,
+                       rotate_bytes=int(args.rotate_mb * 1024 * 1024),
+                       rotate_seconds=args.rotate_hours * 3600)
+    cap = Capture(ser, writer, echo=args.echo)
+    print(f"Capturing {args.port} at {args.baud} baud into {args.dir}/ (Ctrl-C to stop)", file=sys.stderr)
+    cap.start()
+    try:
+        while True:
+            time.sleep(args.duration or 1)
+            if args.duration:
+                break
+    except KeyboardInterrupt:
+        pass
+    cap.stop()
+    ser.close()
+    stats = cap.stats()
+    ratio = f", {writer.bytes_out / stats['bytes']:.0%} on disk" if stats['bytes'] else ''
+    print(f"\n✓ {stats['bytes']:,} bytes in {stats['frames']:,} frames over {stats['seconds']:.0f}s "
+          f"({stats['bytes_per_s'] / 1024:.1f} KB/s{ratio}), max writer backlog {stats['max_backlog']} frames",
+          file=sys.stderr)
+    for path in stats['segments']:
+        print(f"  {path}", file=sys.stderr)
+
+
+def info(args):
+    reader = LogReader(args.path)
+    for s in reader.segments:
+        state = 'complete' if s.complete else 'no footer (scanned)'
+        print(f"{s.path}: {len(s.blocks)} blocks, {_fmt_time(s.start)} - {_fmt_time(s.end)}, "
+              f"{os.path.getsize(s.path):,} bytes, {state}")
+
+
+def read(args):
+    reader = LogReader(args.path)
+    start, end = _parse_time(args.since), _parse_time(args.until)
+    if args.raw:
+        for _, data in reader.frames(start, end):
+            sys.stdout.buffer.write(data)
+        return
+    for timestamp, line in reader.lines(start, end):
+        print(f"{_fmt_time(timestamp)}  {line}")
+
+
+def grep(args):
+    reader = LogReader(args.path)
+    hits = 0
+    for timestamp, line in reader.grep(args.pattern, _parse_time(args.since), _parse_time(args.until),
+                                       regex=args.regex):
+        print(f"{_fmt_time(timestamp)}  {line}")
+        hits += 1
+    if not hits:
+        sys.exit(1)
+
+
+def selftest(args):
+    """Write a capture whose URCs arrive split across reads and check the index finds them."""
+    reads = [b'AT+MQTTPUB=0,"t","x",0,0\r\nOK\r\n+MQTTDISCON', b'NECTED:0\r\n', b'+',
+             b'MQTTCONNECTED:0,1,"test.mosquitto.org","1883","",1\r\nWIFI DIS', b'CONNECT\r\n']
+    failures = 0
+    for compress in (False, True):
+        with tempfile.TemporaryDirectory() as directory:
+            writer = LogWriter(directory, compress=compress)
+            for i, data in enumerate(reads):
+                writer.add(1000.0 + i * 0.01, data)
+            writer.close()
+            reader = LogReader(directory)
+            lines = [line for _, line in reader.lines()]
+            for urc in ('+MQTTDISCONNECTED', '+MQTTCONNECTED', 'WIFI DISCONNECT'):
+                mask = mask_for(urc)
+                indexed = all(block[3] & mask for s in reader.segments for block in s.blocks)
+                expected = sum(urc in line for line in lines)
+                found = len(list(reader.grep(urc)))
+                ok = indexed and found == expected == 1
+                failures += not ok
+                print(f"{'✅' if ok else '❌'} {urc:<18} {'zlib' if compress else 'raw ':<4}  "
+                      f"mask {'set' if indexed else 'missing'}, grep {found}/{expected}")
+    if failures:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Capture modem output to indexed log files')
+    sub = parser.add_subparsers(dest='action', required=True)
+
+    p = sub.add_parser('capture', help='Record a serial port')
+    p.add_argument('--port', '-p', default=DEFAULT_PORT)
+    p.add_argument('--baud', '-b', type=int, default=DEFAULT_BAUD)
+    p.add_argument('--dir', default=DEFAULT_DIR)
+    p.add_argument('--compress', action='store_true', help='zlib-compress blocks')
+    p.add_argument('--rotate-mb', type=float, default=ROTATE_BYTES / 1024 / 1024)
+    p.add_argument('--rotate-hours', type=float, default=ROTATE_SECONDS / 3600)
+    p.add_argument('--duration', type=float, help='Stop after this many seconds')
+    p.add_argument('--echo', action='store_true', help='Also print the traffic')
+    p.set_defaults(func=capture)
+
+    for name, func, help_text in (('info', info, 'List segments'),
+                                  ('read', read, 'Print lines in a time range'),
+                                  ('grep', grep, 'Find lines (URC prefixes use the block index)')):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument('path', help='Capture directory or segment file')
+        if name == 'grep':
+            p.add_argument('pattern')
+            p.add_argument('--regex', action='store_true')
+        if name != 'info':
+            p.add_argument('--since', help='ISO time, e.g. 2025-06-01T10:00')
+            p.add_argument('--until', help='ISO time')
+        if name == 'read':
+            p.add_argument('--raw', action='store_true', help='Write the raw bytes to stdout')
+        p.set_defaults(func=func)
+
+    p = sub.add_parser('selftest', help='Check that URCs split across reads are indexed')
+    p.set_defaults(func=selftest)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Factory station runner: test every attached ESP32-C5 in parallel.
+
+Finds the ESP-AT ports of the attached ESP32-C5 boards with port_discovery
+(skipping their flash/debug ports), or uses the --port list, runs the
+chosen test plan on each one in a thread pool and writes a single
+aggregated report with per-board and per-command timings.
+
+Plans:
+    meminfo    AT + AT+FWMEMINFO, PSRAM check from test_meminfo.py
+    mqtt-probe AT+GMR + AT+MQTT*=? capability probe from at_aws_iot.py
+    wifi-mqtt  WiFi join + MQTT connect/sub/pub to a broker
+    Any plan file or plans/ name understood by plan_runner.py
+
+Usage:
+    python3 station_runner.py meminfo
+    python3 station_runner.py plans/stable_wifi_mqtt.toml
+    python3 station_runner.py wifi-mqtt --port /dev/ttyUSB0 --port /dev/ttyUSB2 \\
+        --json report.json --junit report.xml
+
+Requirements:
+    pip install pyserial
+"""
+
+import argparse
+import json
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+import serial
+
+from at_aws_iot import MQTT_TESTS
+from at_transport import ATTransport, DEFAULT_BAUD
+from bringup import WIFI_PASSWORD, WIFI_SSID
+from port_discovery import find_at_ports
+from test_meminfo import MIN_PSRAM_BYTES, parse_meminfo_response
+
+MQTT_BROKER = 'test.mosquitto.org'
+MQTT_PORT = 1883
+
+
+def discover_ports(baud=DEFAULT_BAUD):
+    """Return device paths of the attached boards' ESP-AT ports."""
+    return find_at_ports(baud=baud)
+
+
+class CheckFailed(Exception):
+    """A plan step did not produce the expected result."""
+
+
+class BoardRun:
+    """Result of running one plan on one board."""
+
+    def __init__(self, port):
+        self.port = port
+        self.steps = []
+        self.info = {}
+        self.error = None
+        self.duration = None
+
+    @property
+    def passed(self):
+        return self.error is None
+
+    def step(self, at, cmd, timeout=2, until=None, expect_ok=True):
+        """Send cmd, record its timing and optionally require OK."""
+        response = at.send(cmd, timeout=timeout, until=until)
+        self.steps.append({
+            'command': cmd,
+            'result': response.result,
+            'elapsed': round(response.elapsed, 4),
+        })
+        if expect_ok and not response.ok:
+            raise CheckFailed(f"{cmd}: {response.result or 'timeout'}")
+        return response
+
+    def to_dict(self):
+        return {
+            'port': self.port,
+            'passed': self.passed,
+            'error': self.error,
+            'duration': round(self.duration, 3) if self.duration is not None else None,
+            'info': self.info,
+            'steps': self.steps,
+        }
+
+
+def plan_meminfo(at, run):
+    run.step(at, 'AT')
+    response = run.step(at, 'AT+FWMEMINFO')
+    if '+FWMEMINFO:PSRAM' not in response:
+        raise CheckFailed('AT+FWMEMINFO: unexpected response format')
+    mem = parse_meminfo_response(response.text)
+    run.info.update(mem)
+    if mem['psram_largest'] < MIN_PSRAM_BYTES:
+        raise CheckFailed(f"psram_largest {mem['psram_largest']} < {MIN_PSRAM_BYTES}")
+
+
+def plan_mqtt_probe(at, run):
+    run.step(at, 'AT')
+    gmr = run.step(at, 'AT+GMR')
+    run.info['version'] = [line for line in gmr.lines if ':' in line]
+    missing = [cmd for cmd in MQTT_TESTS if not run.step(at, f"{cmd}=?", expect_ok=False).ok]
+    run.info['mqtt_missing'] = missing
+    if missing:
+        raise CheckFailed(f"MQTT commands not supported: {', '.join(missing)}")
+
+
+def plan_wifi_mqtt(at, run):
+    client_id = 'fov_' + run.port.rsplit('/', 1)[-1]
+    topic = f'fov/station/{client_id}'
+    run.step(at, 'AT')
+    run.step(at, 'AT+CWMODE=1')
+    run.step(at, f'AT+CWJAP="{WIFI_SSID}","{WIFI_PASSWORD}"', timeout=15)
+    run.step(at, f'AT+MQTTUSERCFG=0,1,"{client_id}","","",0,0,""')
+    run.step(at, f'AT+MQTTCONN=0,"{MQTT_BROKER}",{MQTT_PORT},0', timeout=10)
+    run.step(at, f'AT+MQTTSUB=0,"{topic}",0', timeout=3)
+    run.step(at, f'AT+MQTTPUB=0,"{topic}","station_check",0,0', timeout=3)
+    if at.wait_for('+MQTTSUBRECV', timeout=5) is None:
+        raise CheckFailed('published message was not received back')
+    run.step(at, 'AT+MQTTCLEAN=0', expect_ok=False)
+
+
+PLANS = {
+    'meminfo': plan_meminfo,
+    'mqtt-probe': plan_mqtt_probe,
+    'wifi-mqtt': plan_wifi_mqtt,
+}
+
+
+def run_board(plan, port, baud):
+    run = BoardRun(port)
+    start = time.monotonic()
+    try:
+        with ATTransport.open(port, baud) as at:
+            plan(at, run)
+    except CheckFailed as e:
+        run.error = str(e)
+    except serial.SerialException as e:
+        run.error = f"serial: {e}"
+    except Exception as e:
+        run.error = f"{type(e).__name__}: {e}"
+    run.duration = time.monotonic() - start
+    return run
+
+
+def resolve_plan(name):
+    """A built-in plan function, or a plan_runner plan file compiled into one."""
+    if name in PLANS:
+        return PLANS[name]
+    from plan_runner import load_plan
+    return load_plan(name).station_plan()
+
+
+def run_station(plan_name, ports, baud=DEFAULT_BAUD, workers=None, plan=None):
+    """
+    Run a plan on all ports in parallel.
+
+    Args:
+        plan: Plan function to use instead of looking up plan_name
+
+    Returns:
+        Report dict (see write_junit for the XML form)
+    """
+    plan = plan or resolve_plan(plan_name)
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers or max(len(ports), 1)) as pool:
+        runs = list(pool.map(lambda port: run_board(plan, port, baud), ports))
+    wall = time.monotonic() - start
+    passed = sum(run.passed for run in runs)
+    return {
+        'plan': plan_name,
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'boards': len(runs),
+        'passed': passed,
+        'failed': len(runs) - passed,
+        'wall_time': round(wall, 3),
+        'boards_per_hour': round(len(runs) * 3600 / wall, 1) if wall > 0 else None,
+        'results': [run.to_dict() for run in runs],
+    }
+
+
+def write_junit(report, path):
+    suite = ET.Element('testsuite', {
+        'name': f"station.{report['plan']}",
+        'tests': str(report['boards']),
+        'failures': str(report['failed']),
+        'time': str(report['wall_time']),
+        'timestamp': report['started'],
+    })
+    for result in report['results']:
+        case = ET.SubElement(suite, 'testcase', {
+            'classname': report['plan'],
+            'name': result['port'],
+            'time': str(result['duration']),
+        })
+        if not result['passed']:
+            ET.SubElement(case, 'failure', {'message': result['error']})
+        steps = '\n'.join(f"{s['elapsed']:8.3f}s  {s['result']}  {s['command']}" for s in result['steps'])
+        ET.SubElement(case, 'system-out').text = steps
+    ET.ElementTree(suite).write(path, encoding='utf-8', xml_declaration=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a test plan on every attached ESP32-C5')
+    parser.add_argument('plan', help=f"{', '.join(sorted(PLANS))}, or a plan_runner plan")
+    parser.add_argument('--port', '-p', action='append',
+                        help='Serial port, repeatable (default: auto-discover)')
+    parser.add_argument('--baud', '-b', type=int, default=DEFAULT_BAUD)
+    parser.add_argument('--workers', type=int, help='Thread pool size (default: one per board)')
+    parser.add_argument('--json', help='Write JSON report to this file')
+    parser.add_argument('--junit', help='Write JUnit XML report to this file')
+    args = parser.parse_args()
+
+    ports = args.port or discover_ports(args.baud)
+    if not ports:
+        print("❌ No ESP32-C5 serial ports found (try --port)")
+        sys.exit(1)
+
+    try:
+        plan = resolve_plan(args.plan)
+    except Exception as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    print(f"Running '{args.plan}' on {len(ports)} board(s): {', '.join(ports)}")
+    report = run_station(args.plan, ports, args.baud, args.workers, plan=plan)
+
+    for result in report['results']:
+        mark = '✅' if result['passed'] else '❌'
+        detail = '' if result['passed'] else f"  {result['error']}"
+        print(f"{mark} {result['port']}  {result['duration']:.2f}s{detail}")
+    print(f"\n{report['passed']}/{report['boards']} passed in {report['wall_time']:.2f}s "
+          f"({report['boards_per_hour']} boards/hour)")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.junit:
+        write_junit(report, args.junit)
+    sys.exit(0 if report['failed'] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,23 @@
-import serial
-import time
+from at_engine import ATEngine
 
-ser = serial.Serial('/dev/ttyUSB0', 115200, timeout=2)
-time.sleep(2)
+engine = ATEngine.open('/dev/ttyUSB0', 115200)
 
 commands = [
     'AT',
     'AT+GMR',
     'AT+CWMODE=1',
-    'AT+CWJAP="tim","password"',
-    # Wait for connection...
+    'AT+CWJAP="tim","password"',  # CIPSTART is only sent once the join returns OK
     'AT+CIPSTART="SSL","a3lkzcadhi1yzr-ats.iot.eu-west-1.amazonaws.com",8443',  # Try port 8443
     'AT+CIPSSLCCONF=?',  # Test if SSL config works
 ]
 
-for cmd in commands:
-    ser.write((cmd + '\r\n').encode())
-    time.sleep(3)
+# Queue everything up front; each command goes out as soon as the previous
+# one returns. 15 s is a ceiling for the join/TLS handshake, not a delay.
+futures = [engine.submit(cmd, timeout=15) for cmd in commands]
+for cmd, future in zip(commands, futures):
+    response = future.result()
     print(f">>> {cmd}")
-    print(ser.read(ser.in_waiting).decode())
+    print(response.text)
     print("---")
+
+engine.close()
@@ -1,23 +1,21 @@
-import serial
-import time
+from at_transport import ATTransport
+from boot_ready import wait_until_ready
 
-def send_at_command(ser, command, wait_time=1):
+def send_at_command(at, command, timeout=1):
     print(f"\nSending: {command}")
-    ser.write((command + '\r\n').encode())
-    time.sleep(wait_time)
-    response = ser.read_all().decode('utf-8', errors='ignore')
+    response = at.send(command, timeout=timeout).text
     print(f"Response: {response}")
     return response
 
-ser = serial.Serial('/dev/ttyUSB0', 115200, timeout=1)
-time.sleep(2)
+at = ATTransport.open('/dev/ttyUSB0', 115200)
+wait_until_ready(at, method='none')
 
 # Test basic commands
-send_at_command(ser, "AT")  # Basic test
-send_at_command(ser, "AT+GMR")  # Get version
-send_at_command(ser, "AT+CWMODE?")  # Get WiFi mode
-send_at_command(ser, "AT+CMD?", 2)  # List available commands
-send_at_command(ser, "AT+USERRAM?")
-send_at_command(ser, "AT+FWMEMINFO?") 
+send_at_command(at, "AT")  # Basic test
+send_at_command(at, "AT+GMR")  # Get version
+send_at_command(at, "AT+CWMODE?")  # Get WiFi mode
+send_at_command(at, "AT+CMD?", 5)  # List available commands
+send_at_command(at, "AT+USERRAM?")
+send_at_command(at, "AT+FWMEMINFO?") 
 
-ser.close()
+at.close()
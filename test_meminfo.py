@@ -13,10 +13,13 @@ Requirements:
 """
 
 import serial
-import time
 import argparse
 import sys
 
+from at_parsers import FWMemInfo, parse_lines
+from at_transport import ATTransport
+from boot_ready import wait_until_ready
+
 # Default configuration
 DEFAULT_PORT = '/dev/ttyUSB0'  # AT command port (usually USB1 if USB0 is flash)
 DEFAULT_BAUD = 115200
@@ -26,42 +29,20 @@ TIMEOUT = 2  # seconds
 MIN_PSRAM_BYTES = 1572864
 
 
-def send_at_command(ser, cmd, timeout=TIMEOUT):
+def send_at_command(at, cmd, timeout=TIMEOUT):
     """
     Send AT command and return response.
     
     Args:
-        ser: Serial port object
+        at: ATTransport wrapping the serial port
         cmd: AT command string (without \r\n)
-        timeout: Response timeout in seconds
+        timeout: Response timeout in seconds (returns early on OK/ERROR)
         
     Returns:
         Response string
     """
-    # Clear any pending data
-    ser.reset_input_buffer()
-    
-    # Send command
-    cmd_bytes = f"{cmd}\r\n".encode()
-    ser.write(cmd_bytes)
     print(f">>> {cmd}")
-    
-    # Small delay for command processing
-    time.sleep(0.1)
-    
-    # Read response
-    response = b''
-    start = time.time()
-    while time.time() - start < timeout:
-        if ser.in_waiting:
-            chunk = ser.read(ser.in_waiting)
-            response += chunk
-            # Check for response terminators
-            if b'OK\r\n' in response or b'ERROR\r\n' in response:
-                break
-        time.sleep(0.05)
-    
-    response_str = response.decode('utf-8', errors='replace')
+    response_str = at.send(cmd, timeout=timeout).text
     
     # Print response with indentation
     for line in response_str.strip().split('\n'):
@@ -87,25 +68,12 @@ def parse_meminfo_response(response):
         'internal_largest': 0
     }
     
-    lines = response.strip().split('\n')
-    for line in lines:
-        line = line.strip()
-        if line.startswith('+FWMEMINFO:PSRAM,'):
-            parts = line.split(',')
-            if len(parts) >= 3:
-                try:
-                    result['psram_free'] = int(parts[1])
-                    result['psram_largest'] = int(parts[2])
-                except ValueError:
-                    pass
-        elif line.startswith('+FWMEMINFO:INTERNAL,'):
-            parts = line.split(',')
-            if len(parts) >= 3:
-                try:
-                    result['internal_free'] = int(parts[1])
-                    result['internal_largest'] = int(parts[2])
-                except ValueError:
-                    pass
+    lines = (line.strip() for line in response.strip().split('\n'))
+    for record in parse_lines(lines):
+        if isinstance(record, FWMemInfo):
+            region = record.region.lower()
+            result[f'{region}_free'] = record.free
+            result[f'{region}_largest'] = record.largest
     
     return result
 
@@ -127,7 +95,7 @@ def main():
     parser.add_argument(
         '--port', '-p',
         default=DEFAULT_PORT,
-        help=f'Serial port (default: {DEFAULT_PORT})'
+        help=f"Serial port, or 'auto' (default: {DEFAULT_PORT})"
     )
     parser.add_argument(
         '--baud', '-b',
@@ -143,26 +111,26 @@ def main():
     print(f"\nConnecting to {args.port} at {args.baud} baud...")
     
     try:
-        ser = serial.Serial(args.port, args.baud, timeout=1)
+        at = ATTransport.open(args.port, args.baud)
     except serial.SerialException as e:
         print(f"\nERROR: Could not open serial port: {e}")
         print("\nTroubleshooting:")
         print("  1. Check that the device is connected")
-        print("  2. Check the port name (try ls /dev/ttyUSB*)")
+        print("  2. Check the port name (try --port auto, or python3 port_discovery.py)")
         print("  3. Check permissions (try: sudo chmod 666 /dev/ttyUSB1)")
         print("  4. Make sure no other program is using the port")
         sys.exit(1)
     
-    with ser:
-        # Wait for connection to stabilize
-        time.sleep(0.5)
+    with at:
+        # Returns on the first AT answer instead of a fixed settle delay
+        wait_until_ready(at, method='none')
         
         # Test 1: Basic AT command
         print("\n" + "-" * 40)
         print("Test 1: Basic AT Command")
         print("-" * 40)
         
-        response = send_at_command(ser, "AT")
+        response = send_at_command(at, "AT")
         
         if 'OK' not in response:
             print("\n❌ FAILED: Basic AT command did not respond with OK")
@@ -180,7 +148,7 @@ def main():
         print("Test 2: AT+FWMEMINFO Command")
         print("-" * 40)
         
-        response = send_at_command(ser, "AT+FWMEMINFO")
+        response = send_at_command(at, "AT+FWMEMINFO")
         
         if 'ERROR' in response and '+FWMEMINFO' not in response:
             print("\n❌ FAILED: AT+FWMEMINFO? command not recognized")
@@ -1,14 +1,13 @@
-import serial
-import time
+from at_transport import ATTransport
+from boot_ready import wait_until_ready
+from capabilities import discover
 
-def send_command(ser, cmd):
+def send_command(at, cmd):
     """Send AT command and print response"""
     print(f"\n{'='*50}")
     print(f"Sending: {cmd}")
     print('='*50)
-    ser.write((cmd + '\r\n').encode())
-    time.sleep(1)
-    response = ser.read_all().decode('utf-8', errors='ignore')
+    response = at.send(cmd, timeout=1).text
     print(f"Response:\n{response}")
     
     # Check result
@@ -24,32 +23,30 @@ def send_command(ser, cmd):
 
 # Connect to C5
 print("Connecting to C5...")
-ser = serial.Serial('/dev/ttyUSB0', 115200, timeout=1)
-time.sleep(2)
+at = ATTransport.open('/dev/ttyUSB0', 115200)
+wait_until_ready(at, method='none')
 
 # Test basic command
-send_command(ser, "AT")
+send_command(at, "AT")
 
-# Test firmware version
-send_command(ser, "AT+GMR")
+# Firmware version and command table (AT+CMD? is only sent for new firmware)
+caps = discover(at)
+print(f"\nFirmware: {caps.firmware} ({'cached' if caps.cached else 'probed'})")
 
 print("\n" + "="*50)
 print("CRITICAL TEST: MQTT Commands")
 print("="*50)
 
 # THE KEY TEST - If this works, MQTT is enabled!
-mqtt_works = send_command(ser, "AT+MQTTUSERCFG=?")
-
-# Test more MQTT commands
-send_command(ser, "AT+MQTTCONN=?")
-send_command(ser, "AT+MQTTSUB=?")
-send_command(ser, "AT+MQTTPUB=?")
+mqtt_works = caps.has('mqtt')
+for cmd in ("AT+MQTTUSERCFG", "AT+MQTTCONN", "AT+MQTTSUB", "AT+MQTTPUB"):
+    print(f"{'✅' if caps.supports(cmd) else '❌'} {cmd}")
 
 # Test SSL
 print("\n" + "="*50)
 print("SSL/TLS Support")
 print("="*50)
-send_command(ser, "AT+CIPSSLCCONF=?")
+print(f"{'✅' if caps.has('ssl') else '❌'} AT+CIPSSLCCONF")
 
 # Summary
 print("\n" + "="*50)
@@ -63,8 +60,8 @@ if mqtt_works:
     print("2. Upload AWS IoT firmware to S3")
     print("3. Test AWS IoT connection")
 else:
-    print("❌ MQTT commands returned ERROR")
+    print("❌ MQTT commands missing from AT+CMD?")
     print("Need to rebuild firmware with MQTT enabled")
 
-ser.close()
+at.close()
 print("\nDone!")
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Negotiate a faster AT UART rate with automatic fallback.
+
+Every script opens the port at 115200 baud (~11 KB/s), which is far too slow
+for pushing a 1.5 MB firmware image into PSRAM. This tool asks the modem to
+switch with AT+UART_CUR (not persisted, a reset restores the default),
+optionally turns on RTS/CTS, verifies the link with AT round-trips and falls
+back to the previous rate if the new one is not stable. Effective throughput
+is measured at every rate tried so the fastest stable rate can be picked per
+board.
+
+Usage:
+    python3 uart_speed.py [--port /dev/ttyUSB0] [--rates 3000000,2000000,921600] [--rtscts]
+
+Requirements:
+    pip install pyserial
+"""
+
+import argparse
+import sys
+import time
+
+import serial
+
+from at_transport import ATTransport, DEFAULT_BAUD, DEFAULT_PORT
+
+# Candidate rates, fastest first (CP210x/CH343 and the C5 UART all handle these)
+DEFAULT_RATES = (3000000, 2000000, 1500000, 921600, 460800, 230400)
+SWITCH_SETTLE = 0.05  # seconds for the modem to reprogram its UART after OK
+VERIFY_ROUNDS = 3
+THROUGHPUT_CMD = 'AT+CMD?'  # long, side-effect free response
+
+
+class LinkLost(Exception):
+    """Neither the new nor the previous rate answers; reset the board."""
+
+
+def uart_cur_command(baud, rtscts):
+    # AT+UART_CUR=<baudrate>,<databits>,<stopbits>,<parity>,<flow control>
+    # flow control 3 = RTS and CTS
+    return f'AT+UART_CUR={baud},8,1,0,{3 if rtscts else 0}'
+
+
+def verify_link(at, rounds=VERIFY_ROUNDS, timeout=0.5):
+    """Return True if `rounds` consecutive AT round-trips succeed."""
+    return all(at.send('AT', timeout=timeout).ok for _ in range(rounds))
+
+
+def measure_throughput(at, cmd=THROUGHPUT_CMD, repeats=3, timeout=5):
+    """
+    Measure effective receive throughput in bytes/second.
+
+    Returns:
+        bytes/second, or None if the command failed
+    """
+    total_bytes = 0
+    total_time = 0.0
+    for _ in range(repeats):
+        response = at.send(cmd, timeout=timeout)
+        if not response.ok:
+            return None
+        total_bytes += sum(len(line) + 2 for line in response.lines)
+        total_time += response.elapsed
+    return total_bytes / total_time if total_time else None
+
+
+def switch_baud(at, baud, rtscts=False):
+    """
+    Move modem and host to baud, falling back to the current rate on failure.
+
+    Returns:
+        True if the link is verified at the new rate, False if we fell back
+
+    Raises:
+        LinkLost if the fallback rate does not answer either, or the host
+        refuses the rate only after the modem has switched
+    """
+    prev_baud, prev_rtscts = at.ser.baudrate, at.ser.rtscts
+    # Check the host adapter takes the rate before the modem is moved to it;
+    # afterwards a refusal would leave the two ends at different rates
+    try:
+        at.set_baud(baud, rtscts)
+    except (serial.SerialException, ValueError, OSError):
+        at.set_baud(prev_baud, prev_rtscts)
+        return False
+    at.set_baud(prev_baud, prev_rtscts)
+    if not at.send(uart_cur_command(baud, rtscts), timeout=1).ok:
+        return False
+    time.sleep(SWITCH_SETTLE)
+    try:
+        at.set_baud(baud, rtscts)
+    except (serial.SerialException, ValueError, OSError) as e:
+        # The modem is at baud already, so a revert command could not reach it
+        raise LinkLost(f"host adapter refused {baud} baud after the modem switched: {e}")
+    if verify_link(at):
+        return True
+
+    # Ask the modem to go back; the short command often survives a marginal link
+    at.send(uart_cur_command(prev_baud, prev_rtscts), timeout=1)
+    time.sleep(SWITCH_SETTLE)
+    at.set_baud(prev_baud, prev_rtscts)
+    if not verify_link(at):
+        raise LinkLost(f"no response at {baud} or fallback {prev_baud} baud")
+    return False
+
+
+def negotiate(at, rates=DEFAULT_RATES, rtscts=False, measure=True):
+    """
+    Try rates fastest first and stay on the first stable one.
+
+    Returns:
+        (chosen_baud, results) where results is a list of dicts with
+        baud, stable and throughput (bytes/second) for every rate tried,
+        starting with the current rate as the baseline
+    """
+    base = at.ser.baudrate
+    results = [{
+        'baud': base,
+        'rtscts': at.ser.rtscts,
+        'stable': True,
+        'throughput': measure_throughput(at) if measure else None,
+    }]
+    for baud in rates:
+        if baud <= base:
+            break
+        stable = switch_baud(at, baud, rtscts)
+        results.append({
+            'baud': baud,
+            'rtscts': rtscts,
+            'stable': stable,
+            'throughput': measure_throughput(at) if stable and measure else None,
+        })
+        if stable:
+            return baud, results
+    return base, results
+
+
+def survey(at, rates, rtscts=False):
+    """Measure every rate in turn, returning to the current rate after each."""
+    base, base_rtscts = at.ser.baudrate, at.ser.rtscts
+    results = [{'baud': base, 'rtscts': base_rtscts, 'stable': True,
+                'throughput': measure_throughput(at)}]
+    for baud in rates:
+        stable = switch_baud(at, baud, rtscts)
+        results.append({
+            'baud': baud,
+            'rtscts': rtscts,
+            'stable': stable,
+            'throughput': measure_throughput(at) if stable else None,
+        })
+        if stable:
+            switch_baud(at, base, base_rtscts)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Negotiate a faster AT UART rate')
+    parser.add_argument('--port', '-p', default=DEFAULT_PORT)
+    parser.add_argument('--baud', '-b', type=int, default=DEFAULT_BAUD, help='Current rate')
+    parser.add_argument('--rates', default=','.join(map(str, DEFAULT_RATES)),
+                        help='Comma separated candidate rates, fastest first')
+    parser.add_argument('--rtscts', action='store_true', help='Enable RTS/CTS flow control')
+    parser.add_argument('--all', action='store_true',
+                        help='Measure every stable rate instead of stopping at the first')
+    args = parser.parse_args()
+    rates = [int(r) for r in args.rates.split(',')]
+
+    try:
+        at = ATTransport.open(args.port, args.baud)
+    except serial.SerialException as e:
+        print(f"ERROR: Could not open serial port: {e}")
+        sys.exit(1)
+
+    with at:
+        if not verify_link(at):
+            print(f"❌ No AT response at {args.baud} baud")
+            sys.exit(1)
+        try:
+            if args.all:
+                results = survey(at, rates, args.rtscts)
+                best = max((r for r in results if r['stable'] and r['throughput']),
+                           key=lambda r: r['throughput'], default=None)
+                if best is None:
+                    print(f"⚠️ No rate measured a throughput ({THROUGHPUT_CMD} failed), "
+                          f"staying at {args.baud} baud")
+                    chosen = args.baud
+                else:
+                    chosen = best['baud']
+                if chosen != args.baud:
+                    switch_baud(at, chosen, best['rtscts'])
+            else:
+                chosen, results = negotiate(at, rates, args.rtscts)
+        except LinkLost as e:
+            print(f"❌ {e}")
+            print("   AT+UART_CUR is not persisted: reset the board to restore the default rate")
+            sys.exit(1)
+
+        print(f"\n{'Baud':>9}  {'RTS/CTS':>7}  {'Stable':>6}  {'Throughput':>12}")
+        for r in results:
+            tput = f"{r['throughput'] / 1024:9.1f} KB/s" if r['throughput'] else '           -'
+            print(f"{r['baud']:>9}  {'yes' if r['rtscts'] else 'no':>7}  "
+                  f"{'yes' if r['stable'] else 'NO':>6}  {tput}")
+        print(f"\n✓ Using {chosen} baud (until the next reset)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,27 @@
+import sys
+
 import serial
-import time
 
-print("Connecting to C5...")
-ser = serial.Serial('/dev/ttyUSB0', 115200, timeout=1)
+from at_transport import ATTransport
+from boot_ready import print_result, wait_until_ready
 
-print("\n⚠️ PRESS THE RESET BUTTON ON THE C5 NOW!")
-print("Waiting 3 seconds...")
-time.sleep(3)
+print("Connecting to C5...")
+try:
+    at = ATTransport.open('/dev/ttyUSB0', 115200)
+except serial.SerialException as e:
+    print(f"ERROR: Could not open serial port: {e}")
+    sys.exit(1)
 
-print("\nSending AT command...")
-ser.write(b'AT\r\n')
-time.sleep(1)
-response = ser.read_all().decode('utf-8', errors='ignore')
-print(f"Response: '{response}'")
+with at:
+    # Resets through DTR/RTS; falls back to AT probes if the lines aren't wired
+    result = wait_until_ready(at, method='rts')
+    print_result(result)
 
-if response.strip():
-    print("✅ C5 is responding!")
-else:
-    print("❌ No response - C5 might be on wrong UART")
+    print("\nSending AT command...")
+    response = at.send('AT', timeout=1)
+    print(f"Response: '{response.text}'")
 
-ser.close()
+    if response.ok:
+        print("✅ C5 is responding!")
+    else:
+        print("❌ No response - C5 might be on wrong UART")